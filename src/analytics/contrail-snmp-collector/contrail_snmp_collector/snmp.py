@@ -1,12 +1,20 @@
-import struct, netsnmp, string
+import struct, netsnmp, string, time
 
 class SnmpTable(object):
+    # tables that seldom change are kept between scans of a device and
+    # read again only when SnmpSession finds its cache stale
+    cached = False
+
     def __init__(self, session):
         self._session = session
 
     def get_obj(self, o):
-        Vars = netsnmp.VarList(netsnmp.Varbind(o))
-        r = self._session.walk(Vars)
+        if self._session.max_repetitions and self._session.Version != 1:
+            Vars = self._session.bulkwalk(o)
+            r = tuple(x.val for x in Vars)
+        else:
+            Vars = netsnmp.VarList(netsnmp.Varbind(o))
+            r = self._session.walk(Vars)
         return {o: {'result': r, 'vars': Vars}}
 
     def get_table(self, table):
@@ -49,10 +57,19 @@ class SnmpTable(object):
     def default_value(self, varbind):
         return self.sane(varbind.val)
 
-    def snmp_get(self):
+    def snmp_get(self, cached=None):
+        if cached is not None:
+            self.restore(cached)
+            return
         snmpvars = self.get_table(self.table_names())
         self.translator(snmpvars)
 
+    def cache_obj(self):
+        return self.py_obj()
+
+    def restore(self, cached):
+        raise NotImplementedError, "Virtual funtion"
+
     def translator(self, snmpvars):
         for k in snmpvars:
             getattr(self, k + '_translator')(snmpvars[k])
@@ -75,6 +92,11 @@ class LldpLocSysNameTable(SnmpTable):
         return self.name
 
 class IpMib(SnmpTable):
+    cached = True
+
+    def restore(self, cached):
+        self.ips = cached
+
     def table_names(self):
         return 'ipAdEntIfIndex'
 
@@ -88,6 +110,8 @@ class IpMib(SnmpTable):
         return self.ips
 
 class LldpTable(SnmpTable):
+    cached = True
+
     def __init__(self, session):
         super(LldpTable, self).__init__(session)
         self.lldpLocalSystemData = {}
@@ -103,6 +127,11 @@ class LldpTable(SnmpTable):
     def table_names(self):
         return ['lldpLocalSystemData', 'lldpRemoteSystemsData']
 
+    def restore(self, cached):
+        self.lldpLocalSystemData = cached['lldpLocalSystemData']
+        self.lldpRemoteSystemsData = dict(enumerate(
+                cached['lldpRemoteSystemsData']))
+
     def _capmap(self, d):
         _maps = [
             'other(0)',
@@ -191,6 +220,22 @@ class LldpTable(SnmpTable):
                         ('lldpRemChassisId', ), self.capabilities)
 
 class IfMib(SnmpTable):
+    # only the status and counter columns are read on every scan, the
+    # others are cached
+    cached = True
+    counters = {
+        'ifTable': ['ifAdminStatus', 'ifOperStatus', 'ifLastChange',
+            'ifInOctets', 'ifInUcastPkts', 'ifInNUcastPkts', 'ifInDiscards',
+            'ifInErrors', 'ifInUnknownProtos', 'ifOutOctets',
+            'ifOutUcastPkts', 'ifOutNUcastPkts', 'ifOutDiscards',
+            'ifOutErrors', 'ifOutQLen'],
+        'ifXTable': ['ifInMulticastPkts', 'ifInBroadcastPkts',
+            'ifOutMulticastPkts', 'ifOutBroadcastPkts', 'ifHCInOctets',
+            'ifHCInUcastPkts', 'ifHCInMulticastPkts', 'ifHCInBroadcastPkts',
+            'ifHCOutOctets', 'ifHCOutUcastPkts', 'ifHCOutMulticastPkts',
+            'ifHCOutBroadcastPkts', 'ifCounterDiscontinuityTime'],
+    }
+
     def __init__(self, session):
         super(IfMib, self).__init__(session)
         self.ifTable = {}
@@ -203,6 +248,35 @@ class IfMib(SnmpTable):
     def table_names(self):
         return ['ifTable', 'ifXTable']
 
+    def snmp_get(self, cached=None):
+        if cached is None:
+            return super(IfMib, self).snmp_get()
+        self.restore(cached)
+        snmpvars = self.get_table(self.counters['ifTable'] +
+                                  self.counters['ifXTable'])
+        self.translator(snmpvars)
+
+    def translator(self, snmpvars):
+        for k in snmpvars:
+            table = k
+            for t, columns in self.counters.items():
+                if k in columns:
+                    table = t
+            getattr(self, table + '_translator')(snmpvars[k])
+
+    def cache_obj(self):
+        cached = {}
+        for table, columns in self.counters.items():
+            cached[table] = [[ifidx, dict((k, v) for k, v in ife.items()
+                    if k not in columns)]
+                for ifidx, ife in getattr(self, table).items()]
+        return cached
+
+    def restore(self, cached):
+        for table in self.counters:
+            setattr(self, table, dict((ifidx, dict(ife))
+                for ifidx, ife in cached[table]))
+
     def ifTable_translator(self, snmp_dict):
         for x in snmp_dict['vars']:
             ifidx = int(x.iid)
@@ -218,6 +292,9 @@ class IfMib(SnmpTable):
             self.ifXTable[ifidx][x.tag] = self.normalize(x)
 
 class ArpTable(SnmpTable):
+    # changes too often to be cached
+    cached = False
+
     def __init__(self, session):
         super(ArpTable, self).__init__(session)
         self.arpTable = []
@@ -246,8 +323,14 @@ class SnmpSession(netsnmp.Session):
     def TABLES(cls):
         return cls.table_list
 
-    def __init__(self, netdev):
+    def __init__(self, netdev, cache=None, max_repetitions=0,
+                 cache_interval=0):
         self.netdev = netdev
+        # tables kept from earlier scans of the device, see get_cache
+        self.cache = cache
+        self.max_repetitions = max_repetitions
+        self.cache_interval = cache_interval
+        self._new_cache = None
         device = netdev.snmp_cfg()
         tables = netdev.get_mibs()
         super(SnmpSession, self).__init__(**device)
@@ -258,12 +341,82 @@ class SnmpSession(netsnmp.Session):
         self.snmpTables = dict(map(lambda x:(x, eval(x + '(obj)',
                     globals(), {'obj': self})), self.tables))
 
+    def bulkwalk(self, o):
+        # walk o with GETBULK, max_repetitions objects per request. long
+        # names tell when the walk leaves o, the tags are shortened back
+        # to the names walk returns. the walk stops on an agent returning
+        # the object it was asked for instead of the next one
+        Vars = []
+        self.UseLongNames = 1
+        try:
+            tag, iid = o, None
+            while True:
+                bulk = netsnmp.VarList(netsnmp.Varbind(tag, iid))
+                if self.getbulk(0, self.max_repetitions, bulk) is None:
+                    break
+                for x in bulk:
+                    if (x.val is None or x.type in ('ENDOFMIBVIEW',
+                            'NOSUCHOBJECT', 'NOSUCHINSTANCE') or
+                            o not in x.tag.split('.') or
+                            (x.tag, x.iid) == (tag, iid)):
+                        return Vars
+                    tag, iid = x.tag, x.iid
+                    x.tag = x.tag.split('.')[-1]
+                    Vars.append(x)
+                if not len(bulk):
+                    break
+        finally:
+            self.UseLongNames = 0
+        return Vars
+
+    def cache_stamp(self):
+        Vars = netsnmp.VarList(netsnmp.Varbind('sysUpTime', '0'),
+                               netsnmp.Varbind('ifTableLastChange', '0'))
+        self.get(Vars)
+        stamp = []
+        for x in Vars:
+            try:
+                stamp.append(int(x.val))
+            except (TypeError, ValueError):
+                stamp.append(None)
+        return tuple(stamp)
+
+    def cached_tables(self):
+        # cached tables are read again after a restart of the device, a
+        # change of its interfaces or every cache_interval
+        if not self.cache_interval or not any(
+                t.cached for t in self.snmpTables.values()):
+            return {}
+        uptime, last_change = self.cache_stamp()
+        cache = self.cache
+        if (cache and time.time() < cache['time'] + self.cache_interval and
+                uptime is not None and uptime >= cache['sysUpTime'] and
+                last_change == cache['ifTableLastChange'] and
+                all(name in cache['tables'] for name, t in
+                    self.snmpTables.items() if t.cached)):
+            return cache['tables']
+        self._new_cache = {
+            'time': time.time(),
+            'sysUpTime': uptime,
+            'ifTableLastChange': last_change,
+            'tables': {},
+        }
+        return {}
+
     def scan_device(self, fun=None):
-        for t in self.snmpTables.values():
-            t.snmp_get()
+        cached = self.cached_tables()
+        for name, t in self.snmpTables.items():
+            t.snmp_get(cached.get(name) if t.cached else None)
+            if t.cached and self._new_cache is not None:
+                self._new_cache['tables'][name] = t.cache_obj()
             if callable(fun):
                 fun()
 
+    def get_cache(self):
+        # cache for the next scans of the device, None when the one of
+        # this scan is still good
+        return self._new_cache
+
     def in_tuples(self, o):
         return o[0].lower() + o[1:], self.snmpTables[o].py_obj()
 
@@ -22,6 +22,11 @@ contrail-snmp-scanner --log_level SYS_DEBUG
                       --syslog_facility LOG_USER
                       --disc_server_ip 127.0.0.1
                       --disc_server_port 5998
+                      --scan_frequency 600
+                      --scan_workers 16
+                      --scan_timeout 300
+                      --scan_max_repetitions 25
+                      --scan_cache_interval 3600
                       --conf_file /etc/contrail/contrail-snmp-scanner.conf
 
             conf file example:
@@ -73,6 +78,10 @@ Mibs = LldpTable, ArpTable
             'use_syslog'      : False,
             'syslog_facility' : Sandesh._DEFAULT_SYSLOG_FACILITY,
             'scan_frequency'  : 600,
+            'scan_workers'    : 16,
+            'scan_timeout'    : 300,
+            'scan_max_repetitions': 25,
+            'scan_cache_interval' : 3600,
             'http_server_port': 5920,
             'file'            : 'devices.ini',
         }
@@ -123,6 +132,15 @@ Mibs = LldpTable, ArpTable
             help="Syslog facility to receive log lines")
         parser.add_argument("--scan_frequency", type=int,
             help="Time between snmp poll")
+        parser.add_argument("--scan_workers", type=int,
+            help="Number of devices polled at a time")
+        parser.add_argument("--scan_timeout", type=int,
+            help="Time allowed for the poll of a device")
+        parser.add_argument("--scan_max_repetitions", type=int,
+            help="Objects asked per GETBULK request, 0 to walk with GETNEXT")
+        parser.add_argument("--scan_cache_interval", type=int,
+            help="Time between polls of the tables that seldom change, "
+            "0 to poll them every time")
         parser.add_argument("--http_server_port", type=int,
             help="introspect server port")
         parser.add_argument("--admin_user",
@@ -181,6 +199,18 @@ Mibs = LldpTable, ArpTable
     def frequency(self):
         return self._args.scan_frequency
 
+    def scan_workers(self):
+        return self._args.scan_workers
+
+    def scan_timeout(self):
+        return self._args.scan_timeout
+
+    def scan_max_repetitions(self):
+        return self._args.scan_max_repetitions
+
+    def scan_cache_interval(self):
+        return self._args.scan_cache_interval
+
     def http_port(self):
         return self._args.http_server_port
 
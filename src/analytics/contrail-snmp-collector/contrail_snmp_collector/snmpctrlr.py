@@ -2,15 +2,28 @@ from snmp import SnmpSession
 from snmpuve import SnmpUve
 import time
 import gevent
-import os, json, sys
-from tempfile import NamedTemporaryFile
+import gevent.os
+import gevent.pool
+import os, json, signal, traceback
 
 class Controller(object):
     def __init__(self, config):
         self._config = config
         self.uve = SnmpUve(self._config)
+        self._logger = self.uve.logger()
         self.sleep_time()
         self._keep_running = True
+        # at most scan_workers devices are scanned at a time
+        self._pool = gevent.pool.Pool(self._config.scan_workers())
+        self._devices = {}
+        # device name -> time its next scan is due
+        self._next_scan = {}
+        # device name -> greenlet of the scan in progress
+        self._scans = {}
+        # device name -> scan duration (ms), overrun and timeout counts
+        self._scan_stats = {}
+        # device name -> tables kept between scans, see SnmpSession
+        self._scan_cache = {}
 
     def stop(self):
         self._keep_running = False
@@ -22,30 +35,118 @@ class Controller(object):
             self._sleep_time = self._config.frequency()
         return self._sleep_time
 
-    def task(self, netdev):
-        f = NamedTemporaryFile(mode='w+', delete=False)
-        pid = os.fork()
+    def scan(self, netdev):
+        # scan in a child process, the data and a refreshed table cache
+        # come back on a pipe. the child is killed if it is not done by the
+        # scan timeout
+        rfd, wfd = os.pipe()
+        pid = gevent.os.fork()
         if pid == 0:
-            ses = SnmpSession(netdev)
-            ses.scan_device()
-            json.dump(ses.get_data(), f)
-            f.flush()
-            f.close()
-            sys.exit(0)
-        pid, status = os.waitpid(pid, 0)
-        f.seek(0, 0)
-        data = json.load(f)
+            os.close(rfd)
+            try:
+                try:
+                    ses = SnmpSession(netdev,
+                            self._scan_cache.get(netdev.name),
+                            self._config.scan_max_repetitions(),
+                            self._config.scan_cache_interval())
+                    ses.scan_device()
+                    result = {'data': ses.get_data(),
+                              'cache': ses.get_cache()}
+                except Exception:
+                    # reported by the parent
+                    result = {'error': traceback.format_exc()}
+                data = json.dumps(result)
+                while data:
+                    data = data[os.write(wfd, data):]
+            finally:
+                os._exit(0)
+        os.close(wfd)
+        gevent.os.make_nonblocking(rfd)
+        chunks = []
+        try:
+            with gevent.Timeout(self._config.scan_timeout()):
+                chunk = gevent.os.nb_read(rfd, 65536)
+                while chunk:
+                    chunks.append(chunk)
+                    chunk = gevent.os.nb_read(rfd, 65536)
+        except gevent.Timeout:
+            os.kill(pid, signal.SIGKILL)
+            raise
+        finally:
+            os.close(rfd)
+            gevent.os.waitpid(pid, 0)
+        if not chunks:
+            raise RuntimeError('scan process exited without a result')
+        result = json.loads(''.join(chunks))
+        if 'error' in result:
+            raise RuntimeError(result['error'])
+        return result
+
+    def task(self, netdev):
+        stats = self._scan_stats.setdefault(netdev.name, {
+            'scanDuration': 0, 'scanOverruns': 0, 'scanTimeouts': 0})
+        start = time.time()
+        data = None
+        try:
+            result = self.scan(netdev)
+            data = result['data']
+            if result['cache'] is not None:
+                self._scan_cache[netdev.name] = result['cache']
+        except gevent.Timeout:
+            stats['scanTimeouts'] += 1
+            self._logger.error('%s: scan timed out' % netdev.name)
+        except Exception as e:
+            self._logger.error('%s: scan failed: %s' % (netdev.name, e))
+        finally:
+            self._scans.pop(netdev.name, None)
+        stats['scanDuration'] = int((time.time() - start) * 1000)
+        # next scan of the device was due before this one was done
+        if time.time() > self._next_scan.get(netdev.name, 0):
+            stats['scanOverruns'] += 1
+        # devices may have been read again during the scan
+        netdev = self._devices.get(netdev.name, netdev)
+
+        if data is None:
+            if netdev.get_snmp_name() is not None:
+                data = {'name': netdev.get_snmp_name()}
+                data.update(stats)
+                self.uve.send(data)
+            return
+        data.update(stats)
         self.uve.send(data)
-        f.close()
-        os.unlink(f.name)
         if netdev.get_snmp_name() is None:
             netdev.set_snmp_name(data['name'])
             self.uve.send_flow_uve({'name': netdev.get_snmp_name(),
                 'flow_export_source_ip': netdev.get_flow_export_source_ip()})
 
+    def refresh_devices(self):
+        devices = {}
+        for netdev in self._config.devices():
+            # keep the name learnt from earlier scans
+            if netdev.name in self._devices:
+                netdev.set_snmp_name(
+                        self._devices[netdev.name].get_snmp_name())
+            devices[netdev.name] = netdev
+        for name in set(self._devices) - set(devices):
+            self._next_scan.pop(name, None)
+            self._scan_stats.pop(name, None)
+            self._scan_cache.pop(name, None)
+        self._devices = devices
+
     def run(self):
+        refresh = 0
         while self._keep_running:
-            for netdev in self._config.devices():
-                self.task(netdev)
+            now = time.time()
+            if now >= refresh:
+                self.refresh_devices()
+                refresh = now + self._sleep_time
+            # start the scans that are due, every frequency() per device
+            for name, netdev in self._devices.items():
+                if name in self._scans or self._next_scan.get(name, 0) > now:
+                    continue
+                self._next_scan[name] = now + self._sleep_time
+                self._scans[name] = self._pool.spawn(self.task, netdev)
                 gevent.sleep(0)
-            gevent.sleep(self._sleep_time)
+                now = time.time()
+            wakeup = min([refresh] + self._next_scan.values())
+            gevent.sleep(max(wakeup - time.time(), 1))
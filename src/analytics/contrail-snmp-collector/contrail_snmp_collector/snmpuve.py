@@ -42,6 +42,9 @@ class SnmpUve(object):
 
         self.if_stat = {}
 
+    def logger(self):
+        return sandesh_global._logger
+
     def get_diff(self, data):
         pname = data['name']
         if pname not in self.if_stat:
@@ -461,6 +461,57 @@ class VncApi(VncApiClientGen):
         json_rsp = json.loads(content)
         return (json_rsp['fq_name'], json_rsp['type'])
 
+    def objects_read(self, obj_uuids, fields=None, exclude_ref_names=False):
+        """Read objects of any type by uuid in a single request.
+
+        With exclude_ref_names, refs, back-refs and children only carry
+        their uuid and href, not their fq_name.
+        """
+        json_body = json.dumps({'uuids': obj_uuids, 'fields': fields})
+        uri = self._action_uri['objects-read']
+        if exclude_ref_names:
+            uri += '?exclude_ref_names'
+        content = self._request_server(rest.OP_POST, uri, data=json_body)
+
+        objs = []
+        for obj_json in json.loads(content)['objects']:
+            (res_type, obj_dict) = obj_json.items()[0]
+            obj = str_to_class(CamelCase(res_type)).from_dict(**obj_dict)
+            obj.clear_pending_updates()
+            objs.append(obj)
+        return objs
+    #end objects_read
+
+    def objects_batch(self, operations):
+        """Apply an ordered list of (operation, obj) in a single request.
+
+        operation is 'CREATE' or 'UPDATE'. Returns the uuids of the objects.
+        """
+        opers = []
+        for (operation, obj) in operations:
+            obj_uuid = getattr(obj, 'uuid', None)
+            if operation == 'CREATE':
+                obj_json = json.dumps(obj, default=self._obj_serializer_all)
+            else:
+                obj_uuid = obj_uuid or self.obj_to_id(obj)
+                obj_json = json.dumps(obj, default=self._obj_serializer_diff)
+            opers.append({'operation': operation,
+                          'type': obj.get_type(),
+                          'uuid': obj_uuid,
+                          'data': json.loads(obj_json)})
+        json_body = json.dumps({'operations': opers})
+        uri = self._action_uri['objects-batch']
+        content = self._request_server(rest.OP_POST, uri, data=json_body)
+
+        obj_uuids = []
+        for ((operation, obj), result) in zip(operations,
+                                              json.loads(content)['results']):
+            obj.uuid = result.values()[0]['uuid']
+            obj.clear_pending_updates()
+            obj_uuids.append(obj.uuid)
+        return obj_uuids
+    #end objects_batch
+
     # This is required only for helping ifmap-subscribers using rest publish
     def ifmap_to_id(self, ifmap_id):
         json_body = json.dumps({'ifmap_id': ifmap_id})
@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+
+#
+# Copyright (c) 2015 Juniper Networks, Inc. All rights reserved.
+#
+
+#
+# Objects Batch Benchmark
+#
+# Times, against a running api-server, the per object cost of creating and
+# reading networks one request per object and in batches:
+#   - create of --count networks, one create call each
+#   - create of --count networks with objects_batch
+#   - read of the networks, one read call each
+#   - read of the networks with objects_read
+#
+#   objects_batch_bench.py --api-server-ip 127.0.0.1 --batch-sizes 1,10,100,1000
+#
+
+import sys
+import time
+import uuid
+import argparse
+
+from vnc_api.vnc_api import VncApi, VirtualNetwork
+
+
+def timed(fn, *args):
+    start = time.time()
+    res = fn(*args)
+    return res, time.time() - start
+
+
+def chunks(items, size):
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+def create_single(vnc_lib, vn_objs):
+    return [vnc_lib.virtual_network_create(vn_obj) for vn_obj in vn_objs]
+
+
+def create_batch(vnc_lib, vn_objs, batch_size):
+    obj_uuids = []
+    for batch in chunks(vn_objs, batch_size):
+        obj_uuids.extend(vnc_lib.objects_batch(
+            [('CREATE', vn_obj) for vn_obj in batch]))
+    return obj_uuids
+
+
+def read_single(vnc_lib, obj_uuids):
+    return [vnc_lib.virtual_network_read(id=obj_uuid)
+            for obj_uuid in obj_uuids]
+
+
+def read_batch(vnc_lib, obj_uuids, batch_size):
+    objs = []
+    for batch in chunks(obj_uuids, batch_size):
+        objs.extend(vnc_lib.objects_read(batch))
+    return objs
+
+
+def delete_all(vnc_lib, obj_uuids):
+    for obj_uuid in obj_uuids:
+        vnc_lib.virtual_network_delete(id=obj_uuid)
+
+
+def networks(prefix, count):
+    return [VirtualNetwork('%s-%d' % (prefix, i)) for i in range(count)]
+
+
+def bench(vnc_lib, args, batch_size):
+    prefix = 'batch-bench-%s' % (uuid.uuid4())
+    count = max(args.count, batch_size)
+
+    single_uuids, single_create = timed(create_single, vnc_lib,
+                                        networks(prefix + '-single', count))
+    _, single_read = timed(read_single, vnc_lib, single_uuids)
+
+    batch_uuids, batch_create = timed(create_batch, vnc_lib,
+                                      networks(prefix + '-batch', count),
+                                      batch_size)
+    _, batch_read = timed(read_batch, vnc_lib, batch_uuids, batch_size)
+
+    delete_all(vnc_lib, single_uuids + batch_uuids)
+
+    print '%-6d create %8.2f ms/obj (single %8.2f)  ' \
+          'read %8.2f ms/obj (single %8.2f)' % \
+        (batch_size, batch_create * 1000 / count, single_create * 1000 / count,
+         batch_read * 1000 / count, single_read * 1000 / count)
+
+
+def main(args_str=' '.join(sys.argv[1:])):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--api-server-ip', default='127.0.0.1')
+    parser.add_argument('--api-server-port', default='8082')
+    parser.add_argument('--admin-user', default='admin')
+    parser.add_argument('--admin-password', default='contrail123')
+    parser.add_argument('--admin-tenant-name', default='admin')
+    parser.add_argument('--count', type=int, default=1000,
+        help='Number of networks to create and read per batch size')
+    parser.add_argument('--batch-sizes', default='1,10,100,1000',
+        help='Comma separated batch sizes')
+    args = parser.parse_args(args_str.split())
+
+    vnc_lib = VncApi(args.admin_user, args.admin_password,
+                     args.admin_tenant_name, args.api_server_ip,
+                     args.api_server_port, '/')
+    for batch_size in args.batch_sizes.split(','):
+        bench(vnc_lib, args, int(batch_size))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
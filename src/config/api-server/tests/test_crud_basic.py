@@ -844,6 +844,187 @@ class TestVncCfgApiServer(test_case.ApiServerTestCase):
         finally:
             self._api_server._db_conn.fq_name_to_uuid= orig_fq_name_to_uuid
 
+    def test_quota_count_on_create_delete(self):
+        project_name = self.id() + '-project'
+        project_obj = Project(project_name)
+        project_obj.set_quota(QuotaType(virtual_network=2))
+        self._vnc_lib.project_create(project_obj)
+
+        logger.info('Creating networks up to the quota')
+        vn_objs = []
+        for i in range(2):
+            vn_obj = VirtualNetwork('%s-vn-%d' % (self.id(), i), project_obj)
+            self._vnc_lib.virtual_network_create(vn_obj)
+            vn_objs.append(vn_obj)
+
+        logger.info('Creating one more network expecting failure')
+        vn_obj = VirtualNetwork(self.id() + '-vn-2', project_obj)
+        with ExpectedException(PermissionDenied) as e:
+            self._vnc_lib.virtual_network_create(vn_obj)
+
+        logger.info('Deleting a network and creating it again')
+        self._vnc_lib.virtual_network_delete(id=vn_objs[0].uuid)
+        self._vnc_lib.virtual_network_create(vn_obj)
+        vn_objs[0] = vn_obj
+
+        for vn_obj in vn_objs:
+            self._vnc_lib.virtual_network_delete(id=vn_obj.uuid)
+        self._vnc_lib.project_delete(id=project_obj.uuid)
+    # end test_quota_count_on_create_delete
+
+    def test_quota_count_follows_project_ref(self):
+        proj_objs = []
+        for i in range(2):
+            proj_obj = Project('%s-project-%d' % (self.id(), i))
+            proj_obj.set_quota(QuotaType(floating_ip=1))
+            self._vnc_lib.project_create(proj_obj)
+            proj_objs.append(proj_obj)
+
+        ipam_obj = NetworkIpam(self.id() + '-ipam')
+        self._vnc_lib.network_ipam_create(ipam_obj)
+        vn_obj = VirtualNetwork(self.id() + '-vn')
+        vn_obj.add_network_ipam(ipam_obj, VnSubnetsType(
+            [IpamSubnetType(SubnetType('13.1.1.0', 24))]))
+        self._vnc_lib.virtual_network_create(vn_obj)
+        fip_pool_obj = FloatingIpPool(self.id() + '-pool', vn_obj)
+        self._vnc_lib.floating_ip_pool_create(fip_pool_obj)
+
+        logger.info('Creating a floating ip with a project ref by uuid')
+        fip_obj = FloatingIp(self.id() + '-fip-0', fip_pool_obj)
+        fip_obj.project_refs = [{'uuid': proj_objs[0].uuid, 'attr': None}]
+        self._vnc_lib.floating_ip_create(fip_obj)
+        fip_obj_2 = FloatingIp(self.id() + '-fip-1', fip_pool_obj)
+        fip_obj_2.set_project(proj_objs[0])
+        with ExpectedException(PermissionDenied) as e:
+            self._vnc_lib.floating_ip_create(fip_obj_2)
+
+        logger.info('Moving the floating ip to the other project')
+        fip_obj = self._vnc_lib.floating_ip_read(id=fip_obj.uuid)
+        fip_obj.set_project(proj_objs[1])
+        self._vnc_lib.floating_ip_update(fip_obj)
+        self._vnc_lib.floating_ip_create(fip_obj_2)
+        fip_obj_3 = FloatingIp(self.id() + '-fip-2', fip_pool_obj)
+        fip_obj_3.set_project(proj_objs[1])
+        with ExpectedException(PermissionDenied) as e:
+            self._vnc_lib.floating_ip_create(fip_obj_3)
+
+        for fip in (fip_obj, fip_obj_2):
+            self._vnc_lib.floating_ip_delete(id=fip.uuid)
+        self._vnc_lib.floating_ip_pool_delete(id=fip_pool_obj.uuid)
+        self._vnc_lib.virtual_network_delete(id=vn_obj.uuid)
+        self._vnc_lib.network_ipam_delete(id=ipam_obj.uuid)
+        for proj_obj in proj_objs:
+            self._vnc_lib.project_delete(id=proj_obj.uuid)
+    # end test_quota_count_follows_project_ref
+
+    def test_objects_batch_and_read(self):
+        ipam_obj = NetworkIpam(self.id() + '-ipam')
+        vn_objs = [VirtualNetwork('%s-vn-%d' % (self.id(), i))
+                   for i in range(3)]
+        logger.info('Creating an ipam and networks in one batch')
+        opers = [('CREATE', ipam_obj)] + [('CREATE', vn_obj)
+                                         for vn_obj in vn_objs]
+        obj_uuids = self._vnc_lib.objects_batch(opers)
+        self.assertThat(obj_uuids, Equals(
+            [ipam_obj.uuid] + [vn_obj.uuid for vn_obj in vn_objs]))
+
+        logger.info('Updating a network in a batch')
+        vn_objs[0].set_display_name('foobar')
+        self._vnc_lib.objects_batch([('UPDATE', vn_objs[0])])
+
+        logger.info('Reading the objects in one request')
+        objs = self._vnc_lib.objects_read(obj_uuids[::-1])
+        self.assertThat([obj.uuid for obj in objs],
+                        Equals(obj_uuids[::-1]))
+        self.assertThat(objs[-1].get_type(), Equals('network-ipam'))
+        self.assertThat(objs[-2].get_display_name(), Equals('foobar'))
+
+        logger.info('Creating an existing network stops the batch')
+        vn_obj = VirtualNetwork(self.id() + '-vn-3')
+        with ExpectedException(RefsExistError) as e:
+            self._vnc_lib.objects_batch([('CREATE', vn_obj),
+                                         ('CREATE', vn_objs[1])])
+        self._vnc_lib.virtual_network_delete(fq_name=vn_obj.get_fq_name())
+
+        logger.info('An unexpected error reports the failed operation')
+        api_server = test_common.vnc_cfg_api_server.server
+        def exception_on_vn_create(*args, **kwargs):
+            raise Exception("fake vn create exception")
+        orig_vn_create = api_server.virtual_network_http_post
+        try:
+            api_server.virtual_network_http_post = exception_on_vn_create
+            try:
+                self._vnc_lib.objects_batch(
+                    [('UPDATE', vn_objs[0]), ('CREATE', vn_obj)])
+                self.fail('batch with a failed operation succeeded')
+            except HttpError as e:
+                self.assertThat(e.status_code, Equals(500))
+                self.assertThat(e.content, Contains('Operation 1 failed'))
+        finally:
+            api_server.virtual_network_http_post = orig_vn_create
+
+        for vn_obj in vn_objs:
+            self._vnc_lib.virtual_network_delete(id=vn_obj.uuid)
+        self._vnc_lib.network_ipam_delete(id=ipam_obj.uuid)
+    # end test_objects_batch_and_read
+
+    def test_db_check_skips_deleted_rows(self):
+        api_server = test_common.vnc_cfg_api_server.server
+        uuid_cf = CassandraCFs.get_cf('obj_uuid_table')
+        # a deleted row not yet compacted, and an object without a type
+        ghost_uuid = str(uuid.uuid4())
+        untyped_uuid = str(uuid.uuid4())
+        uuid_cf._rows[ghost_uuid] = {}
+        uuid_cf.insert(untyped_uuid, {'fq_name': json.dumps(['untyped'])})
+        try:
+            results = api_server._db_conn.db_check()
+            broken = [result['uuid'] for result in results]
+            self.assertIn(untyped_uuid, broken)
+            self.assertNotIn(ghost_uuid, broken)
+            read_uuids = [result['uuid']
+                          for result in api_server._db_conn.db_read()]
+            self.assertNotIn(ghost_uuid, read_uuids)
+        finally:
+            uuid_cf._rows.pop(ghost_uuid, None)
+            uuid_cf.remove(untyped_uuid)
+    # end test_db_check_skips_deleted_rows
+
+    def test_fq_name_cache_on_local_delete(self):
+        api_server = test_common.vnc_cfg_api_server.server
+        db_conn = api_server._db_conn
+        vn_obj = VirtualNetwork('%s-vn' % self.id())
+        self._vnc_lib.virtual_network_create(vn_obj)
+        fq_name = vn_obj.get_fq_name()
+        self.assertEqual(db_conn.fq_name_to_uuid('virtual-network', fq_name),
+                         vn_obj.uuid)
+
+        # notifications held back, as with rabbit down
+        msgbus = db_conn._msgbus
+        held = []
+        new_vn_obj = VirtualNetwork(vn_obj.name)
+        orig_create_publish = msgbus.dbe_create_publish
+        orig_delete_publish = msgbus.dbe_delete_publish
+        msgbus.dbe_create_publish = \
+            lambda *args: held.append((orig_create_publish, args))
+        msgbus.dbe_delete_publish = \
+            lambda *args: held.append((orig_delete_publish, args))
+        try:
+            self._vnc_lib.virtual_network_delete(id=vn_obj.uuid)
+            with ExpectedException(NoIdError):
+                db_conn.fq_name_to_uuid('virtual-network', fq_name)
+
+            self._vnc_lib.virtual_network_create(new_vn_obj)
+            self.assertEqual(
+                db_conn.fq_name_to_uuid('virtual-network', fq_name),
+                new_vn_obj.uuid)
+        finally:
+            msgbus.dbe_create_publish = orig_create_publish
+            msgbus.dbe_delete_publish = orig_delete_publish
+            for (publish, args) in held:
+                publish(*args)
+        self._vnc_lib.virtual_network_delete(id=new_vn_obj.uuid)
+    # end test_fq_name_cache_on_local_delete
+
     def test_put_on_wrong_type(self):
         vn_name = self.id()+'-vn'
         vn_obj = VirtualNetwork(vn_name)
@@ -558,6 +558,103 @@ class TestIpAlloc(test_case.ApiServerTestCase):
         self._vnc_lib.domain_delete(id=domain.uuid)
     #end
 
+    def test_ip_alloc_block(self):
+        print 'test ip block allocation'
+
+        # Create Domain
+        domain = Domain('block-domain')
+        self._vnc_lib.domain_create(domain)
+
+        # Create Project
+        project = Project('block-proj', domain)
+        self._vnc_lib.project_create(project)
+
+        # Create NetworkIpam
+        ipam = NetworkIpam('default-network-ipam', project, IpamType("dhcp"))
+        self._vnc_lib.network_ipam_create(ipam)
+
+        # Create VN with two small subnets
+        ipam_sn_1 = IpamSubnetType(subnet=SubnetType('12.1.1.0', 28))
+        ipam_sn_2 = IpamSubnetType(subnet=SubnetType('12.1.2.0', 28))
+        vn = VirtualNetwork('block-vn', project)
+        vn.add_network_ipam(ipam, VnSubnetsType([ipam_sn_1, ipam_sn_2]))
+        self._vnc_lib.virtual_network_create(vn)
+
+        # the block spans both subnets
+        ip_list = self._vnc_lib.virtual_network_ip_alloc(vn, count=16)
+        self.assertEqual(len(set(ip_list)), 16)
+        self.assertTrue(all(ip.startswith('12.1.1.') or
+                            ip.startswith('12.1.2.') for ip in ip_list))
+
+        # not enough addresses left, nothing gets allocated
+        with ExpectedException(cfgm_common.exceptions.RefsExistError) as e:
+            self._vnc_lib.virtual_network_ip_alloc(vn, count=16)
+        ip_list2 = self._vnc_lib.virtual_network_ip_alloc(vn, count=4)
+        self.assertEqual(len(set(ip_list + ip_list2)), 20)
+
+        # freed addresses are allocated again
+        sn_1_ips = [ip for ip in ip_list if ip.startswith('12.1.1.')]
+        self._vnc_lib.virtual_network_ip_free(vn, sn_1_ips)
+        ip_list3 = self._vnc_lib.virtual_network_ip_alloc(
+            vn, count=len(sn_1_ips), subnet='12.1.1.0/28')
+        self.assertEqual(sorted(ip_list3), sorted(sn_1_ips))
+
+        self._vnc_lib.virtual_network_ip_free(vn, ip_list + ip_list2)
+        self._vnc_lib.virtual_network_delete(id=vn.uuid)
+        self._vnc_lib.network_ipam_delete(id=ipam.uuid)
+        self._vnc_lib.project_delete(id=project.uuid)
+        self._vnc_lib.domain_delete(id=domain.uuid)
+    #end test_ip_alloc_block
+
+    def test_ip_alloc_subnet_cache(self):
+        print 'test subnet cache of ip allocation'
+        addr_mgmt = self._api_server._addr_mgmt
+
+        # Create Domain
+        domain = Domain('cache-domain')
+        self._vnc_lib.domain_create(domain)
+
+        # Create Project
+        project = Project('cache-proj', domain)
+        self._vnc_lib.project_create(project)
+
+        # Create NetworkIpam
+        ipam = NetworkIpam('default-network-ipam', project, IpamType("dhcp"))
+        self._vnc_lib.network_ipam_create(ipam)
+
+        # Create VN
+        ipam_sn_1 = IpamSubnetType(subnet=SubnetType('13.1.1.0', 24))
+        vn = VirtualNetwork('cache-vn', project)
+        vn.add_network_ipam(ipam, VnSubnetsType([ipam_sn_1]))
+        self._vnc_lib.virtual_network_create(vn)
+
+        # allocations after the first one do not read the subnets
+        stats = addr_mgmt.subnet_cache_stats()
+        ip_list = []
+        for i in range(3):
+            ip_list += self._vnc_lib.virtual_network_ip_alloc(vn, count=1)
+        new_stats = addr_mgmt.subnet_cache_stats()
+        self.assertEqual(new_stats['hits'] + new_stats['misses'] -
+                         stats['hits'] - stats['misses'], 3)
+        self.assertTrue(new_stats['hits'] > stats['hits'])
+
+        # subnets added to the VN are seen by the next allocation
+        ipam_sn_2 = IpamSubnetType(subnet=SubnetType('13.1.2.0', 24))
+        vn.set_network_ipam(ipam, VnSubnetsType([ipam_sn_1, ipam_sn_2]))
+        self._vnc_lib.virtual_network_update(vn)
+        ip_list += self._vnc_lib.virtual_network_ip_alloc(
+            vn, count=1, subnet='13.1.2.0/24')
+        self.assertTrue(ip_list[-1].startswith('13.1.2.'))
+        self.assertTrue(addr_mgmt.subnet_cache_stats()['invalidations'] >
+                        new_stats['invalidations'])
+
+        self._vnc_lib.virtual_network_ip_free(vn, ip_list)
+        self._vnc_lib.virtual_network_delete(id=vn.uuid)
+        self._vnc_lib.network_ipam_delete(id=ipam.uuid)
+        self._vnc_lib.project_delete(id=project.uuid)
+        self._vnc_lib.domain_delete(id=domain.uuid)
+    #end test_ip_alloc_subnet_cache
+
 #end class TestIpAlloc
 
 if __name__ == '__main__':
@@ -55,6 +55,8 @@ def parse_args(args_str):
         'rabbit_vhost': None,
         'rabbit_max_pending_updates': '4096',
         'cluster_id': '',
+        'db_walk_workers': '8',
+        'object_cache_entries': '100000',
     }
     # ssl options
     secopts = {
@@ -222,6 +224,12 @@ def parse_args(args_str):
     parser.add_argument(
         "--cluster_id",
         help="Used for database keyspace separation")
+    parser.add_argument(
+        "--db_walk_workers",
+        help="Number of concurrent workers of a walk of the config db")
+    parser.add_argument(
+        "--object_cache_entries",
+        help="Maximum number of objects in the uuid/fq_name cache")
     args_obj, remaining_argv = parser.parse_known_args(remaining_argv)
     args_obj.config_sections = config
     if type(args_obj.cassandra_server_list) is str:
@@ -292,6 +292,11 @@ class Subnet(object):
         return None
     # end ip_alloc
 
+    def ip_alloc_block(self, count):
+        addrs = self._db_conn.subnet_alloc_block_req(self._name, count)
+        return [str(IPAddress(addr)) for addr in addrs]
+    # end ip_alloc_block
+
     # free IP unless it is invalid, excluded or already freed
     @classmethod
     def ip_free_cls(cls, subnet_fq_name, ip_network, exclude_addrs, ip_addr):
@@ -307,6 +312,15 @@ class Subnet(object):
         Subnet.ip_free_cls(self._name, self._network, self._exclude, ip_addr)
     # end ip_free
 
+    # free the IPs that are valid and not excluded
+    def ip_free_block(self, ip_addrs):
+        addrs = [int(ip_addr) for ip_addr in ip_addrs
+                 if ip_addr in self._network and
+                 ip_addr not in self._exclude]
+        if addrs:
+            self._db_conn.subnet_free_block_req(self._name, addrs)
+    # end ip_free_block
+
     # check if IP address belongs to us
     @classmethod
     def ip_belongs_to(cls, ipnet, ipaddr):
@@ -338,6 +352,12 @@ class AddrMgmt(object):
         self._db_conn = None
         # dict of VN where each key has dict of subnets
         self._subnet_objs = {}
+        # subnet dicts of VN read from db, keyed by fq name string, and
+        # version of each VN bumped on invalidation
+        self._subnet_dicts_cache = {}
+        self._subnet_dicts_version = {}
+        self._subnet_cache_stats = {'hits': 0, 'misses': 0,
+                                    'invalidations': 0}
     # end __init__
 
     def _get_db_conn(self):
@@ -348,11 +368,37 @@ class AddrMgmt(object):
         return self._db_conn
     # end _get_db_conn
 
+    def _invalidate_subnet_dicts(self, vn_fq_name_str):
+        self._subnet_dicts_cache.pop(vn_fq_name_str, None)
+        self._subnet_dicts_version[vn_fq_name_str] = \
+            self._subnet_dicts_version.get(vn_fq_name_str, 0) + 1
+        self._subnet_cache_stats['invalidations'] += 1
+    # end _invalidate_subnet_dicts
+
+    def subnet_cache_stats(self):
+        stats = dict(self._subnet_cache_stats)
+        stats['networks'] = len(self._subnet_dicts_cache)
+        return stats
+    # end subnet_cache_stats
+
     def _get_subnet_dicts(self, vn_fq_name, vn_dict=None):
+        # Subnet dicts of a VN read from db are cached until the VN is
+        # updated or deleted, callers must not modify them
+        vn_fq_name_str = ':'.join(vn_fq_name)
+        if not vn_dict:
+            try:
+                subnet_dicts = self._subnet_dicts_cache[vn_fq_name_str]
+                self._subnet_cache_stats['hits'] += 1
+                return subnet_dicts
+            except KeyError:
+                self._subnet_cache_stats['misses'] += 1
+
         db_conn = self._get_db_conn()
+        version = self._subnet_dicts_version.get(vn_fq_name_str, 0)
         vn_uuid = db_conn.fq_name_to_uuid('virtual-network', vn_fq_name)
 
         # Read in the VN details if not passed in
+        cache = not vn_dict
         if not vn_dict:
             (ok, result) = self._db_conn.dbe_read(
                                 obj_type='virtual-network',
@@ -363,7 +409,6 @@ class AddrMgmt(object):
 
             vn_dict = result
 
-        vn_fq_name_str = ':'.join(vn_fq_name)
         ipam_refs = vn_dict.get('network_ipam_refs', [])
 
         # gather all subnets, return dict keyed by name
@@ -385,9 +430,35 @@ class AddrMgmt(object):
                               subnet_dict['ip_prefix_len'])
                 subnet_dicts[subnet_name] = subnet_dict
 
+        # do not cache what was read before an invalidation
+        if cache and \
+           version == self._subnet_dicts_version.get(vn_fq_name_str, 0):
+            self._subnet_dicts_cache[vn_fq_name_str] = subnet_dicts
         return subnet_dicts
     # end _get_subnet_dicts
 
+    def _get_subnet_obj(self, vn_fq_name_str, subnet_name, subnet_dict):
+        # create subnet_obj internally if it was created by some other
+        # api-server before
+        try:
+            return self._subnet_objs[vn_fq_name_str][subnet_name]
+        except KeyError:
+            if vn_fq_name_str not in self._subnet_objs:
+                self._subnet_objs[vn_fq_name_str] = {}
+
+        subnet_obj = Subnet('%s:%s' % (vn_fq_name_str, subnet_name),
+                            subnet_dict['ip_prefix'],
+                            subnet_dict['ip_prefix_len'],
+                            gw=subnet_dict['gw'],
+                            service_address=subnet_dict['dns_server_address'],
+                            enable_dhcp=subnet_dict['enable_dhcp'],
+                            dns_nameservers=subnet_dict['dns_nameservers'],
+                            alloc_pool_list=subnet_dict['allocation_pools'],
+                            addr_from_start=subnet_dict['addr_start'])
+        self._subnet_objs[vn_fq_name_str][subnet_name] = subnet_obj
+        return subnet_obj
+    # end _get_subnet_obj
+
     def _create_subnet_objs(self, vn_fq_name_str, vn_dict):
         self._subnet_objs[vn_fq_name_str] = {}
         # create subnet for each new subnet
@@ -430,6 +501,7 @@ class AddrMgmt(object):
         self._get_db_conn()
         vn_fq_name_str = ':'.join(obj_dict['fq_name'])
 
+        self._invalidate_subnet_dicts(vn_fq_name_str)
         self._create_subnet_objs(vn_fq_name_str, obj_dict)
     # end net_create_req
 
@@ -450,6 +522,7 @@ class AddrMgmt(object):
 
         vn_dict = result
         vn_fq_name_str = ':'.join(vn_dict['fq_name'])
+        self._invalidate_subnet_dicts(vn_fq_name_str)
         self._create_subnet_objs(vn_fq_name_str, vn_dict)
     # end net_create_notify
 
@@ -491,6 +564,7 @@ class AddrMgmt(object):
                     if cmp(req_alloc_list[index], db_alloc_list[index]):
                         raise AddrMgmtSubnetInvalid(vn_fq_name_str, key)
 
+        self._invalidate_subnet_dicts(vn_fq_name_str)
         self._create_subnet_objs(vn_fq_name_str, req_vn_dict)
     # end net_update_req
 
@@ -511,6 +585,7 @@ class AddrMgmt(object):
 
         vn_dict = result
         vn_fq_name_str = ':'.join(vn_dict['fq_name'])
+        self._invalidate_subnet_dicts(vn_fq_name_str)
         self._create_subnet_objs(vn_fq_name_str, vn_dict)
     # end net_update_notify
 
@@ -523,6 +598,7 @@ class AddrMgmt(object):
         for subnet_name in subnet_dicts:
             Subnet.delete_cls('%s:%s' % (vn_fq_name_str, subnet_name))
 
+        self._invalidate_subnet_dicts(vn_fq_name_str)
         try:
             vn_fq_name_str = ':'.join(vn_fq_name)
             del self._subnet_objs[vn_fq_name_str]
@@ -531,6 +607,7 @@ class AddrMgmt(object):
     # end net_delete_req
 
     def net_delete_notify(self, obj_ids, obj_dict):
+        self._invalidate_subnet_dicts(':'.join(obj_dict['fq_name']))
         try:
             vn_fq_name_str = ':'.join(obj_dict['fq_name'])
             del self._subnet_objs[vn_fq_name_str]
@@ -778,26 +855,8 @@ class AddrMgmt(object):
             if sub and sub != subnet_name:
                 continue
 
-            # create subnet_obj internally if it was created by some other
-            # api-server before
-            try:
-                subnet_obj = self._subnet_objs[vn_fq_name_str][subnet_name]
-            except KeyError:
-                if vn_fq_name_str not in self._subnet_objs:
-                    self._subnet_objs[vn_fq_name_str] = {}
-
-                subnet_dict = subnet_dicts[subnet_name]
-                subnet_obj = Subnet('%s:%s' % (vn_fq_name_str,
-                                               subnet_name),
-                                    subnet_dict['ip_prefix'],
-                                    subnet_dict['ip_prefix_len'],
-                                    gw=subnet_dict['gw'],
-                                    service_address=subnet_dict['dns_server_address'],
-                                    enable_dhcp=subnet_dict['enable_dhcp'],
-                                    dns_nameservers=subnet_dict['dns_nameservers'],
-                                    alloc_pool_list=subnet_dict['allocation_pools'],
-                                    addr_from_start = subnet_dict['addr_start'])
-                self._subnet_objs[vn_fq_name_str][subnet_name] = subnet_obj
+            subnet_obj = self._get_subnet_obj(vn_fq_name_str, subnet_name,
+                                              subnet_dicts[subnet_name])
 
             if asked_ip_version != subnet_obj.get_version():
                 continue
@@ -822,30 +881,45 @@ class AddrMgmt(object):
         raise AddrMgmtSubnetExhausted(vn_fq_name, 'all')
     # end ip_alloc_req
 
+    # allocate a block of count IP addresses for given virtual network,
+    # from the subnets in order unless a subnet is provided. Either all
+    # the addresses are allocated or none
+    def ip_alloc_block_req(self, vn_fq_name, sub=None, count=1,
+                           asked_ip_version=4):
+        vn_fq_name_str = ':'.join(vn_fq_name)
+        subnet_dicts = self._get_subnet_dicts(vn_fq_name)
+
+        if not subnet_dicts:
+            raise AddrMgmtSubnetUndefined(vn_fq_name_str)
+
+        allocated = []
+        for subnet_name in subnet_dicts:
+            if sub and sub != subnet_name:
+                continue
+            subnet_obj = self._get_subnet_obj(vn_fq_name_str, subnet_name,
+                                              subnet_dicts[subnet_name])
+            if asked_ip_version != subnet_obj.get_version():
+                continue
+            # ask the subnet for the addresses still missing
+            ip_addrs = subnet_obj.ip_alloc_block(
+                count - sum(len(addrs) for _, addrs in allocated))
+            allocated.append((subnet_obj, ip_addrs))
+            if sum(len(addrs) for _, addrs in allocated) == count:
+                return [ip_addr for _, addrs in allocated
+                        for ip_addr in addrs]
+
+        for subnet_obj, ip_addrs in allocated:
+            subnet_obj.ip_free_block([IPAddress(ip_addr)
+                                      for ip_addr in ip_addrs])
+        raise AddrMgmtSubnetExhausted(vn_fq_name, sub or 'all')
+    # end ip_alloc_block_req
+
     def ip_alloc_notify(self, ip_addr, vn_fq_name):
         vn_fq_name_str = ':'.join(vn_fq_name)
         subnet_dicts = self._get_subnet_dicts(vn_fq_name)
         for subnet_name in subnet_dicts:
-            # create subnet_obj internally if it was created by some other
-            # api-server before
-            try:
-                subnet_obj = self._subnet_objs[vn_fq_name_str][subnet_name]
-            except KeyError:
-                if vn_fq_name_str not in self._subnet_objs:
-                    self._subnet_objs[vn_fq_name_str] = {}
-
-                subnet_dict = subnet_dicts[subnet_name]
-                subnet_obj = Subnet('%s:%s' % (vn_fq_name_str,
-                                               subnet_name),
-                                    subnet_dict['ip_prefix'],
-                                    subnet_dict['ip_prefix_len'],
-                                    gw=subnet_dict['gw'],
-                                    service_address=subnet_dict['dns_server_address'],
-                                    enable_dhcp=subnet_dict['enable_dhcp'],
-                                    dns_nameservers=subnet_dict['dns_nameservers'],
-                                    alloc_pool_list=subnet_dict['allocation_pools'],
-                                    addr_from_start = subnet_dict['addr_start'])
-                self._subnet_objs[vn_fq_name_str][subnet_name] = subnet_obj
+            subnet_obj = self._get_subnet_obj(vn_fq_name_str, subnet_name,
+                                              subnet_dicts[subnet_name])
 
             if not subnet_obj.ip_belongs(ip_addr):
                 continue
@@ -861,27 +935,8 @@ class AddrMgmt(object):
             if sub and sub != subnet_name:
                 continue
 
-            # if we have subnet_obj free it via instance method,
-            # updating inuse bitmask, else free it via class method
-            # and there is no inuse bitmask to worry about
-            try:
-                subnet_obj = self._subnet_objs[vn_fq_name_str][subnet_name]
-            except KeyError:
-                if vn_fq_name_str not in self._subnet_objs:
-                    self._subnet_objs[vn_fq_name_str] = {}
-
-                subnet_dict = subnet_dicts[subnet_name]
-                subnet_obj = Subnet('%s:%s' % (vn_fq_name_str,
-                                               subnet_name),
-                                    subnet_dict['ip_prefix'],
-                                    subnet_dict['ip_prefix_len'],
-                                    gw=subnet_dict['gw'],
-                                    service_address=subnet_dict['dns_server_address'],
-                                    enable_dhcp=subnet_dict['enable_dhcp'],
-                                    dns_nameservers=subnet_dict['dns_nameservers'],
-                                    alloc_pool_list=subnet_dict['allocation_pools'],
-                                    addr_from_start = subnet_dict['addr_start'])
-                self._subnet_objs[vn_fq_name_str][subnet_name] = subnet_obj
+            subnet_obj = self._get_subnet_obj(vn_fq_name_str, subnet_name,
+                                              subnet_dicts[subnet_name])
 
             if Subnet.ip_belongs_to(IPNetwork(subnet_name),
                                     IPAddress(ip_addr)):
@@ -889,6 +944,25 @@ class AddrMgmt(object):
                 break
     # end ip_free_req
 
+    def ip_free_block_req(self, ip_addrs, vn_fq_name, sub=None):
+        vn_fq_name_str = ':'.join(vn_fq_name)
+        subnet_dicts = self._get_subnet_dicts(vn_fq_name)
+        ip_addrs = [IPAddress(ip_addr) for ip_addr in ip_addrs]
+        for subnet_name in subnet_dicts:
+            if sub and sub != subnet_name:
+                continue
+            network = IPNetwork(subnet_name)
+            subnet_addrs = [ip_addr for ip_addr in ip_addrs
+                            if Subnet.ip_belongs_to(network, ip_addr)]
+            if not subnet_addrs:
+                continue
+            subnet_obj = self._get_subnet_obj(vn_fq_name_str, subnet_name,
+                                              subnet_dicts[subnet_name])
+            subnet_obj.ip_free_block(subnet_addrs)
+            ip_addrs = [ip_addr for ip_addr in ip_addrs
+                        if ip_addr not in subnet_addrs]
+    # end ip_free_block_req
+
     def is_ip_allocated(self, ip_addr, vn_fq_name, sub=None):
         vn_fq_name_str = ':'.join(vn_fq_name)
         subnet_dicts = self._get_subnet_dicts(vn_fq_name)
@@ -896,27 +970,8 @@ class AddrMgmt(object):
             if sub and sub != subnet_name:
                 continue
 
-            # if we have subnet_obj free it via instance method,
-            # updating inuse bitmask, else free it via class method
-            # and there is no inuse bitmask to worry about
-            try:
-                subnet_obj = self._subnet_objs[vn_fq_name_str][subnet_name]
-            except KeyError:
-                if vn_fq_name_str not in self._subnet_objs:
-                    self._subnet_objs[vn_fq_name_str] = {}
-
-                subnet_dict = subnet_dicts[subnet_name]
-                subnet_obj = Subnet('%s:%s' % (vn_fq_name_str,
-                                               subnet_name),
-                                    subnet_dict['ip_prefix'],
-                                    subnet_dict['ip_prefix_len'],
-                                    gw=subnet_dict['gw'],
-                                    service_address=subnet_dict['dns_server_address'],
-                                    enable_dhcp=subnet_dict['enable_dhcp'],
-                                    dns_nameservers=subnet_dict['dns_nameservers'],
-                                    alloc_pool_list=subnet_dict['allocation_pools'],
-                                    addr_from_start = subnet_dict['addr_start'])
-                self._subnet_objs[vn_fq_name_str][subnet_name] = subnet_obj
+            subnet_obj = self._get_subnet_obj(vn_fq_name_str, subnet_name,
+                                              subnet_dicts[subnet_name])
 
             if Subnet.ip_belongs_to(IPNetwork(subnet_name),
                                     IPAddress(ip_addr)):
@@ -95,6 +95,8 @@ from cfgm_common.uve.cfgm_cpuinfo.ttypes import NodeStatusUVE, \
     NodeStatus
 
 from sandesh.traces.ttypes import RestApiTrace
+from sandesh.api_introspect.ttypes import AddrMgmtSubnetCacheReq, \
+    AddrMgmtSubnetCacheResp, ObjectNameCacheReq, ObjectNameCacheResp
 
 _ACTION_RESOURCES = [
     {'uri': '/ref-update', 'link_name': 'ref-update',
@@ -103,6 +105,10 @@ _ACTION_RESOURCES = [
      'method_name': 'fq_name_to_id_http_post'},
     {'uri': '/id-to-fqname', 'link_name': 'id-to-name',
      'method_name': 'id_to_fq_name_http_post'},
+    {'uri': '/objects-read', 'link_name': 'objects-read',
+     'method_name': 'objects_read_http_post'},
+    {'uri': '/objects-batch', 'link_name': 'objects-batch',
+     'method_name': 'objects_batch_http_post'},
     # ifmap-to-id only for ifmap subcribers using rest for publish
     {'uri': '/ifmap-to-id', 'link_name': 'ifmap-to-id',
      'method_name': 'ifmap_to_id_http_post'},
@@ -367,7 +373,9 @@ class VncApiServer(VncApiServerGen):
                                      self._args.collectors,
                                      'vnc_api_server_context',
                                      int(self._args.http_server_port),
-                                     ['cfgm_common'], self._disc)
+                                     ['cfgm_common',
+                                      'vnc_cfg_api_server.sandesh'],
+                                     self._disc)
         self._sandesh.trace_buffer_create(name="VncCfgTraceBuf", size=1000)
         self._sandesh.trace_buffer_create(name="RestApiTraceBuf", size=1000)
         self._sandesh.trace_buffer_create(name="DBRequestTraceBuf", size=1000)
@@ -401,6 +409,8 @@ class VncApiServer(VncApiServerGen):
         vnc_cfg_types.VirtualNetworkServer.addr_mgmt = addr_mgmt
         vnc_cfg_types.InstanceIpServer.manager = self
         self._addr_mgmt = addr_mgmt
+        AddrMgmtSubnetCacheReq.handle_request = \
+            self.sandesh_subnet_cache_handle_request
 
         # Authn/z interface
         if self._args.auth == 'keystone':
@@ -431,6 +441,8 @@ class VncApiServer(VncApiServerGen):
         else:
             self._db_connect(self._args.reset_config)
             self._db_init_entries()
+        ObjectNameCacheReq.handle_request = \
+            self.sandesh_object_cache_handle_request
 
         # Cpuinfo interface
         sysinfo_req = True
@@ -505,6 +517,12 @@ class VncApiServer(VncApiServerGen):
                 self._extensions_transform_request(bottle.request)
                 self._extensions_validate_request(bottle.request)
 
+                # reads of callers only needing uuids of refs, back-refs
+                # and children
+                self._db_conn.exclude_ref_names(
+                    bottle.request.method == 'GET' and
+                    'exclude_ref_names' in bottle.request.query)
+
                 trace = self._generate_rest_api_request_trace()
                 response = handler(*args, **kwargs)
                 self._generate_rest_api_response_trace(trace, response)
@@ -700,6 +718,112 @@ class VncApiServer(VncApiServerGen):
         return {'fq_name': fq_name, 'type': obj_type}
     # end id_to_fq_name_http_post
 
+    def objects_read_http_post(self):
+        self._post_common(bottle.request, None, None)
+        obj_uuids = bottle.request.json['uuids']
+        obj_fields = bottle.request.json.get('fields')
+        self._db_conn.exclude_ref_names(
+            'exclude_ref_names' in bottle.request.query)
+
+        (ok, result) = self._http_get_common(bottle.request, obj_uuids)
+        if not ok:
+            (code, msg) = result
+            bottle.abort(code, msg)
+
+        try:
+            obj_types = self._db_conn.uuids_to_obj_types(obj_uuids)
+        except NoIdError as e:
+            bottle.abort(404, 'UUID ' + str(e) + ' not found')
+
+        # one multiget per object type present in the request
+        type_ids = {}
+        for obj_uuid in obj_uuids:
+            type_ids.setdefault(obj_types[obj_uuid], []).append(
+                {'uuid': obj_uuid})
+
+        obj_dicts = {}
+        for obj_type, obj_ids_list in type_ids.items():
+            (ok, result) = self._db_conn.dbe_read_multi(
+                obj_type, obj_ids_list, obj_fields)
+            if not ok:
+                bottle.abort(404, result)
+            res_type = obj_type.replace('_', '-')
+            for obj_dict in result:
+                obj_dict['href'] = self.generate_url(res_type,
+                                                     obj_dict['uuid'])
+                obj_dicts[obj_dict['uuid']] = {res_type: obj_dict}
+
+        return {'objects': [obj_dicts[obj_uuid] for obj_uuid in obj_uuids
+                            if obj_uuid in obj_dicts]}
+    # end objects_read_http_post
+
+    def _objects_batch_apply(self, environ, oper):
+        obj_type = oper['type'].replace('-', '_')
+        res_type = oper['type'].replace('_', '-')
+        if oper['operation'] == 'CREATE':
+            handler = getattr(self, '%s_http_post' % (obj_type), None)
+            args = ()
+        elif oper['operation'] == 'UPDATE':
+            handler = getattr(self, '%s_http_put' % (obj_type), None)
+            args = (oper['uuid'],)
+        else:
+            bottle.abort(400, 'Unknown operation ' + str(oper['operation']))
+        if handler is None:
+            bottle.abort(404, 'Unknown type ' + str(oper['type']))
+
+        # The resource handler reads the object from the request, bound to
+        # the operation for the greenlet of the batch request only. Every
+        # type-specific hook, permission check and notification of the
+        # single object path applies, and so do the request extensions.
+        body = json.dumps({res_type: oper['data']})
+        oper_environ = dict((k, v) for k, v in environ.items()
+                            if not k.startswith('bottle.request.'))
+        oper_environ.update({'REQUEST_METHOD': args and 'PUT' or 'POST',
+                             'QUERY_STRING': '',
+                             'CONTENT_TYPE': 'application/json',
+                             'CONTENT_LENGTH': str(len(body)),
+                             'wsgi.input': StringIO(body)})
+        bottle.request.bind(oper_environ)
+        self._extensions_transform_request(bottle.request)
+        self._extensions_validate_request(bottle.request)
+        return handler(*args)
+    # end _objects_batch_apply
+
+    # Apply an ordered list of create/update operations. Operations are
+    # applied one after the other, a failure stops the batch and reports
+    # the index of the failed operation, preceding ones are not undone.
+    def objects_batch_http_post(self):
+        self._post_common(bottle.request, None, None)
+        operations = bottle.request.json['operations']
+
+        environ = bottle.request.environ
+        results = []
+        error = None
+        try:
+            for idx, oper in enumerate(operations):
+                try:
+                    results.append(self._objects_batch_apply(environ, oper))
+                except bottle.HTTPError as e:
+                    error = (e.status_code,
+                             'Operation %d failed: %s' % (idx, e.body))
+                    break
+                except Exception as e:
+                    string_buf = StringIO()
+                    cgitb.Hook(file=string_buf, format="text").handle(
+                        sys.exc_info())
+                    self.config_log(mask_password(string_buf.getvalue()),
+                                    level=SandeshLevel.SYS_ERR)
+                    error = (500, 'Operation %d failed: %s' % (idx, str(e)))
+                    break
+        finally:
+            bottle.request.bind(environ)
+
+        if error:
+            bottle.abort(*error)
+
+        return {'results': results}
+    # end objects_batch_http_post
+
     def ifmap_to_id_http_post(self):
         self._post_common(bottle.request, None, None)
         uuid = self._db_conn.ifmap_id_to_uuid(bottle.request.json['ifmap_id'])
@@ -1015,6 +1139,18 @@ class VncApiServer(VncApiServerGen):
         log.send(sandesh=self._sandesh)
     # end config_object_error
 
+    def sandesh_subnet_cache_handle_request(self, req):
+        stats = self._addr_mgmt.subnet_cache_stats()
+        resp = AddrMgmtSubnetCacheResp(**stats)
+        resp.response(req.context())
+    # end sandesh_subnet_cache_handle_request
+
+    def sandesh_object_cache_handle_request(self, req):
+        stats = self._db_conn._cassandra_db.cache_stats()
+        resp = ObjectNameCacheResp(**stats)
+        resp.response(req.context())
+    # end sandesh_object_cache_handle_request
+
     def config_log(self, err_str, level=SandeshLevel.SYS_INFO):
         VncApiError(api_error_msg=err_str, level=level, sandesh=self._sandesh).send(
             sandesh=self._sandesh)
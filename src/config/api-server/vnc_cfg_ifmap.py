@@ -6,10 +6,12 @@
 Layer that transforms VNC config objects to ifmap representation
 """
 from cfgm_common.zkclient import ZookeeperClient, IndexAllocator
+from cfgm_common.zkclient import RangeIndexAllocator
 from gevent import ssl, monkey
 monkey.patch_all()
 import gevent
 import gevent.event
+import gevent.pool
 from gevent.queue import Queue
 import sys
 import time
@@ -46,6 +48,7 @@ from cfgm_common.vnc_cassandra import VncCassandraClient
 from cfgm_common.vnc_kombu import VncKombuClient
 
 import copy
+import itertools
 import json
 import uuid
 import datetime
@@ -535,12 +538,14 @@ class VncIfmapClient(VncIfmapClientGen):
             self.accumulator.append(requests)
             self.accumulated_request_len += len(requests)
             if self.accumulated_request_len >= 1024*1024:
+                # Reset the accumulator before publishing, the requests
+                # of other greenlets accumulate meanwhile
                 upd_str = \
                     ''.join(''.join(request) for request in \
-                        self._ifmap_db.accumulator)
-                self._publish_to_ifmap('update', upd_str, async=True)
+                        self.accumulator)
                 self.accumulator = []
                 self.accumulated_request_len = 0
+                self._publish_to_ifmap('update', upd_str, async=True)
         else:
             upd_str = ''.join(requests)
             self._publish_to_ifmap('update', upd_str, async=True)
@@ -648,6 +653,20 @@ class VncServerCassandraClient(VncCassandraClient):
     _USERAGENT_KEYSPACE_NAME = 'useragent'
     _USERAGENT_KV_CF_NAME = 'useragent_keyval_table'
 
+    # Token range of the partitioners whose ring can be split for a walk
+    _WALK_PARTITIONER_TOKENS = {
+        'org.apache.cassandra.dht.Murmur3Partitioner': (-2**63, 2**63 - 1),
+        'org.apache.cassandra.dht.RandomPartitioner': (-1, 2**127),
+    }
+    # Token ranges per walk worker, so that workers finishing early get
+    # more ranges to walk
+    _WALK_RANGES_PER_WORKER = 4
+    # Rows read per get_range page of a walk, their objects are read in
+    # one multiget per type
+    _WALK_ROW_COUNT = 100
+    # Objects walked between two progress logs
+    _WALK_PROGRESS_COUNT = 10000
+
     @classmethod
     def get_db_info(cls):
         db_info = VncCassandraClient.get_db_info() + \
@@ -655,14 +674,18 @@ class VncServerCassandraClient(VncCassandraClient):
         return db_info
     # end get_db_info
 
-    def __init__(self, db_client_mgr, cass_srv_list, reset_config, db_prefix):
+    def __init__(self, db_client_mgr, cass_srv_list, reset_config, db_prefix,
+                 walk_workers=1, cache_max_entries=None):
         self._db_client_mgr = db_client_mgr
+        self._walk_workers = walk_workers
+        self._walk_stats = {'ranges': 0, 'ranges_done': 0, 'objects': 0,
+                            'start_time': None}
         keyspaces = {
             self._USERAGENT_KEYSPACE_NAME: [(self._USERAGENT_KV_CF_NAME, None)]
         }
         super(VncServerCassandraClient, self).__init__(
             cass_srv_list, reset_config, db_prefix,keyspaces, self.config_log,
-            db_client_mgr.generate_url)
+            db_client_mgr.generate_url, cache_max_entries)
         self._useragent_kv_cf = self._cf_dict[self._USERAGENT_KV_CF_NAME]
     # end __init__
 
@@ -677,7 +700,8 @@ class VncServerCassandraClient(VncCassandraClient):
 
     def read(self, method_name, *args, **kwargs):
         method = getattr(self, '_cassandra_%s_read' % (method_name))
-        return method(*args, **kwargs)
+        with self.ref_names_batch():
+            return method(*args, **kwargs)
     # end read
 
     def update(self, method_name, *args, **kwargs):
@@ -873,17 +897,154 @@ class VncServerCassandraClient(VncCassandraClient):
         self._useragent_kv_cf.remove(key)
     # end useragent_kv_delete
 
-    def walk(self, fn):
+    def _walk_token_ranges(self, count):
+        # Split the token range of the partitioner in count ranges, or
+        # walk the whole ring at once when the partitioner is unknown
+        if count > 1:
+            try:
+                sys_mgr = SystemManager(self._server_list[0])
+                partitioner = sys_mgr.describe_partitioner()
+                sys_mgr.close()
+            except Exception as e:
+                partitioner = None
+                self.config_log("Cassandra walk: cannot read partitioner: %s"
+                                % (str(e)), level=SandeshLevel.SYS_WARN)
+            if partitioner in self._WALK_PARTITIONER_TOKENS:
+                (min_token, max_token) = \
+                    self._WALK_PARTITIONER_TOKENS[partitioner]
+                step = (max_token - min_token) // count
+                tokens = [min_token + i * step for i in range(count)]
+                tokens.append(max_token)
+                return [(str(tokens[i]), str(tokens[i + 1]))
+                        for i in range(count)]
+        return [(None, None)]
+    # end _walk_token_ranges
+
+    def _walk_rows(self, start_token, finish_token):
+        # Type column of the rows of a token range. Rows without one are
+        # kept, _walk_read tells deleted rows from objects missing a type
+        kwargs = {}
+        if start_token is not None:
+            kwargs = {'start_token': start_token,
+                      'finish_token': finish_token}
+        return self._obj_uuid_cf.get_range(
+            columns=['type'], filter_empty=False,
+            buffer_size=self._WALK_ROW_COUNT, **kwargs)
+    # end _walk_rows
+
+    def _walk_read(self, rows):
+        # Objects of rows, read in one multiget per type. An object missing
+        # from the multiget, or of a type whose multiget failed, is read
+        # alone for its error
+        obj_uuids_by_type = {}
+        # Deleted rows are seen by get_range until they are compacted,
+        # only the untyped rows left with other columns are broken objects
+        untyped = [obj_uuid for obj_uuid, obj_cols in rows
+                   if 'type' not in obj_cols]
+        untyped_cols = {}
+        if untyped:
+            untyped_cols = self._obj_uuid_cf.multiget(untyped, column_count=1)
+        for obj_uuid, obj_cols in rows:
+            if 'type' not in obj_cols and not untyped_cols.get(obj_uuid):
+                continue
+            try:
+                obj_type = json.loads(obj_cols['type'])
+            except Exception as e:
+                yield (obj_uuid, None, None, e)
+                continue
+            obj_uuids_by_type.setdefault(obj_type, []).append(obj_uuid)
+
+        for obj_type, obj_uuids in obj_uuids_by_type.items():
+            try:
+                (ok, obj_dicts) = self.read(obj_type, obj_uuids)
+                obj_dicts = dict((obj_dict['uuid'], obj_dict)
+                                 for obj_dict in obj_dicts)
+            except Exception:
+                obj_dicts = {}
+            for obj_uuid in obj_uuids:
+                obj_dict = obj_dicts.get(obj_uuid)
+                if obj_dict is None:
+                    try:
+                        (ok, obj_dicts_one) = self.read(obj_type, [obj_uuid])
+                        obj_dict = obj_dicts_one[0]
+                    except Exception as e:
+                        yield (obj_uuid, obj_type, None, e)
+                        continue
+                yield (obj_uuid, obj_type, obj_dict, None)
+    # end _walk_read
+
+    def _walk_range(self, token_range, fn, walk_results):
+        stats = self._walk_stats
+        rows = []
+        for row in itertools.chain(self._walk_rows(*token_range), [None]):
+            if row is not None:
+                rows.append(row)
+                if len(rows) < self._WALK_ROW_COUNT:
+                    continue
+            for (obj_uuid, obj_type, obj_dict, error) in self._walk_read(rows):
+                result = fn(obj_uuid, obj_type, obj_dict, error)
+                if result:
+                    walk_results.append(result)
+                stats['objects'] += 1
+                if stats['objects'] % self._WALK_PROGRESS_COUNT == 0:
+                    self._walk_progress_log()
+            rows = []
+        stats['ranges_done'] += 1
+    # end _walk_range
+
+    def _walk_progress_log(self):
+        stats = self._walk_stats
+        elapsed = time.time() - stats['start_time']
+        self.config_log("Cassandra walk: %d objects, %d/%d token ranges "
+                        "in %.1f seconds"
+                        % (stats['objects'], stats['ranges_done'],
+                           stats['ranges'], elapsed),
+                        level=SandeshLevel.SYS_INFO)
+    # end _walk_progress_log
+
+    def walk_stats(self):
+        return dict(self._walk_stats)
+    # end walk_stats
+
+    def walk(self, fn, workers=None):
+        # Walk the objects of obj_uuid_table, the token ring being split in
+        # ranges walked concurrently by a pool of workers greenlets. fn is
+        # called with the uuid, type and dict of each object, or with the
+        # exception raised reading it
+        workers = workers or self._walk_workers
+        token_ranges = self._walk_token_ranges(
+            workers * self._WALK_RANGES_PER_WORKER)
+        self._walk_stats = {'ranges': len(token_ranges), 'ranges_done': 0,
+                            'objects': 0, 'start_time': time.time()}
         walk_results = []
-        for obj_uuid, _ in self._obj_uuid_cf.get_range():
-            obj_cols_iter = self._obj_uuid_cf.xget(obj_uuid)
-            obj_cols = dict((k, v) for k, v in obj_cols_iter)
-            result = fn(obj_uuid, obj_cols)
-            if result:
-                walk_results.append(result)
+        pool = gevent.pool.Pool(workers)
+        for token_range in token_ranges:
+            pool.spawn(self._walk_range, token_range, fn, walk_results)
+        try:
+            pool.join(raise_error=True)
+        except Exception:
+            pool.kill()
+            raise
+        self._walk_progress_log()
 
         return walk_results
     # end walk
+
+    def fq_name_parent_counts(self, obj_type):
+        # Number of objects of obj_type per parent fq_name string, read
+        # from the fq_name table
+        counts = {}
+        try:
+            col_infos = self._obj_fq_name_cf.xget(obj_type.replace('-', '_'))
+            for (col_name, col_val) in col_infos:
+                fq_name_str = utils.decode_string(col_name.rsplit(':', 1)[0])
+                parent_fq_name_str = ':'.join(fq_name_str.split(':')[:-1])
+                counts[parent_fq_name_str] = \
+                    counts.get(parent_fq_name_str, 0) + 1
+        except pycassa.NotFoundException:
+            pass
+        return counts
+    # end fq_name_parent_counts
 # end class VncCassandraClient
 
 
@@ -895,6 +1056,8 @@ class VncServerKombuClient(VncKombuClient):
         self._ifmap_db = ifmap_db
         listen_port = db_client_mgr.get_server_port()
         q_name = 'vnc_config.%s-%s' %(socket.gethostname(), listen_port)
+        # set in the notifications published by this server
+        self._origin = q_name
         super(VncServerKombuClient, self).__init__(
             rabbit_ip, rabbit_port, rabbit_user, rabbit_password, rabbit_vhost,
             q_name, self._dbe_subscribe_callback, self.config_log)
@@ -980,7 +1143,8 @@ class VncServerKombuClient(VncKombuClient):
         oper_info = {'request-id': req_id,
                      'oper': 'CREATE',
                      'type': obj_type,
-                     'obj_dict': obj_dict}
+                     'obj_dict': obj_dict,
+                     'origin': self._origin}
         oper_info.update(obj_ids)
         self._obj_update_q_put(oper_info)
     # end dbe_create_publish
@@ -988,6 +1152,15 @@ class VncServerKombuClient(VncKombuClient):
     def _dbe_create_notification(self, obj_info):
         obj_dict = obj_info['obj_dict']
 
+        # quota counts of local creates are updated by dbe_create
+        if obj_info.get('origin') != self._origin:
+            QuotaHelper.count_update(obj_info['type'], obj_dict, 1)
+
+        # the name may have been held by an object deleted meanwhile
+        self._db_client_mgr._cassandra_db.cache_uuid_to_fq_name_add(
+            obj_dict['uuid'], obj_dict['fq_name'],
+            obj_info['type'].replace('-', '_'))
+
         try:
             r_class = self._db_client_mgr.get_resource_class(obj_info['type'])
             if r_class:
@@ -1005,8 +1178,12 @@ class VncServerKombuClient(VncKombuClient):
                 raise Exception(result)
     #end _dbe_create_notification
 
-    def dbe_update_publish(self, obj_type, obj_ids):
-        oper_info = {'oper': 'UPDATE', 'type': obj_type}
+    def dbe_update_publish(self, obj_type, obj_ids, quota_move=None):
+        oper_info = {'oper': 'UPDATE', 'type': obj_type,
+                     'origin': self._origin}
+        if quota_move:
+            # old and new project refs of an object counted through a ref
+            oper_info['quota_move'] = quota_move
         oper_info.update(obj_ids)
         self._obj_update_q_put(oper_info)
     # end dbe_update_publish
@@ -1018,6 +1195,10 @@ class VncServerKombuClient(VncKombuClient):
 
         new_obj_dict = result
 
+        if (obj_info.get('quota_move') and
+                obj_info.get('origin') != self._origin):
+            QuotaHelper.count_move(obj_info['type'], *obj_info['quota_move'])
+
         try:
             r_class = self._db_client_mgr.get_resource_class(obj_info['type'])
             if r_class:
@@ -1037,7 +1218,8 @@ class VncServerKombuClient(VncKombuClient):
     #end _dbe_update_notification
 
     def dbe_delete_publish(self, obj_type, obj_ids, obj_dict):
-        oper_info = {'oper': 'DELETE', 'type': obj_type, 'obj_dict': obj_dict}
+        oper_info = {'oper': 'DELETE', 'type': obj_type, 'obj_dict': obj_dict,
+                     'origin': self._origin}
         oper_info.update(obj_ids)
         self._obj_update_q_put(oper_info)
     # end dbe_delete_publish
@@ -1045,6 +1227,9 @@ class VncServerKombuClient(VncKombuClient):
     def _dbe_delete_notification(self, obj_info):
         obj_dict = obj_info['obj_dict']
 
+        if obj_info.get('origin') != self._origin:
+            QuotaHelper.count_update(obj_info['type'], obj_dict, -1)
+
         db_client_mgr = self._db_client_mgr
         db_client_mgr._cassandra_db.cache_uuid_to_fq_name_del(obj_dict['uuid'])
 
@@ -1108,11 +1293,21 @@ class VncZkClient(object):
         if subnet not in self._subnet_allocators:
             if addr_from_start is None:
                 addr_from_start = False
-            self._subnet_allocators[subnet] = IndexAllocator(
-                self._zk_client, self._subnet_path+'/'+subnet+'/',
-                size=0, start_idx=0, reverse=not addr_from_start,
-                alloc_list=subnet_alloc_list,
-		max_alloc=self._MAX_SUBNET_ADDR_ALLOC)
+            subnet_size = sum(alloc['end'] - alloc['start'] + 1
+                              for alloc in subnet_alloc_list)
+            if subnet_size > self._MAX_SUBNET_ADDR_ALLOC:
+                # keep the addresses of large subnets as ranges, all of
+                # the subnet can be allocated
+                self._subnet_allocators[subnet] = RangeIndexAllocator(
+                    self._zk_client, self._subnet_path+'/'+subnet+'/',
+                    size=0, start_idx=0, reverse=not addr_from_start,
+                    alloc_list=subnet_alloc_list)
+            else:
+                self._subnet_allocators[subnet] = IndexAllocator(
+                    self._zk_client, self._subnet_path+'/'+subnet+'/',
+                    size=0, start_idx=0, reverse=not addr_from_start,
+                    alloc_list=subnet_alloc_list,
+                    max_alloc=self._MAX_SUBNET_ADDR_ALLOC)
     # end create_subnet_allocator
 
     def delete_subnet_allocator(self, subnet):
@@ -1150,6 +1345,17 @@ class VncZkClient(object):
             allocator.delete(addr)
     # end subnet_free_req
 
+    def subnet_alloc_block_req(self, subnet, count):
+        allocator = self._get_subnet_allocator(subnet)
+        return allocator.alloc_block(count)
+    # end subnet_alloc_block_req
+
+    def subnet_free_block_req(self, subnet, addrs):
+        allocator = self._get_subnet_allocator(subnet)
+        if allocator:
+            allocator.delete_block(addrs)
+    # end subnet_free_block_req
+
     def create_fq_name_to_uuid_mapping(self, obj_type, fq_name, id):
         fq_name_str = ':'.join(fq_name)
         zk_path = self._fq_name_to_uuid_path+'/%s:%s' %(obj_type.replace('-', '_'),
@@ -1206,7 +1412,9 @@ class VncDbClient(object):
         self.config_log(msg, level=SandeshLevel.SYS_NOTICE)
 
         self._cassandra_db = VncServerCassandraClient(
-            self, cass_srv_list, reset_config, db_prefix)
+            self, cass_srv_list, reset_config, db_prefix,
+            int(api_svr_mgr._args.db_walk_workers),
+            int(api_svr_mgr._args.object_cache_entries))
 
         msg = "Connecting to zookeeper on %s" % (zk_server_ip)
         self.config_log(msg, level=SandeshLevel.SYS_NOTICE)
@@ -1237,6 +1445,16 @@ class VncDbClient(object):
         self.dbe_update('project', {'uuid':proj_id}, proj_dict)
     # end _update_default_quota
 
+    def _quota_counts_resync(self):
+        # Objects counted in their project through a back ref, not as a
+        # child, cannot be counted from the fq_name table
+        for obj_type, field in QuotaHelper.count_fields.items():
+            if field.endswith('_back_refs'):
+                continue
+            QuotaHelper.counts_resync(
+                obj_type, self._cassandra_db.fq_name_parent_counts(obj_type))
+    # end _quota_counts_resync
+
     def db_resync(self):
         # Read contents from cassandra and publish to ifmap
         mapclient = self._ifmap_db._mapclient
@@ -1244,9 +1462,11 @@ class VncDbClient(object):
         self._ifmap_db.accumulated_request_len = 0
         start_time = datetime.datetime.utcnow()
         self._cassandra_db.walk(self._dbe_resync)
-        self.config_log("Cassandra DB walk completed.",
+        self.config_log("Cassandra DB walk completed: %d objects."
+            % (self._cassandra_db.walk_stats()['objects']),
             level=SandeshLevel.SYS_INFO)
         self._ifmap_db.publish_accumulated()
+        self._quota_counts_resync()
         self._update_default_quota()
         end_time = datetime.datetime.utcnow()
         msg = "Time elapsed in syncing ifmap: %s" % (str(end_time - start_time))
@@ -1346,12 +1566,10 @@ class VncDbClient(object):
                                                                  vn_dict)
     # end update_subnet_uuid
 
-    def _dbe_resync(self, obj_uuid, obj_cols):
-        obj_type = None
+    def _dbe_resync(self, obj_uuid, obj_type, obj_dict, error):
         try:
-            obj_type = json.loads(obj_cols['type'])
-            (ok, obj_dicts) = self._cassandra_db.read(obj_type, [obj_uuid])
-            obj_dict = obj_dicts[0]
+            if error:
+                raise error
 
             # TODO remove backward compat (use RT instead of VN->LR ref)
             if (obj_type == 'virtual_network' and
@@ -1390,26 +1608,18 @@ class VncDbClient(object):
             return
     # end _dbe_resync
 
-    def _dbe_check(self, obj_uuid, obj_cols):
-        obj_type = None
-        try:
-            obj_type = json.loads(obj_cols['type'])
-            (ok, obj_dict) = self._cassandra_db.read(obj_type, [obj_uuid])
-        except Exception as e:
-            return {'uuid': obj_uuid, 'type': obj_type, 'error': str(e)}
+    def _dbe_check(self, obj_uuid, obj_type, obj_dict, error):
+        if error:
+            return {'uuid': obj_uuid, 'type': obj_type, 'error': str(error)}
     # end _dbe_check
 
-    def _dbe_read(self, obj_uuid, obj_cols):
-        obj_type = None
-        try:
-            obj_type = json.loads(obj_cols['type'])
-            (ok, obj_dict) = self._cassandra_db.read(obj_type, [obj_uuid])
-            result_dict = obj_dict[0]
-            result_dict['type'] = obj_type
-            result_dict['uuid'] = obj_uuid
-            return result_dict
-        except Exception as e:
-            return {'uuid': obj_uuid, 'type': obj_type, 'error': str(e)}
+    def _dbe_read(self, obj_uuid, obj_type, obj_dict, error):
+        if error:
+            return {'uuid': obj_uuid, 'type': obj_type, 'error': str(error)}
+        result_dict = obj_dict
+        result_dict['type'] = obj_type
+        result_dict['uuid'] = obj_uuid
+        return result_dict
     # end _dbe_read
 
     @ignore_exceptions
@@ -1476,6 +1686,12 @@ class VncDbClient(object):
     def dbe_create(self, obj_type, obj_ids, obj_dict):
         method_name = obj_type.replace('-', '_')
         (ok, result) = self._cassandra_db.create(method_name, obj_ids, obj_dict)
+        if ok:
+            QuotaHelper.count_update(obj_type, obj_dict, 1)
+            # the name may still map to a deleted object in the cache,
+            # other servers update theirs on the create notification
+            self._cassandra_db.cache_uuid_to_fq_name_add(
+                obj_ids['uuid'], obj_dict['fq_name'], method_name)
 
         # publish to ifmap via msgbus
         self._msgbus.dbe_create_publish(obj_type, obj_ids, obj_dict)
@@ -1519,10 +1735,28 @@ class VncDbClient(object):
     @dbe_trace('update')
     def dbe_update(self, obj_type, obj_ids, new_obj_dict):
         method_name = obj_type.replace('-', '_')
+        # quota counts follow a change of the project ref
+        ref_field = QuotaHelper.count_ref_fields.get(obj_type)
+        old_refs = None
+        if ref_field and ref_field in new_obj_dict:
+            (ok, result) = self.dbe_read(obj_type, obj_ids,
+                                         obj_fields=[ref_field])
+            if ok:
+                old_refs = {ref_field: result.get(ref_field, [])}
+
         (ok, cassandra_result) = self._cassandra_db.update(method_name, obj_ids['uuid'], new_obj_dict)
 
+        quota_move = None
+        if ok and old_refs is not None:
+            (read_ok, result) = self.dbe_read(obj_type, obj_ids,
+                                              obj_fields=[ref_field])
+            if read_ok:
+                new_refs = {ref_field: result.get(ref_field, [])}
+                if QuotaHelper.count_move(obj_type, old_refs, new_refs):
+                    quota_move = [old_refs, new_refs]
+
         # publish to ifmap via redis
-        self._msgbus.dbe_update_publish(obj_type, obj_ids)
+        self._msgbus.dbe_update_publish(obj_type, obj_ids, quota_move)
 
         return (ok, cassandra_result)
     # end dbe_update
@@ -1541,6 +1775,11 @@ class VncDbClient(object):
     def dbe_delete(self, obj_type, obj_ids, obj_dict):
         method_name = obj_type.replace('-', '_')
         (ok, cassandra_result) = self._cassandra_db.delete(method_name, obj_ids['uuid'])
+        if ok:
+            QuotaHelper.count_update(obj_type, obj_dict, -1)
+            # not left to the delete notification, which comes late or
+            # not at all while rabbit is down
+            self._cassandra_db.cache_uuid_to_fq_name_del(obj_ids['uuid'])
 
         # publish to ifmap via redis
         self._msgbus.dbe_delete_publish(obj_type, obj_ids, obj_dict)
@@ -1588,6 +1827,14 @@ class VncDbClient(object):
         self._zk_db.subnet_free_req(subnet, addr)
     # end subnet_free_req
 
+    def subnet_alloc_block_req(self, subnet, count):
+        return self._zk_db.subnet_alloc_block_req(subnet, count)
+    # end subnet_alloc_block_req
+
+    def subnet_free_block_req(self, subnet, addrs):
+        self._zk_db.subnet_free_block_req(subnet, addrs)
+    # end subnet_free_block_req
+
     def subnet_create_allocator(self, subnet, subnet_alloc_list,
                                 addr_from_start):
         self._zk_db.create_subnet_allocator(subnet, subnet_alloc_list,
@@ -1620,6 +1867,14 @@ class VncDbClient(object):
         return self._cassandra_db.uuid_to_obj_type(obj_uuid)
     # end uuid_to_obj_type
 
+    def uuids_to_obj_types(self, obj_uuids):
+        return self._cassandra_db.uuids_to_obj_types(obj_uuids)
+    # end uuids_to_obj_types
+
+    def exclude_ref_names(self, exclude):
+        self._cassandra_db.exclude_ref_names(exclude)
+    # end exclude_ref_names
+
     def ifmap_id_to_fq_name(self, ifmap_id):
         return self._ifmap_db.ifmap_id_to_fq_name(ifmap_id)
     # end ifmap_id_to_fq_name
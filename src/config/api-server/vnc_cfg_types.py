@@ -74,19 +74,13 @@ class FloatingIpServer(FloatingIpServerGen):
             proj_uuid = proj_dict['uuid']
         else:
             proj_uuid = db_conn.fq_name_to_uuid('project', proj_dict['to'])
-        (ok, proj_dict) = QuotaHelper.get_project_dict(proj_uuid, db_conn)
+        # the project is counted for quota by its fq_name
+        if 'to' not in proj_dict:
+            proj_dict['to'] = db_conn.uuid_to_fq_name(proj_uuid)
+        (ok, result) = QuotaHelper.verify_quota_for_create(
+            proj_dict['to'], proj_uuid, 'floating-ip', obj_dict, db_conn)
         if not ok:
-            return (False, (500, 'Internal error : ' + pformat(proj_dict)))
-
-        obj_type = 'floating-ip'
-
-        if 'floating_ip_back_refs' in proj_dict:
-            quota_count = len(proj_dict['floating_ip_back_refs'])
-            if obj_dict['id_perms'].get('user_visible', True) is not False:
-                (ok, quota_limit) = QuotaHelper.check_quota_limit(proj_dict, obj_type,
-                                                                  quota_count)
-                if not ok:
-                    return (False, (403, pformat(obj_dict['fq_name']) + ' : ' + quota_limit))
+            return (False, result)
 
         vn_fq_name = obj_dict['fq_name'][:-2]
         req_ip = obj_dict.get("floating_ip_address")
@@ -313,18 +307,10 @@ class LogicalRouterServer(LogicalRouterServerGen):
         except cfgm_common.exceptions.NoIdError:
             return (False, (500, 'No Project ID error : ' + proj_uuid))
 
-        (ok, proj_dict) = QuotaHelper.get_project_dict(proj_uuid, db_conn)
+        (ok, result) = QuotaHelper.verify_quota_for_create(
+            fq_name[0:2], proj_uuid, 'logical-router', obj_dict, db_conn)
         if not ok:
-            return (False, (500, 'Internal error : ' + pformat(proj_dict)))
-
-        obj_type = 'logical-router'
-        if 'logical_routers' in proj_dict:
-            quota_count = len(proj_dict['logical_routers'])
-            if obj_dict['id_perms'].get('user_visible', True) is not False:
-                (ok, quota_limit) = QuotaHelper.check_quota_limit(proj_dict, obj_type,
-                                                                  quota_count)
-                if not ok:
-                    return (False, (403, pformat(obj_dict['fq_name']) + ' : ' + quota_limit))
+            return (False, result)
         return True, ""
     # end http_post_collection
 
@@ -348,18 +334,11 @@ class VirtualMachineInterfaceServer(VirtualMachineInterfaceServerGen):
             return (False, (500, 'Internal error : ' + pformat(vn_dict)))
 
         proj_uuid = vn_dict['parent_uuid']
-        (ok, proj_dict) = QuotaHelper.get_project_dict(proj_uuid, db_conn)
+        (ok, result) = QuotaHelper.verify_quota_for_create(
+            vn_dict['fq_name'][:-1], proj_uuid, 'virtual-machine-interface',
+            obj_dict, db_conn)
         if not ok:
-            return (False, (500, 'Internal error : ' + pformat(proj_dict)))
-
-        obj_type = 'virtual-machine-interface'
-        if 'virtual_machine_interfaces' in proj_dict:
-            quota_count = len(proj_dict['virtual_machine_interfaces'])
-            if obj_dict['id_perms'].get('user_visible', True) is not False:
-                (ok, quota_limit) = QuotaHelper.check_quota_limit(proj_dict, obj_type,
-                                                                  quota_count)
-                if not ok:
-                    return (False, (403, pformat(obj_dict['fq_name']) + ' : ' + quota_limit))
+            return (False, result)
 
         inmac = None
         if 'virtual_machine_interface_mac_addresses' in obj_dict:
@@ -450,18 +429,10 @@ class VirtualNetworkServer(VirtualNetworkServerGen):
         except cfgm_common.exceptions.NoIdError:
             return (False, (500, 'No Project ID error : ' + proj_uuid))
 
-        (ok, proj_dict) = QuotaHelper.get_project_dict(proj_uuid, db_conn)
+        (ok, result) = QuotaHelper.verify_quota_for_create(
+            fq_name[0:2], proj_uuid, 'virtual-network', obj_dict, db_conn)
         if not ok:
-            return (False, (500, 'Internal error : ' + pformat(proj_dict)))
-
-        obj_type = 'virtual-network'
-        if 'virtual_networks' in proj_dict:
-            quota_count = len(proj_dict['virtual_networks'])
-            if obj_dict['id_perms'].get('user_visible', True) is not False:
-                (ok, quota_limit) = QuotaHelper.check_quota_limit(proj_dict, obj_type,
-                                                                  quota_count)
-                if not ok:
-                    return (False, (403, pformat(obj_dict['fq_name']) + ' : ' + quota_limit))
+            return (False, result)
 
         db_conn.update_subnet_uuid(obj_dict)
 
@@ -561,8 +532,8 @@ class VirtualNetworkServer(VirtualNetworkServerGen):
 
     @classmethod
     def ip_alloc(cls, vn_fq_name, subnet_name, count):
-        ip_list = [cls.addr_mgmt.ip_alloc_req(vn_fq_name, subnet_name)
-                   for i in range(count)]
+        ip_list = cls.addr_mgmt.ip_alloc_block_req(vn_fq_name, subnet_name,
+                                                   count)
         msg = 'AddrMgmt: reserve %d IP for vn=%s, subnet=%s - %s' \
             % (count, vn_fq_name, subnet_name if subnet_name else '', ip_list)
         cls.addr_mgmt.config_log(msg, level=SandeshLevel.SYS_DEBUG)
@@ -574,8 +545,7 @@ class VirtualNetworkServer(VirtualNetworkServerGen):
         msg = 'AddrMgmt: release IP %s for vn=%s, subnet=%s' \
             % (ip_list, vn_fq_name, subnet_name if subnet_name else '')
         cls.addr_mgmt.config_log(msg, level=SandeshLevel.SYS_DEBUG)
-        for ip_addr in ip_list:
-            cls.addr_mgmt.ip_free_req(ip_addr, vn_fq_name, subnet_name)
+        cls.addr_mgmt.ip_free_block_req(ip_list, vn_fq_name, subnet_name)
     # end ip_free
 
     @classmethod
@@ -927,18 +897,10 @@ class SecurityGroupServer(SecurityGroupServerGen):
         except cfgm_common.exceptions.NoIdError:
             return (False, (500, 'No Project ID error : ' + proj_uuid))
 
-        (ok, proj_dict) = QuotaHelper.get_project_dict(proj_uuid, db_conn)
+        (ok, result) = QuotaHelper.verify_quota_for_create(
+            fq_name[0:2], proj_uuid, 'security-group', obj_dict, db_conn)
         if not ok:
-            return (False, (500, 'Internal error : ' + pformat(proj_dict)))
-
-        obj_type = 'security-group'
-        if 'security_groups' in proj_dict:
-            quota_count = len(proj_dict['security_groups'])
-            if obj_dict['id_perms'].get('user_visible', True) is not False:
-                (ok, quota_limit) = QuotaHelper.check_quota_limit(proj_dict, obj_type,
-                                                                  quota_count)
-                if not ok:
-                    return (False, (403, pformat(obj_dict['fq_name']) + ' : ' + quota_limit))
+            return (False, result)
 
         _check_policy_rule_uuid(obj_dict.get('security_group_entries'))
 
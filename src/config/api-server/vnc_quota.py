@@ -1,4 +1,5 @@
 import copy
+from pprint import pformat
 from gen.resource_xsd import *
 from gen.resource_common import *
 from gen.resource_server import *
@@ -9,11 +10,109 @@ class QuotaHelper(object):
         'defaults': -1
         }
 
+    # Project field listing the objects of each type counted for quota
+    count_fields = {
+        'floating-ip': 'floating_ip_back_refs',
+        'logical-router': 'logical_routers',
+        'security-group': 'security_groups',
+        'virtual-machine-interface': 'virtual_machine_interfaces',
+        'virtual-network': 'virtual_networks',
+        }
+
+    # Ref to the project of the types counted through a ref, not as a child
+    count_ref_fields = {
+        'floating-ip': 'project_refs',
+        }
+
+    # Number of objects of each type per project fq_name string. Types
+    # resynced from the db count all the projects, the counts of other
+    # types are read from the project on first use
+    _counts = dict((obj_type, {}) for obj_type in count_fields)
+    _resynced_types = set()
+
     @classmethod
-    def get_project_dict(cls, proj_uuid, db_conn):
-        (ok, proj_dict) = db_conn.dbe_read('project', {'uuid': proj_uuid})
+    def get_project_dict(cls, proj_uuid, db_conn, obj_fields=None):
+        (ok, proj_dict) = db_conn.dbe_read('project', {'uuid': proj_uuid},
+                                           obj_fields=obj_fields)
         return (ok, proj_dict)
 
+    @classmethod
+    def counts_resync(cls, obj_type, counts):
+        cls._counts[obj_type] = counts
+        cls._resynced_types.add(obj_type)
+
+    @classmethod
+    def _count_project(cls, obj_type, obj_dict):
+        # fq_name string of the project an object is counted in
+        ref_field = cls.count_ref_fields.get(obj_type)
+        if ref_field:
+            proj_refs = obj_dict.get(ref_field)
+            if not proj_refs or 'to' not in proj_refs[0]:
+                return None
+            return ':'.join(proj_refs[0]['to'])
+        fq_name = obj_dict.get('fq_name')
+        if not fq_name:
+            return None
+        return ':'.join(fq_name[:-1])
+
+    @classmethod
+    def count_update(cls, obj_type, obj_dict, delta):
+        counts = cls._counts.get(obj_type)
+        if counts is None:
+            return
+        proj_fq_name_str = cls._count_project(obj_type, obj_dict)
+        if proj_fq_name_str is None:
+            return
+        if proj_fq_name_str in counts:
+            counts[proj_fq_name_str] = max(counts[proj_fq_name_str] + delta, 0)
+        elif obj_type in cls._resynced_types and delta > 0:
+            counts[proj_fq_name_str] = delta
+
+    @classmethod
+    def count_move(cls, obj_type, old_obj_dict, new_obj_dict):
+        # An update changed the project ref of an object counted through a
+        # ref, its count moves from the old to the new project
+        if (cls._count_project(obj_type, old_obj_dict) ==
+                cls._count_project(obj_type, new_obj_dict)):
+            return False
+        cls.count_update(obj_type, old_obj_dict, -1)
+        cls.count_update(obj_type, new_obj_dict, 1)
+        return True
+
+    @classmethod
+    def get_quota_count(cls, proj_fq_name, proj_uuid, obj_type, db_conn):
+        counts = cls._counts[obj_type]
+        proj_fq_name_str = ':'.join(proj_fq_name)
+        if proj_fq_name_str not in counts:
+            if obj_type in cls._resynced_types:
+                return 0
+            field = cls.count_fields[obj_type]
+            (ok, proj_dict) = cls.get_project_dict(proj_uuid, db_conn,
+                                                   obj_fields=[field])
+            if not ok:
+                return 0
+            counts[proj_fq_name_str] = len(proj_dict.get(field, []))
+        return counts[proj_fq_name_str]
+
+    @classmethod
+    def verify_quota_for_create(cls, proj_fq_name, proj_uuid, obj_type,
+                                obj_dict, db_conn):
+        (ok, proj_dict) = cls.get_project_dict(proj_uuid, db_conn,
+                                               obj_fields=['quota'])
+        if not ok:
+            return (False, (500, 'Internal error : ' + pformat(proj_dict)))
+        if obj_dict['id_perms'].get('user_visible', True) is False:
+            return (True, '')
+
+        quota_count = cls.get_quota_count(proj_fq_name, proj_uuid, obj_type,
+                                          db_conn)
+        (ok, quota_limit) = cls.check_quota_limit(proj_dict, obj_type,
+                                                  quota_count)
+        if not ok:
+            return (False, (403, pformat(obj_dict['fq_name']) + ' : ' +
+                            quota_limit))
+        return (True, '')
+
     @classmethod
     def get_quota_limit(cls, proj_dict, obj_type):
         quota = proj_dict.get('quota') or cls.default_quota
@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+
+#
+# Copyright (c) 2015 Juniper Networks, Inc. All rights reserved.
+#
+
+#
+# Index Allocator Benchmark
+#
+# Times the bitmap IndexAllocator against RangeIndexAllocator, on an in
+# memory zookeeper client:
+#   - allocation of --count indexes
+#   - reload of the allocated indexes by a new allocator
+#   - freeing every --stride-th index and allocating them again
+#
+#   index_allocator_bench.py --count 1000000
+#
+
+import sys
+import time
+import argparse
+
+from cfgm_common.zkclient import IndexAllocator, RangeIndexAllocator
+from test_zkclient import FakeZookeeperClient
+
+
+def timed(fn, *args):
+    start = time.time()
+    res = fn(*args)
+    return res, time.time() - start
+
+
+def alloc_all(allocator, count):
+    return [allocator.alloc() for i in range(count)]
+
+
+def load(cls, zk_client, args):
+    # The bitmap is loaded by the constructor, the ranges on first use
+    allocator = cls(zk_client, '/id/', size=args.size, reverse=args.reverse)
+    allocator.alloc()
+    return allocator
+
+
+def free_alloc(allocator, idxs):
+    for idx in idxs:
+        allocator.delete(idx)
+    return sorted(alloc_all(allocator, len(idxs)))
+
+
+def bench(cls, args):
+    zk_client = FakeZookeeperClient()
+    allocator = cls(zk_client, '/id/', size=args.size, reverse=args.reverse)
+    idxs, alloc_time = timed(alloc_all, allocator, args.count)
+
+    allocator, load_time = timed(load, cls, zk_client, args)
+
+    freed = idxs[::args.stride]
+    realloc, realloc_time = timed(free_alloc, allocator, freed)
+    print '%-20s alloc %8.2f s  load %8.2f s  free+alloc %8.2f s' % \
+        (cls.__name__, alloc_time, load_time, realloc_time)
+    return idxs, realloc
+
+
+def main(args_str=' '.join(sys.argv[1:])):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--count', type=int, default=1000000,
+        help='Number of indexes to allocate')
+    parser.add_argument('--size', type=int, default=2 ** 24,
+        help='Size of the allocator')
+    parser.add_argument('--stride', type=int, default=100,
+        help='Free one allocated index out of stride')
+    parser.add_argument('--reverse', action='store_true')
+    args = parser.parse_args(args_str.split())
+
+    old = bench(IndexAllocator, args)
+    new = bench(RangeIndexAllocator, args)
+    if old != new:
+        print 'Allocated indexes differ'
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,3 +1,5 @@
 from test_analytics_client import *
 from test_importutils import *
+from test_zkclient import *
+from test_vnc_cassandra import *
 from fake import *
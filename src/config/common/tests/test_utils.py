@@ -96,8 +96,15 @@ class FakeCF(object):
     # end __init__
 
     def get_range(self, *args, **kwargs):
-        for key in self._rows:
-            yield (key, self.get(key))
+        # rows without columns stand for deleted rows not yet compacted,
+        # returned as empty rows when filter_empty is False
+        columns = kwargs.get('columns')
+        for key in self._rows.keys():
+            col_dict = dict((col_name, col_value[0]) for col_name, col_value
+                            in self._rows[key].items()
+                            if not columns or col_name in columns)
+            if col_dict or not kwargs.get('filter_empty', True):
+                yield (key, col_dict)
     # end get_range
 
     def get(
@@ -139,9 +146,14 @@ class FakeCF(object):
             try:
                 result[key] = {}
                 for col_name in self._rows[key]:
+                    if columns and col_name not in columns:
+                        continue
                     if column_start and column_start not in col_name:
                         continue
-                    result[key][col_name] = copy.deepcopy(self._rows[key][col_name])
+                    col_value = copy.deepcopy(self._rows[key][col_name])
+                    if not include_timestamp:
+                        col_value = col_value[0]
+                    result[key][col_name] = col_value
             except KeyError:
                 pass
 
@@ -839,6 +851,51 @@ class FakeKazooClient(object):
                     del self._values[path_key]
     # end delete
 
+    def ensure_path(self, path):
+        pass
+    # end ensure_path
+
+    def transaction(self):
+        return FakeKazooTransaction(self)
+    # end transaction
+
+class FakeKazooTransaction(object):
+    def __init__(self, client):
+        self._client = client
+        self._ops = []
+    # end __init__
+
+    def create(self, path, value=''):
+        self._ops.append(('create', path, value))
+    # end create
+
+    def delete(self, path):
+        self._ops.append(('delete', path, None))
+    # end delete
+
+    def commit(self):
+        results = []
+        for (op, path, value) in self._ops:
+            if op == 'create' and path in self._client._values:
+                results.append(kazoo.exceptions.NodeExistsError())
+            elif op == 'delete' and path not in self._client._values:
+                results.append(kazoo.exceptions.NoNodeError())
+            else:
+                results.append(None)
+        if any(results):
+            return [result or kazoo.exceptions.RolledBackError()
+                    for result in results]
+
+        for (op, path, value) in self._ops:
+            if op == 'create':
+                self._client.create(path, value)
+            else:
+                self._client.delete(path)
+        return [path if op == 'create' else True
+                for (op, path, value) in self._ops]
+    # end commit
+# end class FakeKazooTransaction
+
 class ZookeeperClientMock(object):
 
     def __init__(self, *args, **kwargs):
@@ -914,6 +971,7 @@ class ZookeeperClientMock(object):
 class FakeNetconfManager(object):
     def __init__(self, *args, **kwargs):
         self.configs = []
+        self.connected = True
 
     def __enter__(self):
         return self
@@ -923,8 +981,65 @@ class FakeNetconfManager(object):
         self.configs.append(config)
 
     commit = stub
+    discard_changes = stub
+    close_session = stub
 # end FakeNetconfManager
 
 netconf_managers = {}
 def fake_netconf_connect(host, *args, **kwargs):
     return netconf_managers.setdefault(host, FakeNetconfManager(args, kwargs))
+
+def _netconf_config_find(running, elem):
+    for child in running:
+        if child.tag != elem.tag:
+            continue
+        # leaf values are kept apart, as in a leaf-list
+        if len(elem) == 0 and elem.text is not None:
+            if len(child) == 0 and child.text == elem.text:
+                return child
+        elif child.findtext('name') == elem.findtext('name'):
+            return child
+    return None
+# end _netconf_config_find
+
+def netconf_config_apply(running, edit):
+    """Apply the edit of a merge edit-config to running, as a router does"""
+    for child in edit:
+        operation = child.get('operation')
+        if operation == 'delete':
+            name = child.findtext('name')
+            for prev in list(running):
+                if prev.tag == child.tag and (name is None or
+                                              prev.findtext('name') == name):
+                    running.remove(prev)
+            continue
+        child = copy.deepcopy(child)
+        child.attrib.pop('operation', None)
+        prev = _netconf_config_find(running, child)
+        if prev is None:
+            running.append(child)
+        elif operation == 'replace':
+            running.replace(prev, child)
+        else:
+            netconf_config_apply(prev, child)
+    return running
+# end netconf_config_apply
+
+def netconf_config_replay(configs):
+    """Config of a router after the configs sent to it, merged in turn.
+
+    A delete of the contrail group is returned as sent, the config sent
+    after it starts over.
+    """
+    def is_delete(config):
+        group = config.find('configuration/groups')
+        return group is not None and group.get('operation') == 'delete'
+    running = None
+    for config in configs:
+        config = etree.fromstring(config)
+        if running is None or is_delete(running) or is_delete(config):
+            running = config
+        else:
+            netconf_config_apply(running, config)
+    return etree.tostring(running)
+# end netconf_config_replay
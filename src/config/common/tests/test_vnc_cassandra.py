@@ -0,0 +1,123 @@
+#
+# Copyright (c) 2015 Juniper Networks, Inc. All rights reserved.
+#
+
+import json
+import unittest
+
+import gevent.local
+
+from cfgm_common.exceptions import NoIdError
+from cfgm_common.vnc_cassandra import ObjectNameCache, VncCassandraClient
+
+
+class TestObjectNameCache(unittest.TestCase):
+
+    def test_lookups(self):
+        cache = ObjectNameCache(10)
+        cache.add('uuid-1', ['default-domain', 'vn1'])
+        self.assertEqual(cache.get('uuid-1')[1], ['default-domain', 'vn1'])
+        # type and name to uuid are only known once the type is
+        self.assertEqual(cache.get('uuid-1', need_type=True), None)
+        self.assertEqual(
+            cache.get_uuid('virtual-network', ['default-domain', 'vn1']), None)
+        cache.add('uuid-1', ['default-domain', 'vn1'], 'virtual_network')
+        self.assertEqual(cache.get('uuid-1', need_type=True)[0],
+                         'virtual_network')
+        self.assertEqual(
+            cache.get_uuid('virtual-network', ['default-domain', 'vn1']),
+            'uuid-1')
+        stats = cache.stats()
+        self.assertEqual((stats['hits'], stats['misses']), (3, 2))
+        self.assertEqual(stats['hit_ratio'], 0.6)
+
+    def test_eviction(self):
+        cache = ObjectNameCache(2)
+        cache.add('uuid-1', ['vn1'], 'virtual_network')
+        cache.add('uuid-2', ['vn2'], 'virtual_network')
+        cache.get('uuid-1')
+        cache.add('uuid-3', ['vn3'], 'virtual_network')
+        # least recently used is evicted in both directions
+        self.assertEqual(cache.get('uuid-2'), None)
+        self.assertEqual(cache.get_uuid('virtual_network', ['vn2']), None)
+        self.assertEqual(cache.get_uuid('virtual_network', ['vn1']), 'uuid-1')
+        self.assertEqual(cache.stats()['evictions'], 1)
+        self.assertEqual(cache.stats()['entries'], 2)
+
+    def test_invalidation(self):
+        cache = ObjectNameCache(10)
+        cache.add('uuid-1', ['vn1'], 'virtual_network')
+        # name taken over by a new object before the delete is seen
+        cache.add('uuid-2', ['vn1'], 'virtual_network')
+        cache.delete('uuid-1')
+        cache.delete('uuid-1')
+        self.assertEqual(cache.get('uuid-1'), None)
+        self.assertEqual(cache.get_uuid('virtual_network', ['vn1']), 'uuid-2')
+        self.assertEqual(cache.stats()['invalidations'], 1)
+
+
+class FakeUuidCF(object):
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.calls = []
+
+    def get(self, key, columns=None):
+        self.calls.append(('get', [key]))
+        return dict((col, self.rows[key][col]) for col in columns)
+
+    def multiget(self, keys, columns=None):
+        self.calls.append(('multiget', sorted(keys)))
+        return dict((key, dict((col, self.rows[key][col])
+                               for col in columns))
+                    for key in keys if key in self.rows)
+
+
+class TestRefNames(unittest.TestCase):
+
+    def setUp(self):
+        rows = dict(('uuid-%d' % (i), {
+            'fq_name': json.dumps(['default-domain', 'vmi-%d' % (i)]),
+            'type': json.dumps('virtual_machine_interface')})
+            for i in range(3))
+        self.cf = FakeUuidCF(rows)
+        # no cassandra connection needed to read names
+        self.db = VncCassandraClient.__new__(VncCassandraClient)
+        self.db._obj_cache = ObjectNameCache(10)
+        self.db._read_ctx = gevent.local.local()
+        self.db._obj_uuid_cf = self.cf
+        self.db._generate_url = lambda x, y: ''
+
+    def _read(self, ref_uuids):
+        result = {}
+        for ref_uuid in ref_uuids:
+            self.db._read_back_ref(result, 'vn-uuid',
+                                   'virtual_machine_interface', ref_uuid,
+                                   json.dumps({'attr': None}))
+        return result['virtual_machine_interface_back_refs']
+
+    def test_batch(self):
+        with self.db.ref_names_batch():
+            refs = self._read(['uuid-0', 'uuid-1', 'uuid-2', 'uuid-1'])
+            self.assertFalse('to' in refs[0])
+        self.assertEqual([ref['to'][-1] for ref in refs],
+                         ['vmi-0', 'vmi-1', 'vmi-2', 'vmi-1'])
+        self.assertEqual(self.cf.calls,
+                         [('multiget', ['uuid-0', 'uuid-1', 'uuid-2'])])
+        # later reads are served from the cache
+        self.assertEqual(self.db.uuid_to_fq_name('uuid-2')[-1], 'vmi-2')
+        self.assertEqual(len(self.cf.calls), 1)
+
+    def test_batch_missing(self):
+        def read_missing():
+            with self.db.ref_names_batch():
+                self._read(['uuid-0', 'uuid-9'])
+        self.assertRaises(NoIdError, read_missing)
+
+    def test_exclude(self):
+        self.db.exclude_ref_names(True)
+        with self.db.ref_names_batch():
+            refs = self._read(['uuid-0', 'uuid-1'])
+        self.assertEqual([ref['uuid'] for ref in refs], ['uuid-0', 'uuid-1'])
+        self.assertFalse('to' in refs[0])
+        self.assertEqual(self.cf.calls, [])
@@ -0,0 +1,150 @@
+#
+# Copyright (c) 2015 Juniper Networks, Inc. All rights reserved.
+#
+
+import random
+import unittest
+
+import gevent
+
+from cfgm_common.exceptions import ResourceExhaustionError
+from cfgm_common.exceptions import ResourceExistsError
+from cfgm_common.zkclient import IndexAllocator, IndexRanges
+from cfgm_common.zkclient import RangeIndexAllocator
+
+
+class FakeZookeeperClient(object):
+
+    def __init__(self):
+        self.nodes = {}
+
+    def get_children(self, path):
+        return [node[len(path):] for node in self.nodes
+                if node.startswith(path)]
+
+    def create_node(self, path, value=None):
+        if path in self.nodes:
+            raise ResourceExistsError(path, self.nodes[path])
+        self.nodes[path] = value
+
+    def create_nodes(self, nodes):
+        created = []
+        for path, value in nodes:
+            created.append(path not in self.nodes)
+            self.nodes.setdefault(path, value)
+        return created
+
+    def read_node(self, path):
+        return self.nodes.get(path)
+
+    def delete_node(self, path, recursive=False):
+        self.nodes.pop(path, None)
+
+    def delete_nodes(self, paths):
+        for path in paths:
+            self.delete_node(path)
+
+
+class TestIndexRanges(unittest.TestCase):
+
+    def test_add_remove(self):
+        ranges = IndexRanges([5, 1, 2, 3])
+        self.assertEqual(len(ranges), 4)
+        self.assertEqual(ranges.runs(), 2)
+        self.assertTrue(ranges.add(4))
+        self.assertFalse(ranges.add(4))
+        self.assertEqual(ranges.runs(), 1)
+        self.assertTrue(ranges.remove(3))
+        self.assertFalse(ranges.remove(3))
+        self.assertEqual(ranges.runs(), 2)
+        self.assertTrue(2 in ranges)
+        self.assertFalse(3 in ranges)
+        self.assertEqual(len(ranges), 4)
+
+    def test_free(self):
+        ranges = IndexRanges([0, 1, 2, 4, 8, 9])
+        self.assertEqual(ranges.first_free(), 3)
+        self.assertEqual(ranges.free_run(3, 16), 5)
+        self.assertEqual(ranges.free_run(6, 16), 10)
+        self.assertEqual(ranges.free_run(7, 16), None)
+        self.assertEqual(ranges.free_indexes(5, 16), [3, 5, 6, 7, 10])
+        self.assertEqual(ranges.free_indexes(20, 12), [3, 5, 6, 7, 10, 11])
+
+    def test_matches_set(self):
+        rand = random.Random(0)
+        ranges, idxs = IndexRanges(), set()
+        for i in range(5000):
+            idx = rand.randrange(2000)
+            if rand.random() < 0.6:
+                self.assertEqual(ranges.add(idx), idx not in idxs)
+                idxs.add(idx)
+            else:
+                self.assertEqual(ranges.remove(idx), idx in idxs)
+                idxs.discard(idx)
+            self.assertEqual(len(ranges), len(idxs))
+        self.assertEqual([idx for idx in range(2000) if idx in ranges],
+                         sorted(idxs))
+        self.assertEqual(ranges.runs(), len(
+            [idx for idx in idxs if idx - 1 not in idxs]))
+        free = [idx for idx in range(2100) if idx not in idxs]
+        self.assertEqual(ranges.first_free(), free[0])
+        self.assertEqual(ranges.free_indexes(50, 2100), free[:50])
+        for count in range(1, 8):
+            run = [idx for idx in free
+                   if all(idx + i not in idxs for i in range(count))][0]
+            self.assertEqual(ranges.free_run(count, 2100), run)
+
+
+class TestRangeIndexAllocator(unittest.TestCase):
+
+    def _allocators(self, **kwargs):
+        for cls in (IndexAllocator, RangeIndexAllocator):
+            yield cls(FakeZookeeperClient(), '/id/', **kwargs)
+
+    def test_alloc_matches_bitmap(self):
+        alloc_list = [{'start': 100, 'end': 109}, {'start': 10, 'end': 19}]
+        for reverse in (False, True):
+            idxs = []
+            for allocator in self._allocators(alloc_list=alloc_list,
+                                              reverse=reverse):
+                allocated = [allocator.alloc() for i in range(15)]
+                allocator.delete(allocated[3])
+                allocator.delete(allocated[12])
+                allocated.extend(allocator.alloc_block(4))
+                allocated.append(allocator.reserve(105))
+                idxs.append(allocated)
+            self.assertEqual(idxs[0], idxs[1])
+
+    def test_exhaustion(self):
+        allocator = RangeIndexAllocator(FakeZookeeperClient(), '/id/',
+                                        alloc_list=[{'start': 10, 'end': 13}])
+        self.assertEqual([allocator.alloc() for i in range(4)],
+                         [10, 11, 12, 13])
+        self.assertRaises(ResourceExhaustionError, allocator.alloc)
+        self.assertEqual(allocator.alloc_block(2), [])
+
+    def test_lazy_load(self):
+        zk_client = FakeZookeeperClient()
+        allocator = RangeIndexAllocator(zk_client, '/id/', size=2 ** 64)
+        # nodes created before the first allocation are loaded
+        IndexAllocator(zk_client, '/id/', size=2 ** 64).alloc_block(1000)
+        zk_client.delete_node('/id/%010d' % 500)
+        self.assertEqual(allocator.alloc(), 500)
+        self.assertEqual(allocator.alloc(), 1000)
+        self.assertEqual(allocator._get_ranges().runs(), 1)
+        allocator.reserve(2 ** 64 - 1)
+        self.assertEqual(allocator._get_ranges().runs(), 2)
+        self.assertFalse(allocator.empty())
+
+    def test_delete_during_load(self):
+        zk_client = FakeZookeeperClient()
+        IndexAllocator(zk_client, '/id/', size=2 ** 64).alloc_block(100)
+        allocator = RangeIndexAllocator(zk_client, '/id/', size=2 ** 64)
+        allocator._LOAD_PAGE_SIZE = 10
+        # the delete lands while the first allocation loads the indexes
+        loader = gevent.spawn(allocator.alloc)
+        gevent.sleep(0)
+        allocator.delete(50)
+        self.assertEqual(loader.get(), 100)
+        self.assertFalse(50 in allocator._get_ranges())
+        self.assertEqual(allocator.alloc(), 50)
@@ -17,6 +17,103 @@ from pysandesh.gen_py.sandesh.ttypes import SandeshLevel
 import time
 import json
 import utils
+from contextlib import contextmanager
+import gevent.local
+try:
+    from collections import OrderedDict
+except ImportError:
+    # python 2.6 or earlier, use backport
+    from ordereddict import OrderedDict
+
+
+class ObjectNameCache(object):
+    """Bounded LRU cache of uuid to (type, fq_name) and fq_name to uuid.
+
+    Both directions share the same entries, so an eviction or invalidation
+    of an object removes all its mappings. The type of an entry is None
+    until it is read from the database.
+    """
+    def __init__(self, max_entries):
+        self._max_entries = max_entries
+        # uuid -> [obj_type, fq_name], least recently used first
+        self._entries = OrderedDict()
+        # (obj_type, fq_name_str) -> uuid
+        self._uuids = {}
+        self._stats = {'hits': 0, 'misses': 0, 'evictions': 0,
+                       'invalidations': 0}
+    # end __init__
+
+    @staticmethod
+    def _name_key(obj_type, fq_name):
+        return (obj_type.replace('-', '_'), ':'.join(fq_name))
+    # end _name_key
+
+    def _touch(self, id):
+        entry = self._entries.pop(id, None)
+        if entry is not None:
+            self._entries[id] = entry
+        return entry
+    # end _touch
+
+    def _remove(self, id):
+        (obj_type, fq_name) = self._entries.pop(id)
+        if obj_type is None:
+            return
+        name_key = self._name_key(obj_type, fq_name)
+        # the name may have been taken over by a new object since
+        if self._uuids.get(name_key) == id:
+            del self._uuids[name_key]
+    # end _remove
+
+    def add(self, id, fq_name, obj_type=None):
+        entry = self._touch(id)
+        if entry is None:
+            if len(self._entries) >= self._max_entries:
+                self._remove(next(iter(self._entries)))
+                self._stats['evictions'] += 1
+            self._entries[id] = [obj_type, fq_name]
+        elif obj_type is not None:
+            entry[0] = obj_type
+        if obj_type is not None:
+            self._uuids[self._name_key(obj_type, fq_name)] = id
+    # end add
+
+    def delete(self, id):
+        if id in self._entries:
+            self._remove(id)
+            self._stats['invalidations'] += 1
+    # end delete
+
+    def get(self, id, need_type=False):
+        entry = self._touch(id)
+        if entry is None or (need_type and entry[0] is None):
+            self._stats['misses'] += 1
+            return None
+        self._stats['hits'] += 1
+        return entry
+    # end get
+
+    def get_uuid(self, obj_type, fq_name):
+        id = self._uuids.get(self._name_key(obj_type, fq_name))
+        if id is None:
+            self._stats['misses'] += 1
+            return None
+        self._touch(id)
+        self._stats['hits'] += 1
+        return id
+    # end get_uuid
+
+    def stats(self):
+        stats = dict(self._stats)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_ratio'] = float(stats['hits']) / lookups if lookups else 0.0
+        stats['entries'] = len(self._entries)
+        stats['max_entries'] = self._max_entries
+        return stats
+    # end stats
+
+# end class ObjectNameCache
+
 
 class VncCassandraClient(VncCassandraClientGen):
     # Name to ID mapping keyspace + tables
@@ -28,6 +125,9 @@ class VncCassandraClient(VncCassandraClientGen):
     # TODO describe layout
     _OBJ_FQ_NAME_CF_NAME = 'obj_fq_name_table'
 
+    # Default bound of the uuid/fq_name cache
+    _CACHE_MAX_ENTRIES = 100000
+
     @classmethod
     def get_db_info(cls):
         db_info = [(cls._UUID_KEYSPACE_NAME, [cls._OBJ_UUID_CF_NAME,
@@ -36,10 +136,13 @@ class VncCassandraClient(VncCassandraClientGen):
     # end get_db_info
 
     def __init__(self, server_list, reset_config, db_prefix, keyspaces, logger,
-                 generate_url=None):
+                 generate_url=None, cache_max_entries=None):
         super(VncCassandraClient, self).__init__()
         self._reset_config = reset_config
-        self._cache_uuid_to_fq_name = {}
+        self._obj_cache = ObjectNameCache(
+            cache_max_entries or self._CACHE_MAX_ENTRIES)
+        # ref name resolution of the object reads of each greenlet
+        self._read_ctx = gevent.local.local()
         if db_prefix:
             self._db_prefix = '%s_' %(db_prefix)
         else:
@@ -59,7 +162,6 @@ class VncCassandraClient(VncCassandraClientGen):
         if keyspaces:
             self._keyspaces.update(keyspaces)
         self._cassandra_init(server_list)
-        self._cache_uuid_to_fq_name = {}
         self._obj_uuid_cf = self._cf_dict[self._OBJ_UUID_CF_NAME]
         self._obj_fq_name_cf = self._cf_dict[self._OBJ_FQ_NAME_CF_NAME]
     # end __init__
@@ -184,41 +286,71 @@ class VncCassandraClient(VncCassandraClientGen):
         self._logger(msg, level=SandeshLevel.SYS_NOTICE)
     # end _cassandra_init_conn_pools
 
-    def cache_uuid_to_fq_name_add(self, id, fq_name):
-        self._cache_uuid_to_fq_name[id] = fq_name
+    def cache_uuid_to_fq_name_add(self, id, fq_name, obj_type=None):
+        self._obj_cache.add(id, fq_name, obj_type)
     # end cache_uuid_to_fq_name_add
 
     def cache_uuid_to_fq_name_del(self, id):
-        try:
-            del self._cache_uuid_to_fq_name[id]
-        except KeyError:
-            pass
+        self._obj_cache.delete(id)
     # end cache_uuid_to_fq_name_del
 
-    def uuid_to_fq_name(self, id):
-        try:
-            return self._cache_uuid_to_fq_name[id]
-        except KeyError:
-            try:
-                fq_name_json = self._obj_uuid_cf.get(
-                    id, columns=['fq_name'])['fq_name']
-            except pycassa.NotFoundException:
-                raise NoIdError(id)
-
-            fq_name = json.loads(fq_name_json)
-            self.cache_uuid_to_fq_name_add(id, fq_name)
-            return fq_name
-    # end uuid_to_fq_name
+    def cache_stats(self):
+        return self._obj_cache.stats()
+    # end cache_stats
 
-    def uuid_to_obj_type(self, id):
+    def _read_obj_name(self, id):
         try:
-            type_json = self._obj_uuid_cf.get(id, columns=['type'])['type']
+            cols = self._obj_uuid_cf.get(id, columns=['fq_name', 'type'])
         except pycassa.NotFoundException:
             raise NoIdError(id)
-        return json.loads(type_json)
+
+        fq_name = json.loads(cols['fq_name'])
+        obj_type = json.loads(cols['type'])
+        self.cache_uuid_to_fq_name_add(id, fq_name, obj_type)
+        return (obj_type, fq_name)
+    # end _read_obj_name
+
+    def uuid_to_fq_name(self, id):
+        entry = self._obj_cache.get(id)
+        if entry is None:
+            entry = self._read_obj_name(id)
+        return entry[1]
     # end uuid_to_fq_name
 
+    def uuid_to_obj_type(self, id):
+        entry = self._obj_cache.get(id, need_type=True)
+        if entry is None:
+            entry = self._read_obj_name(id)
+        return entry[0]
+    # end uuid_to_obj_type
+
+    def uuids_to_obj_types(self, ids):
+        obj_types = {}
+        for id in set(ids):
+            entry = self._obj_cache.get(id, need_type=True)
+            if entry is not None:
+                obj_types[id] = entry[0]
+        missing = [id for id in set(ids) if id not in obj_types]
+        if not missing:
+            return obj_types
+
+        rows = self._obj_uuid_cf.multiget(missing,
+                                          columns=['fq_name', 'type'])
+        for id in missing:
+            cols = rows.get(id, {})
+            if 'type' not in cols or 'fq_name' not in cols:
+                raise NoIdError(id)
+            obj_types[id] = json.loads(cols['type'])
+            self.cache_uuid_to_fq_name_add(id, json.loads(cols['fq_name']),
+                                           obj_types[id])
+        return obj_types
+    # end uuids_to_obj_types
+
     def fq_name_to_uuid(self, obj_type, fq_name):
+        obj_uuid = self._obj_cache.get_uuid(obj_type, fq_name)
+        if obj_uuid is not None:
+            return obj_uuid
+
         method_name = obj_type.replace('-', '_')
         fq_name_str = ':'.join(fq_name)
         col_start = '%s:' % (utils.encode_string(fq_name_str))
@@ -237,16 +369,88 @@ class VncCassandraClient(VncCassandraClientGen):
         for (col_name, col_val) in col_infos:
             obj_uuid = col_name.split(':')[-1]
 
+        self.cache_uuid_to_fq_name_add(obj_uuid, fq_name, method_name)
         return obj_uuid
     # end fq_name_to_uuid
 
+    def exclude_ref_names(self, exclude):
+        """Leave out the fq_name of refs, back-refs and children in the
+        object reads of the calling greenlet."""
+        self._read_ctx.exclude = exclude
+    # end exclude_ref_names
+
+    @contextmanager
+    def ref_names_batch(self):
+        """Resolve the fq_name of refs, back-refs and children of the
+        object reads done in the block with one multiget, on exit."""
+        if getattr(self._read_ctx, 'pending', None) is not None:
+            # nested, resolved by the outer block
+            yield
+            return
+
+        self._read_ctx.pending = []
+        try:
+            yield
+            pending = self._read_ctx.pending
+        finally:
+            self._read_ctx.pending = None
+        self._resolve_ref_names(pending)
+    # end ref_names_batch
+
+    def _read_ref_name(self, ref_info, ref_uuid, missing_ok=False):
+        if getattr(self._read_ctx, 'exclude', False):
+            return
+
+        pending = getattr(self._read_ctx, 'pending', None)
+        if pending is not None:
+            pending.append((ref_info, ref_uuid, missing_ok))
+            return
+
+        try:
+            ref_info['to'] = self.uuid_to_fq_name(ref_uuid)
+        except NoIdError:
+            if not missing_ok:
+                raise
+            ref_info['to'] = ['ERROR']
+    # end _read_ref_name
+
+    def _resolve_ref_names(self, pending):
+        fq_names = {}
+        missing = []
+        for ref_uuid in set(ref_uuid for (_, ref_uuid, _) in pending):
+            entry = self._obj_cache.get(ref_uuid)
+            if entry is None:
+                missing.append(ref_uuid)
+            else:
+                fq_names[ref_uuid] = entry[1]
+
+        if missing:
+            rows = self._obj_uuid_cf.multiget(missing,
+                                              columns=['fq_name', 'type'])
+            for (ref_uuid, cols) in rows.items():
+                if 'fq_name' not in cols:
+                    continue
+                fq_names[ref_uuid] = json.loads(cols['fq_name'])
+                obj_type = json.loads(cols['type']) if 'type' in cols else None
+                self.cache_uuid_to_fq_name_add(
+                    ref_uuid, fq_names[ref_uuid], obj_type)
+
+        for (ref_info, ref_uuid, missing_ok) in pending:
+            if ref_uuid in fq_names:
+                ref_info['to'] = fq_names[ref_uuid]
+            elif missing_ok:
+                ref_info['to'] = ['ERROR']
+            else:
+                raise NoIdError(ref_uuid)
+    # end _resolve_ref_names
+
     def _read_child(self, result, obj_uuid, child_type,
                     child_uuid, child_tstamp):
         if '%ss' % (child_type) not in result:
             result['%ss' % (child_type)] = []
 
         child_info = {}
-        child_info['to'] = self.uuid_to_fq_name(child_uuid)
+        self._read_ref_name(child_info, child_uuid)
         child_info['href'] = self._generate_url(child_type, child_uuid)
         child_info['uuid'] = child_uuid
         child_info['tstamp'] = child_tstamp
@@ -260,10 +464,7 @@ class VncCassandraClient(VncCassandraClientGen):
 
         ref_data = json.loads(ref_data_json)
         ref_info = {}
-        try:
-            ref_info['to'] = self.uuid_to_fq_name(ref_uuid)
-        except NoIdError as e:
-            ref_info['to'] = ['ERROR']
+        self._read_ref_name(ref_info, ref_uuid, missing_ok=True)
 
         if ref_data:
             try:
@@ -284,7 +485,7 @@ class VncCassandraClient(VncCassandraClientGen):
             result['%s_back_refs' % (back_ref_type)] = []
 
         back_ref_info = {}
-        back_ref_info['to'] = self.uuid_to_fq_name(back_ref_uuid)
+        self._read_ref_name(back_ref_info, back_ref_uuid)
         back_ref_data = json.loads(back_ref_data_json)
         if back_ref_data:
             try:
@@ -2,6 +2,9 @@
 # Copyright (c) 2013 Juniper Networks, Inc. All rights reserved.
 #
 import os
+import bisect
+import random
+import itertools
 import gevent
 import logging
 import kazoo.client
@@ -51,46 +54,57 @@ class IndexAllocator(object):
         else:
             self._max_alloc = max_alloc
 
+        # Bits are numbered along the ranges, in reverse order if reverse
+        self._reverse = reverse
+        if reverse:
+            self._alloc_ranges = list(reversed(self._alloc_list))
+        else:
+            self._alloc_ranges = self._alloc_list
+        self._alloc_starts = [alloc['start'] for alloc in self._alloc_list]
+        self._alloc_bits = []
+        bit = 0
+        for alloc in self._alloc_ranges:
+            self._alloc_bits.append(bit)
+            bit += alloc['end'] - alloc['start'] + 1
+
         self._zookeeper_client = zookeeper_client
         self._path = path
+        self._init_in_use()
+    # end __init__
+
+    def _init_in_use(self):
         self._in_use = bitarray('0')
-        self._reverse = reverse
-        for idx in self._zookeeper_client.get_children(path):
+        for idx in self._zookeeper_client.get_children(self._path):
             idx_int = self._get_bit_from_zk_index(int(idx))
             if idx_int >= 0:
                 self._set_in_use(idx_int)
         # end for idx
-    # end __init__
+    # end _init_in_use
 
     def _get_zk_index_from_bit(self, idx):
-        size = idx
-        if self._reverse:
-            for alloc in reversed(self._alloc_list):
-                size -= alloc['end'] - alloc['start'] + 1
-                if size < 0:
-                   return alloc['start']-size - 1
-        else:
-            for alloc in self._alloc_list:
-                size -= alloc['end'] - alloc['start'] + 1
-                if size < 0:
-                   return alloc['end']+size + 1
+        # _alloc_bits holds the first bit of each range of _alloc_ranges
+        pos = bisect.bisect_right(self._alloc_bits, idx) - 1
+        if pos >= 0:
+            alloc = self._alloc_ranges[pos]
+            offset = idx - self._alloc_bits[pos]
+            if offset <= alloc['end'] - alloc['start']:
+                if self._reverse:
+                    return alloc['end'] - offset
+                return alloc['start'] + offset
 
         raise Exception()
     # end _get_zk_index
 
     def _get_bit_from_zk_index(self, idx):
-        size = 0
-        if self._reverse:
-            for alloc in reversed(self._alloc_list):
-                if alloc['start'] <= idx <= alloc['end']:
-                    return alloc['end'] - idx + size
-                size += alloc['end'] - alloc['start'] + 1
-            pass
-        else:
-            for alloc in self._alloc_list:
-                if alloc['start'] <= idx <= alloc['end']:
-                    return idx - alloc['start'] + size
-                size += alloc['end'] - alloc['start'] + 1
+        # _alloc_starts holds the start of each range of _alloc_list
+        pos = bisect.bisect_right(self._alloc_starts, idx) - 1
+        if pos >= 0:
+            alloc = self._alloc_list[pos]
+            if idx <= alloc['end']:
+                if self._reverse:
+                    pos = len(self._alloc_list) - 1 - pos
+                    return self._alloc_bits[pos] + alloc['end'] - idx
+                return self._alloc_bits[pos] + idx - alloc['start']
         return -1
     # end _get_bit_from_zk_index
 
@@ -109,7 +123,12 @@ class IndexAllocator(object):
             self._in_use[idx] = 1
     # end _set_in_use
 
-    def alloc(self, value=None):
+    def _reset_in_use(self, idx):
+        if idx < self._in_use.length():
+            self._in_use[idx] = 0
+    # end _reset_in_use
+
+    def _alloc_bit(self):
         if self._in_use.all():
             idx = self._in_use.length()
             if idx > self._max_alloc:
@@ -118,8 +137,11 @@ class IndexAllocator(object):
         else:
             idx = self._in_use.index(0)
             self._in_use[idx] = 1
+        return idx
+    # end _alloc_bit
 
-        idx = self._get_zk_index_from_bit(idx)
+    def alloc(self, value=None):
+        idx = self._get_zk_index_from_bit(self._alloc_bit())
         try:
             # Create a node at path and return its integer value
             id_str = "%(#)010d" % {'#': idx}
@@ -129,6 +151,48 @@ class IndexAllocator(object):
             return self.alloc(value)
     # end alloc
 
+    def _free_bits(self, count):
+        # Prefer a run of count free bits, in the bitmap or past its end,
+        # over scattered free bits
+        limit = min(self._size, self._max_alloc + 1)
+        in_use = self._in_use.to01()
+        run = in_use.find('0' * count)
+        if run >= 0:
+            return range(run, run + count)
+        tail = len(in_use.rstrip('0'))
+        if tail + count <= limit:
+            return range(tail, tail + count)
+
+        bits = []
+        bit = in_use.find('0')
+        while bit >= 0 and len(bits) < count:
+            bits.append(bit)
+            bit = in_use.find('0', bit + 1)
+        end = min(limit, len(in_use) + count - len(bits))
+        bits.extend(range(len(in_use), end))
+        return bits
+    # end _free_bits
+
+    def alloc_block(self, count, value=None):
+        # Allocate up to count indexes, creating their nodes in zookeeper
+        # transactions. Fewer indexes are returned when the allocator
+        # runs out of free ones
+        idxs = []
+        while len(idxs) < count:
+            bits = self._free_bits(count - len(idxs))
+            if not bits:
+                break
+            for bit in bits:
+                self._set_in_use(bit)
+            new_idxs = [self._get_zk_index_from_bit(bit) for bit in bits]
+            nodes = [(self._path + "%(#)010d" % {'#': idx}, value)
+                     for idx in new_idxs]
+            created = self._zookeeper_client.create_nodes(nodes)
+            # indexes whose node exists are in use by another allocator
+            idxs.extend([idx for idx, ok in zip(new_idxs, created) if ok])
+        return idxs
+    # end alloc_block
+
     def reserve(self, idx, value=None):
         bit_idx = self._get_bit_from_zk_index(idx)
         if bit_idx < 0:
@@ -148,10 +212,19 @@ class IndexAllocator(object):
         id_str = "%(#)010d" % {'#': idx}
         self._zookeeper_client.delete_node(self._path + id_str)
         bit_idx = self._get_bit_from_zk_index(idx)
-        if 0 <= bit_idx < self._in_use.length():
-            self._in_use[bit_idx] = 0
+        if bit_idx >= 0:
+            self._reset_in_use(bit_idx)
     # end delete
 
+    def delete_block(self, idxs):
+        self._zookeeper_client.delete_nodes(
+            [self._path + "%(#)010d" % {'#': idx} for idx in idxs])
+        for idx in idxs:
+            bit_idx = self._get_bit_from_zk_index(idx)
+            if bit_idx >= 0:
+                self._reset_in_use(bit_idx)
+    # end delete_block
+
     def read(self, idx):
         id_str = "%(#)010d" % {'#': idx}
         id_val = self._zookeeper_client.read_node(self._path+id_str)
@@ -178,8 +251,294 @@ class IndexAllocator(object):
 #end class IndexAllocator
 
 
+class _IndexRun(object):
+    # Treap node for a run [start, end] of IndexRanges, keyed by start.
+    # lo and hi are the first and last index of the runs of the subtree,
+    # gap the size of the largest hole between two of its runs
+    __slots__ = ('start', 'end', 'priority', 'left', 'right', 'lo', 'hi',
+                 'gap')
+
+    def __init__(self, start, end):
+        self.start = start
+        self.end = end
+        self.priority = random.random()
+        self.left = None
+        self.right = None
+        self.update()
+    # end __init__
+
+    def update(self):
+        self.lo = self.start
+        self.hi = self.end
+        self.gap = 0
+        if self.left:
+            self.lo = self.left.lo
+            self.gap = max(self.left.gap, self.start - self.left.hi - 1)
+        if self.right:
+            self.hi = self.right.hi
+            self.gap = max(self.gap, self.right.gap,
+                           self.right.lo - self.end - 1)
+    # end update
+
+# end class _IndexRun
+
+
+class IndexRanges(object):
+    '''
+    Set of indexes, kept as runs of consecutive indexes in a treap ordered
+    by run start. Every operation but free_indexes walks one path of the
+    treap, so the cost is logarithmic in the number of runs and does not
+    depend on the highest index in the set
+    '''
+
+    def __init__(self, idxs=None):
+        self._root = None
+        self._runs = 0
+        self._count = 0
+        if idxs:
+            for idx in sorted(idxs):
+                self.add(idx)
+    # end __init__
+
+    @classmethod
+    def _split(cls, node, key):
+        # Split in the runs starting before key and the others
+        if node is None:
+            return None, None
+        if node.start < key:
+            node.right, right = cls._split(node.right, key)
+            node.update()
+            return node, right
+        left, node.left = cls._split(node.left, key)
+        node.update()
+        return left, node
+    # end _split
+
+    @classmethod
+    def _merge(cls, left, right):
+        # Join two treaps, all runs of left being before those of right
+        if left is None:
+            return right
+        if right is None:
+            return left
+        if left.priority > right.priority:
+            left.right = cls._merge(left.right, right)
+            left.update()
+            return left
+        right.left = cls._merge(left, right.left)
+        right.update()
+        return right
+    # end _merge
+
+    def _floor(self, idx):
+        # Run with the highest start not above idx
+        node, found = self._root, None
+        while node:
+            if node.start <= idx:
+                found, node = node, node.right
+            else:
+                node = node.left
+        return found
+    # end _floor
+
+    def _iter_runs(self):
+        # Runs in order as (start, end)
+        stack, node = [], self._root
+        while stack or node:
+            if node:
+                stack.append(node)
+                node = node.left
+            else:
+                node = stack.pop()
+                yield node.start, node.end
+                node = node.right
+    # end _iter_runs
+
+    def __len__(self):
+        return self._count
+    # end __len__
+
+    def __contains__(self, idx):
+        run = self._floor(idx)
+        return run is not None and idx <= run.end
+    # end __contains__
+
+    def runs(self):
+        return self._runs
+    # end runs
+
+    def add(self, idx):
+        prev = self._floor(idx)
+        if prev and idx <= prev.end:
+            return False
+        start = idx
+        if prev and prev.end == idx - 1:
+            start = prev.start
+        # the runs joined by idx are the one ending before it and the one
+        # starting after it
+        left, right = self._split(self._root, start)
+        joined, right = self._split(right, idx + 2)
+        end = max(idx, joined.hi) if joined else idx
+        self._root = self._merge(self._merge(left, _IndexRun(start, end)),
+                                 right)
+        self._runs += 1 - (start < idx) - (end > idx)
+        self._count += 1
+        return True
+    # end add
+
+    def remove(self, idx):
+        run = self._floor(idx)
+        if run is None or idx > run.end:
+            return False
+        left, right = self._split(self._root, run.start)
+        _, right = self._split(right, run.start + 1)
+        if run.start < idx:
+            left = self._merge(left, _IndexRun(run.start, idx - 1))
+            self._runs += 1
+        if idx < run.end:
+            left = self._merge(left, _IndexRun(idx + 1, run.end))
+            self._runs += 1
+        self._root = self._merge(left, right)
+        self._runs -= 1
+        self._count -= 1
+        return True
+    # end remove
+
+    def first_free(self):
+        # Lowest index not in the set
+        node = self._root
+        if node is None or node.lo > 0:
+            return 0
+        while node.left:
+            node = node.left
+        return node.end + 1
+    # end first_free
+
+    def free_run(self, count, limit):
+        # Start of the first run of count free indexes below limit
+        node = self._root
+        if node is None or node.lo >= count:
+            free = 0
+        elif node.gap < count:
+            free = node.hi + 1
+        else:
+            # descend to the leftmost hole big enough
+            while True:
+                left, right = node.left, node.right
+                if left and left.gap >= count:
+                    node = left
+                elif left and node.start - left.hi - 1 >= count:
+                    free = left.hi + 1
+                    break
+                elif right and right.lo - node.end - 1 >= count:
+                    free = node.end + 1
+                    break
+                else:
+                    node = right
+        if free + count <= limit:
+            return free
+        return None
+    # end free_run
+
+    def free_indexes(self, count, limit):
+        # Up to count free indexes below limit, lowest first
+        idxs = []
+        free = 0
+        for start, end in itertools.chain(self._iter_runs(),
+                                          [(limit, limit)]):
+            idxs.extend(range(free, min(start, free + count - len(idxs),
+                                        limit)))
+            if len(idxs) >= count or start >= limit:
+                break
+            free = end + 1
+        return idxs
+    # end free_indexes
+
+# end class IndexRanges
+
+
+class RangeIndexAllocator(IndexAllocator):
+    '''
+    IndexAllocator keeping the allocated indexes as IndexRanges instead of
+    a bitmap, for allocators with a large space (IPv6 or /8 subnets) where
+    the bitmap and its linear scans get big. The allocated indexes are
+    read from zookeeper on first use, not when the allocator is created
+    '''
+
+    # Number of zookeeper children added to the ranges between yields
+    _LOAD_PAGE_SIZE = 10000
+
+    def _init_in_use(self):
+        self._ranges = None
+        self._load_lock = BoundedSemaphore(1)
+    # end _init_in_use
+
+    def _get_ranges(self):
+        if self._ranges is None:
+            # Allocations and deletes made while the load yields wait for
+            # it, so they are applied on top of the loaded indexes
+            with self._load_lock:
+                if self._ranges is None:
+                    self._ranges = self._load_ranges()
+        return self._ranges
+    # end _get_ranges
+
+    def _load_ranges(self):
+        ranges = IndexRanges()
+        bits = []
+        for idx in self._zookeeper_client.get_children(self._path):
+            bit = self._get_bit_from_zk_index(int(idx))
+            if bit >= 0:
+                bits.append(bit)
+        bits.sort()
+        for i in range(0, len(bits), self._LOAD_PAGE_SIZE):
+            for bit in bits[i:i + self._LOAD_PAGE_SIZE]:
+                ranges.add(bit)
+            gevent.sleep(0)
+        return ranges
+    # end _load_ranges
+
+    def _limit(self):
+        return min(self._size, self._max_alloc + 1)
+    # end _limit
+
+    def _set_in_use(self, idx):
+        self._get_ranges().add(idx)
+    # end _set_in_use
+
+    def _reset_in_use(self, idx):
+        self._get_ranges().remove(idx)
+    # end _reset_in_use
+
+    def _alloc_bit(self):
+        ranges = self._get_ranges()
+        idx = ranges.first_free()
+        if idx >= self._limit():
+            raise ResourceExhaustionError()
+        ranges.add(idx)
+        return idx
+    # end _alloc_bit
+
+    def _free_bits(self, count):
+        ranges = self._get_ranges()
+        run = ranges.free_run(count, self._limit())
+        if run is not None:
+            return range(run, run + count)
+        return ranges.free_indexes(count, self._limit())
+    # end _free_bits
+
+    def empty(self):
+        return len(self._get_ranges()) == 0
+    # end empty
+
+# end class RangeIndexAllocator
+
+
 class ZookeeperClient(object):
 
+    # Maximum number of operations of a zookeeper transaction
+    _TRANSACTION_SIZE = 1000
+
     def __init__(self, module, server_list, logging_fn=None):
         # logging
         logger = logging.getLogger(module)
@@ -294,6 +653,69 @@ class ZookeeperClient(object):
             raise ResourceExistsError(path, str(current_value))
     # end create_node
 
+    def _create_nodes_txn(self, paths, values):
+        txn = self._zk_client.transaction()
+        for path in paths:
+            txn.create(path, values[path])
+        return txn.commit()
+    # end _create_nodes_txn
+
+    def create_nodes(self, nodes):
+        # Create the (path, value) nodes in transactions, and return
+        # for each node whether it was created, or already existed
+        values = {}
+        for path, value in nodes:
+            if value is None:
+                value = uuid.uuid4()
+            values[path] = str(value)
+        for parent in set(os.path.dirname(path) for path in values):
+            retry = self._retry.copy()
+            retry(self._zk_client.ensure_path, parent)
+
+        created = {}
+        pending = [path for path, _ in nodes]
+        while pending:
+            paths = pending[:self._TRANSACTION_SIZE]
+            retry = self._retry.copy()
+            results = retry(self._create_nodes_txn, paths, values)
+            existing = []
+            for path, result in zip(paths, results):
+                if isinstance(result, kazoo.exceptions.NodeExistsError):
+                    existing.append(path)
+                elif isinstance(result, Exception) and not \
+                        isinstance(result, kazoo.exceptions.RolledBackError):
+                    raise result
+            if existing:
+                # The transaction was rolled back. A node holding our
+                # value was created by a retried commit
+                for path in existing:
+                    created[path] = self.read_node(path) == values[path]
+            else:
+                for path in paths:
+                    created[path] = True
+            pending = [path for path in pending if path not in created]
+        return [created[path] for path, _ in nodes]
+    # end create_nodes
+
+    def _delete_nodes_txn(self, paths):
+        txn = self._zk_client.transaction()
+        for path in paths:
+            txn.delete(path)
+        return txn.commit()
+    # end _delete_nodes_txn
+
+    def delete_nodes(self, paths):
+        for i in range(0, len(paths), self._TRANSACTION_SIZE):
+            chunk = paths[i:i + self._TRANSACTION_SIZE]
+            retry = self._retry.copy()
+            results = retry(self._delete_nodes_txn, chunk)
+            if any(isinstance(result, Exception) for result in results):
+                # Some nodes are already gone, the transaction was rolled
+                # back. Delete the others one by one
+                for path in chunk:
+                    self.delete_node(path)
+    # end delete_nodes
+
     def delete_node(self, path, recursive=False):
         try:
             retry = self._retry.copy()
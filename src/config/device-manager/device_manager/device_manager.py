@@ -39,6 +39,8 @@ from cfgm_common.uve.cfgm_cpuinfo.ttypes import NodeStatusUVE, \
 from cfgm_common.vnc_db import DBBase
 from db import BgpRouterDM, PhysicalRouterDM, PhysicalInterfaceDM, \
     LogicalInterfaceDM, VirtualMachineInterfaceDM, VirtualNetworkDM
+from physical_router_config import PhysicalRouterConfig
+from netconf_session import NetconfSessionPool
 from cfgm_common.dependency_tracker import DependencyTracker
 from sandesh.dm_introspect import ttypes as sandesh
 
@@ -163,6 +165,11 @@ class DeviceManager(object):
                                              self.config_log)
 
         DBBase.init(self, self._sandesh.logger(), self._cassandra)
+        # configs are pushed off the notification handler, one worker per
+        # router at a time
+        PhysicalRouterConfig.netconf_pool = NetconfSessionPool(
+            int(self._args.push_workers), int(self._args.netconf_keepalive),
+            self._sandesh.logger())
         ok, pr_list = self._cassandra._cassandra_physical_router_list()
         if not ok:
             self.config_log('physical router list returned error: %s' %
@@ -306,6 +313,8 @@ def parse_args(args_str):
                          --use_syslog
                          --syslog_facility LOG_USER
                          --cluster_id <testbed-name>
+                         --push_workers 16
+                         --netconf_keepalive 30
                          [--reset_config]
     '''
 
@@ -339,6 +348,8 @@ def parse_args(args_str):
         'use_syslog': False,
         'syslog_facility': Sandesh._DEFAULT_SYSLOG_FACILITY,
         'cluster_id': '',
+        'push_workers': '16',
+        'netconf_keepalive': '30',
     }
     secopts = {
         'use_certs': False,
@@ -422,6 +433,11 @@ def parse_args(args_str):
                         help="Tenant name for keystone admin user")
     parser.add_argument("--cluster_id",
                         help="Used for database keyspace separation")
+    parser.add_argument("--push_workers",
+                        help="Number of routers configured concurrently")
+    parser.add_argument("--netconf_keepalive",
+                        help="Keepalive interval of netconf sessions in "
+                             "seconds, 0 to disable")
     args = parser.parse_args(remaining_argv)
     if type(args.cassandra_server_list) is str:
         args.cassandra_server_list = args.cassandra_server_list.split()
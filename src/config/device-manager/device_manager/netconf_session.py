@@ -0,0 +1,312 @@
+#
+# Copyright (c) 2015 Juniper Networks, Inc. All rights reserved.
+#
+
+"""
+This file contains implementation of the netconf sessions and the push
+workers of physical router configuration manager
+"""
+
+import copy
+import gevent
+import gevent.queue
+from lxml import etree
+from ncclient import manager
+from ncclient.operations.rpc import RPCError
+
+
+def _config_key(elem):
+    name = elem.find('name')
+    return (elem.tag, name.text if name is not None else None)
+# end _config_key
+
+
+def _config_is_unit(elem):
+    # leaves, elements carrying their own operation and lists of unnamed
+    # elements are sent whole
+    if len(elem) == 0 or 'operation' in elem.attrib:
+        return True
+    keys = [_config_key(child) for child in elem]
+    return len(set(keys)) != len(keys)
+# end _config_is_unit
+
+
+def _config_leaf_changed(old, new):
+    # a leaf of new with another value in old. the leaf may hold the single
+    # value of a leaf-list, which a merge of the new value would add to
+    old_leaves = dict((child.tag, child.text) for child in old
+                      if len(child) == 0)
+    return any(child.tag in old_leaves and old_leaves[child.tag] != child.text
+               for child in new if len(child) == 0)
+# end _config_leaf_changed
+
+
+def config_normalize(elem):
+    """Merge the sibling elements of elem of same tag and name."""
+    merged = {}
+    for child in list(elem):
+        key = _config_key(child)
+        prev = merged.get(key)
+        if prev is None:
+            merged[key] = child
+        elif (len(child) == 0 and len(prev) == 0 and
+              child.text == prev.text and child.attrib == prev.attrib):
+            elem.remove(child)
+        elif (len(child) and len(prev) and 'operation' not in child.attrib
+              and 'operation' not in prev.attrib):
+            for grandchild in list(child):
+                prev.append(grandchild)
+            elem.remove(child)
+    for child in elem:
+        config_normalize(child)
+    return elem
+# end config_normalize
+
+
+def _config_diff(old, new, diff):
+    changed = False
+    old_children = dict((_config_key(child), child) for child in old)
+    for child in new:
+        key = _config_key(child)
+        prev = old_children.pop(key, None)
+        if prev is not None and etree.tostring(prev) == etree.tostring(child):
+            continue
+        changed = True
+        if prev is None:
+            diff.append(copy.deepcopy(child))
+        elif (_config_is_unit(prev) or _config_is_unit(child) or
+              _config_leaf_changed(prev, child)):
+            child = copy.deepcopy(child)
+            if len(child) and 'operation' not in child.attrib:
+                child.set('operation', 'replace')
+            diff.append(child)
+        else:
+            child_diff = etree.SubElement(diff, child.tag, dict(child.attrib))
+            if key[1] is not None:
+                etree.SubElement(child_diff, 'name').text = key[1]
+            _config_diff(prev, child, child_diff)
+    for (tag, name) in old_children:
+        changed = True
+        gone = etree.SubElement(diff, tag, operation='delete')
+        if name is not None:
+            etree.SubElement(gone, 'name').text = name
+    return changed
+# end _config_diff
+
+
+def config_diff(old, new):
+    """Config applying the changes from old to new with a merge.
+
+    Only the elements of new that changed are in it, with a delete of each
+    element of old gone from new. Changed elements are merged, except
+    those sent whole with a replace: lists of unnamed elements and the
+    elements with a leaf of another value. None when old and new are the
+    same.
+    """
+    diff = etree.Element(new.tag, dict(new.attrib), nsmap=new.nsmap)
+    if not _config_diff(old, new, diff):
+        return None
+    return diff
+# end config_diff
+
+
+class NetconfSession(object):
+    """Netconf session to a physical router, kept open between pushes.
+
+    The session is opened on first use and opened again when the router
+    dropped it.
+    """
+
+    def __init__(self, management_ip, user_creds, keepalive_interval=0):
+        self.management_ip = management_ip
+        self.user_creds = user_creds
+        self._keepalive_interval = keepalive_interval
+        self._manager = None
+        # config last committed on the router through the session, None
+        # when unknown
+        self.committed = None
+    # end __init__
+
+    def connected(self):
+        return self._manager is not None and self._manager.connected
+    # end connected
+
+    def connect(self):
+        self.close()
+        self._manager = manager.connect(
+            host=self.management_ip, port=22,
+            username=self.user_creds['username'],
+            password=self.user_creds['password'],
+            unknown_host_cb=lambda x, y: True)
+        # ssh level keepalive, so idle sessions are not dropped on the way
+        transport = getattr(getattr(self._manager, '_session', None),
+                            '_transport', None)
+        if transport is not None and self._keepalive_interval:
+            transport.set_keepalive(self._keepalive_interval)
+    # end connect
+
+    def close(self):
+        if self._manager is None:
+            return
+        try:
+            self._manager.close_session()
+        except Exception:
+            pass
+        self._manager = None
+    # end close
+
+    def send(self, config, default_operation):
+        # a session found dropped on use is opened again once
+        for retry in (True, False):
+            if not self.connected():
+                self.connect()
+                retry = False
+            try:
+                self._manager.edit_config(
+                    target='candidate', config=config,
+                    test_option='test-then-set',
+                    default_operation=default_operation)
+                self._manager.commit()
+                return
+            except RPCError:
+                # rejected by the router, leave a clean candidate behind
+                self._manager.discard_changes()
+                raise
+            except Exception:
+                self.close()
+                if not retry:
+                    raise
+    # end send
+
+# end class NetconfSession
+
+
+class NetconfSessionPool(object):
+    """Pushes configs to physical routers from a pool of workers.
+
+    Each router has its own queue and at most one push in progress. A config
+    queued for a router replaces the one still pending for it, so a router
+    only gets its latest config. A pending delete of the config is kept in
+    front of the config replacing it.
+
+    Once a config is committed on a router, only its difference with the
+    next config of the router is sent.
+    """
+
+    def __init__(self, workers, keepalive_interval, logger):
+        self._keepalive_interval = keepalive_interval
+        self._logger = logger
+        # management ip -> NetconfSession
+        self._sessions = {}
+        # management ip -> [(delete, user_creds, config, default_operation)]
+        self._pending = {}
+        # management ips with a push in progress
+        self._busy = set()
+        self._queue = gevent.queue.Queue()
+        self._workers = [gevent.spawn(self._worker) for i in range(workers)]
+        self._keepalive_greenlet = None
+        if keepalive_interval:
+            self._keepalive_greenlet = gevent.spawn(self._keepalive)
+    # end __init__
+
+    def push(self, management_ip, user_creds, config,
+             default_operation='merge', delete=False):
+        job = (delete, user_creds, config, default_operation)
+        pending = self._pending.get(management_ip)
+        if (management_ip not in self._busy and pending is None):
+            self._queue.put(management_ip)
+        if pending and pending[0][0] and not delete:
+            self._pending[management_ip] = [pending[0], job]
+        else:
+            self._pending[management_ip] = [job]
+    # end push
+
+    def pending(self):
+        return len(self._pending)
+    # end pending
+
+    def committed_config(self, management_ip):
+        session = self._sessions.get(management_ip)
+        if session is None or session.committed is None:
+            return None
+        return etree.tostring(session.committed)
+    # end committed_config
+
+    def _get_session(self, management_ip, user_creds):
+        session = self._sessions.get(management_ip)
+        if session is not None and session.user_creds != user_creds:
+            session.close()
+            session = None
+        if session is None:
+            session = NetconfSession(management_ip, user_creds,
+                                     self._keepalive_interval)
+            self._sessions[management_ip] = session
+        return session
+    # end _get_session
+
+    def _send(self, management_ip, jobs):
+        for (delete, user_creds, config, default_operation) in jobs:
+            session = self._get_session(management_ip, user_creds)
+            new_config = None
+            if not delete:
+                new_config = config_normalize(etree.fromstring(config))
+                config = etree.tostring(new_config)
+            if new_config is not None and session.committed is not None:
+                diff = config_diff(session.committed, new_config)
+                if diff is None:
+                    continue
+                config = etree.tostring(diff)
+            try:
+                self._logger.info("\nsend netconf message: %s\n" % (config))
+                session.send(config, default_operation)
+                session.committed = new_config
+            except Exception as e:
+                # the next config is sent whole
+                session.committed = None
+                self._logger.error("Router %s: %s" % (management_ip,
+                                                      str(e)))
+            if delete:
+                # nothing left to manage on the router
+                session.close()
+                del self._sessions[management_ip]
+    # end _send
+
+    def _worker(self):
+        while True:
+            management_ip = self._queue.get()
+            jobs = self._pending.pop(management_ip, [])
+            self._busy.add(management_ip)
+            try:
+                self._send(management_ip, jobs)
+            finally:
+                self._busy.discard(management_ip)
+                # configs queued during the push
+                if management_ip in self._pending:
+                    self._queue.put(management_ip)
+    # end _worker
+
+    def _keepalive(self):
+        while True:
+            gevent.sleep(self._keepalive_interval)
+            for (management_ip, session) in self._sessions.items():
+                # routers with a push pending reconnect on the push
+                if (management_ip in self._busy or
+                        management_ip in self._pending or
+                        session.connected()):
+                    continue
+                # no worker takes the router while it reconnects
+                self._busy.add(management_ip)
+                try:
+                    session.connect()
+                except Exception as e:
+                    session.close()
+                    self._logger.error("Router %s: reconnect failed: %s" %
+                                       (management_ip, str(e)))
+                finally:
+                    self._busy.discard(management_ip)
+                    # configs queued during the reconnect
+                    if management_ip in self._pending:
+                        self._queue.put(management_ip)
+    # end _keepalive
+
+# end class NetconfSessionPool
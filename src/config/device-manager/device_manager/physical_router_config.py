@@ -8,11 +8,13 @@ configuration manager
 """
 
 from lxml import etree
-from ncclient import manager
 import copy
 
 
 class PhysicalRouterConfig(object):
+    # NetconfSessionPool the configs are pushed through
+    netconf_pool = None
+
     # mapping from contrail family names to junos
     _FAMILY_MAP = {
         'route-target': '<route-target/>',
@@ -30,42 +32,31 @@ class PhysicalRouterConfig(object):
 
     def send_netconf(self, new_config, default_operation="merge",
                      operation=None):
-        try:
-            with manager.connect(host=self.management_ip, port=22,
-                                 username=self.user_creds['username'],
-                                 password=self.user_creds['password'],
-                                 unknown_host_cb=lambda x, y: True) as m:
-                add_config = etree.Element(
-                    "config",
-                    nsmap={"xc": "urn:ietf:params:xml:ns:netconf:base:1.0"})
-                config = etree.SubElement(add_config, "configuration")
-                if operation:
-                    config_group = etree.SubElement(config, "groups",
-                                                    operation=operation)
-                else:
-                    config_group = etree.SubElement(config, "groups")
-                contrail_group = etree.SubElement(config_group, "name")
-                contrail_group.text = "__contrail__"
-                if isinstance(new_config, list):
-                    for nc in new_config:
-                        config_group.append(nc)
-                else:
-                    config_group.append(new_config)
-                if operation:
-                    apply_groups = etree.SubElement(config, "apply-groups", operation=operation)
-                else:
-                    apply_groups = etree.SubElement(config, "apply-groups")
-                apply_groups.text = "__contrail__"
-                self._logger.info("\nsend netconf message: %s\n" % (etree.tostring(add_config, pretty_print=True)))
-                m.edit_config(
-                    target='candidate', config=etree.tostring(add_config),
-                    test_option='test-then-set',
-                    default_operation=default_operation)
-                m.commit()
-        except Exception as e:
-            if self._logger:
-                self._logger.error("Router %s: %s" % (self.management_ip,
-                                                      e.message))
+        add_config = etree.Element(
+            "config",
+            nsmap={"xc": "urn:ietf:params:xml:ns:netconf:base:1.0"})
+        config = etree.SubElement(add_config, "configuration")
+        if operation:
+            config_group = etree.SubElement(config, "groups",
+                                            operation=operation)
+        else:
+            config_group = etree.SubElement(config, "groups")
+        contrail_group = etree.SubElement(config_group, "name")
+        contrail_group.text = "__contrail__"
+        if isinstance(new_config, list):
+            for nc in new_config:
+                config_group.append(nc)
+        else:
+            config_group.append(new_config)
+        if operation:
+            apply_groups = etree.SubElement(config, "apply-groups", operation=operation)
+        else:
+            apply_groups = etree.SubElement(config, "apply-groups")
+        apply_groups.text = "__contrail__"
+        # serialized now, the elements are reused by the next config
+        self.netconf_pool.push(self.management_ip, self.user_creds,
+                               etree.tostring(add_config), default_operation,
+                               delete=(operation == "delete"))
     # end send_config
 
     def add_routing_instance(self, name, import_targets, export_targets,
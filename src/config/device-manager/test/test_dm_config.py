@@ -110,11 +110,14 @@ class TestDM(test_case.DMTestCase):
     @retries(10, hook=retry_exc_handler)
     def check_netconf_config_mesg(self, target, xml_config_str):
         manager = fake_netconf_connect(target)
+        # pushes after the first one only carry the changes, match the
+        # config they add up to
+        config = netconf_config_replay(manager.configs)
         # convert xmls to dict and see if expected xml config is present in generated config
         # expected config is only the minimum config expected from a test case where as
         # generated config may contain more than that
-        #print "\n gen: %s\n expect: %s\n"%(manager.configs[-1], xml_config_str)
-        gen_cfg = xmltodict.parse(manager.configs[-1])
+        #print "\n gen: %s\n expect: %s\n"%(config, xml_config_str)
+        gen_cfg = xmltodict.parse(config)
         expect_cfg = xmltodict.parse(xml_config_str)
         result = dictMatch(expect_cfg, gen_cfg)
         self.assertTrue(result)
@@ -0,0 +1,229 @@
+#
+# Copyright (c) 2015 Juniper Networks, Inc. All rights reserved.
+#
+
+import sys
+import logging
+import unittest
+import gevent
+sys.path.append("../common/tests")
+from flexmock import flexmock
+from lxml import etree
+from ncclient import manager
+from test_utils import *
+
+from device_manager.netconf_session import config_diff, config_normalize
+from device_manager.netconf_session import NetconfSessionPool
+
+
+def _config(body):
+    return config_normalize(etree.fromstring(
+        '<config><configuration><groups><name>__contrail__</name>%s'
+        '</groups></configuration></config>' % body))
+# end _config
+
+
+def _canonical(elem):
+    # element with its children in a fixed order, the order of siblings
+    # does not matter to the router
+    return (elem.tag, (elem.text or '').strip(), sorted(elem.attrib.items()),
+            sorted(_canonical(child) for child in elem))
+# end _canonical
+
+
+_RI = ('<routing-instances><instance><name>%s</name>'
+       '<instance-type>vrf</instance-type>'
+       '<vrf-target><community>%s</community></vrf-target>'
+       '</instance></routing-instances>')
+
+_POLICY = ('<policy-options><policy-statement><name>%s</name><term>'
+           '<name>t1</name><from><community>%s</community></from>'
+           '<then><accept/></then></term></policy-statement>'
+           '</policy-options>')
+
+
+class TestConfigDiff(unittest.TestCase):
+
+    # (description, old config, new config, elements expected in the
+    # diff as (path, operation))
+    cases = [
+        ('changed leaf',
+         '<routing-options><autonomous-system><as-number>64512'
+         '</as-number></autonomous-system></routing-options>',
+         '<routing-options><autonomous-system><as-number>64513'
+         '</as-number></autonomous-system></routing-options>',
+         [('configuration/groups/routing-options/autonomous-system',
+           'replace')]),
+        ('removed named element',
+         '<protocols><bgp><group><name>g1</name><type>internal</type>'
+         '</group><group><name>g2</name><type>external</type></group>'
+         '</bgp></protocols>',
+         '<protocols><bgp><group><name>g1</name><type>internal</type>'
+         '</group></bgp></protocols>',
+         [('configuration/groups/protocols/bgp/group', 'delete')]),
+        ('removed routing instance',
+         _RI % ('ri1', 'target:1:1') + _RI % ('ri2', 'target:1:2'),
+         _RI % ('ri1', 'target:1:1'),
+         [('configuration/groups/routing-instances/instance', 'delete')]),
+        ('changed single entry of a leaf-list',
+         _POLICY % ('p1', 'a:1'),
+         _POLICY % ('p1', 'b:2'),
+         [('configuration/groups/policy-options/policy-statement/term/from',
+           'replace')]),
+    ]
+
+    def test_diff(self):
+        for (desc, old, new, expected) in self.cases:
+            (old, new) = (_config(old), _config(new))
+            diff = config_diff(old, new)
+            self.assertIsNotNone(diff, desc)
+            for (path, operation) in expected:
+                elem = diff.find(path)
+                self.assertIsNotNone(elem, '%s: %s' % (desc, path))
+                self.assertEqual(elem.get('operation'), operation, desc)
+            # the router ends up with the new config
+            running = netconf_config_apply(copy.deepcopy(old), diff)
+            self.assertEqual(_canonical(running), _canonical(new), desc)
+    # end test_diff
+
+    def test_diff_names_removed_element(self):
+        old = _config(_RI % ('ri1', 'target:1:1') + _RI % ('ri2', 'target:1:2'))
+        new = _config(_RI % ('ri1', 'target:1:1'))
+        gone = config_diff(old, new).find(
+            'configuration/groups/routing-instances/instance')
+        self.assertEqual(gone.findtext('name'), 'ri2')
+        self.assertEqual(len(gone), 1)
+    # end test_diff_names_removed_element
+
+    def test_diff_leaf_list_not_merged(self):
+        # a merge of the new value alone would keep a:1 in the list
+        diff = config_diff(_config(_POLICY % ('p1', 'a:1')),
+                           _config(_POLICY % ('p1', 'b:2')))
+        self.assertEqual(
+            [elem.text for elem in diff.iter('community')], ['b:2'])
+        self.assertIsNone(diff.find(
+            'configuration/groups/policy-options/policy-statement').get(
+                'operation'))
+    # end test_diff_leaf_list_not_merged
+
+    def test_diff_identical(self):
+        for (desc, old, new, expected) in self.cases:
+            self.assertIsNone(config_diff(_config(old), _config(old)), desc)
+            self.assertIsNone(config_diff(_config(new), _config(new)), desc)
+    # end test_diff_identical
+
+    def test_normalize(self):
+        config = _config(_RI % ('ri1', 'target:1:1') +
+                         '<routing-instances><instance><name>ri1</name>'
+                         '<interface><name>ge-0/0/0.0</name></interface>'
+                         '</instance></routing-instances>')
+        instances = config.findall(
+            'configuration/groups/routing-instances/instance')
+        self.assertEqual(len(config.findall(
+            'configuration/groups/routing-instances')), 1)
+        self.assertEqual(len(instances), 1)
+        self.assertIsNotNone(instances[0].find('interface'))
+        self.assertIsNotNone(instances[0].find('vrf-target'))
+    # end test_normalize
+
+# end class TestConfigDiff
+
+
+class TestNetconfSessionPool(unittest.TestCase):
+
+    def setUp(self):
+        # every connect opens a new session
+        self._managers = []
+        flexmock(manager, connect=self._connect)
+        self._creds = {'username': 'admin', 'password': 'secret'}
+    # end setUp
+
+    def _connect(self, host, *args, **kwargs):
+        self._managers.append(FakeNetconfManager())
+        return self._managers[-1]
+    # end _connect
+
+    def _pool(self, keepalive_interval=0):
+        pool = NetconfSessionPool(2, keepalive_interval,
+                                  logging.getLogger(__name__))
+        self.addCleanup(gevent.killall, pool._workers +
+                        filter(None, [pool._keepalive_greenlet]))
+        return pool
+    # end _pool
+
+    def _wait(self, pool):
+        for i in range(100):
+            gevent.sleep(0.01)
+            if not pool.pending() and not pool._busy:
+                return
+        self.fail('pushes not done')
+    # end _wait
+
+    def _sent(self):
+        return [config for mgr in self._managers for config in mgr.configs]
+    # end _sent
+
+    def test_push_coalesced(self):
+        pool = self._pool()
+        configs = [etree.tostring(_config(_RI % ('ri1', 'target:1:%d' % i)))
+                   for i in range(3)]
+        for config in configs:
+            pool.push('1.1.1.1', self._creds, config)
+        self._wait(pool)
+        # only the latest config is sent
+        self.assertEqual(self._sent(), configs[-1:])
+
+        # then only its changes
+        pool.push('1.1.1.1', self._creds, etree.tostring(
+            _config(_RI % ('ri1', 'target:1:2') + _RI % ('ri2', 'target:1:3'))))
+        self._wait(pool)
+        self.assertEqual(len(self._managers), 1)
+        sent = etree.fromstring(self._sent()[-1])
+        self.assertEqual(
+            [elem.findtext('name') for elem in sent.iter('instance')], ['ri2'])
+    # end test_push_coalesced
+
+    def test_pending_delete_kept(self):
+        pool = self._pool()
+        config = etree.tostring(_config(_RI % ('ri1', 'target:1:1')))
+        pool.push('1.1.1.1', self._creds, config)
+        self._wait(pool)
+
+        delete = etree.tostring(etree.fromstring(
+            '<config><configuration><groups operation="delete">'
+            '<name>__contrail__</name></groups></configuration></config>'))
+        pool.push('1.1.1.1', self._creds, delete, delete=True)
+        pool.push('1.1.1.1', self._creds, config)
+        self._wait(pool)
+        # the config following the delete is sent whole on a new session
+        self.assertEqual(self._sent(), [config, delete, config])
+        self.assertEqual(len(self._managers), 2)
+    # end test_pending_delete_kept
+
+    def test_reconnect(self):
+        pool = self._pool(keepalive_interval=0.05)
+        config = etree.tostring(_config(_RI % ('ri1', 'target:1:1')))
+        pool.push('1.1.1.1', self._creds, config)
+        self._wait(pool)
+
+        # session dropped by the router, opened again by the keepalive
+        self._managers[-1].connected = False
+        gevent.sleep(0.2)
+        self.assertEqual(len(self._managers), 2)
+        self.assertTrue(self._managers[-1].connected)
+
+        # dropped again with a push pending, only the push reconnects
+        self._managers[-1].connected = False
+        pool.push('1.1.1.1', self._creds, etree.tostring(
+            _config(_RI % ('ri1', 'target:1:2'))))
+        self._wait(pool)
+        gevent.sleep(0.2)
+        self.assertEqual(len(self._managers), 3)
+        self.assertEqual(len(self._managers[-1].configs), 1)
+    # end test_reconnect
+
+# end class TestNetconfSessionPool
+
+
+if __name__ == '__main__':
+    unittest.main()
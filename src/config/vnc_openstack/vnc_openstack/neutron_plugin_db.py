@@ -46,6 +46,9 @@ class DBInterface(object):
     An instance of this class forwards requests to vnc cfg api (web)server
     """
     Q_URL_PREFIX = '/extensions/ct'
+    # uuids per list request, obj_uuids goes in the query string and the
+    # api-server does not take request lines over 8k
+    _LIST_OBJ_UUIDS_COUNT = 150
 
     def __init__(self, admin_name, admin_password, admin_tenant_name,
                  api_srvr_ip, api_srvr_port, user_info=None,
@@ -661,44 +664,80 @@ class DBInterface(object):
             return ret_list
 
         net_ids = [net_obj.uuid for net_obj in net_objs]
-        all_port_gevent = gevent.spawn(self._virtual_machine_interface_list,
-                                       back_ref_id=net_ids)
-        port_iip_gevent = gevent.spawn(self._instance_ip_list, back_ref_id=net_ids)
-        port_vm_gevent = gevent.spawn(self._virtual_machine_list)
-        gevent.joinall([all_port_gevent, port_iip_gevent, port_vm_gevent])
-
-        all_port_objs = all_port_gevent.value
-        port_iip_objs = port_iip_gevent.value
-        port_vm_objs = port_vm_gevent.value
-
-        return self._port_list(net_objs, all_port_objs, port_iip_objs, port_vm_objs)
+        port_objs = self._virtual_machine_interface_list(back_ref_id=net_ids)
+        return self._port_list_referred(port_objs, net_objs)
     #end _port_list_network
 
+    # objects of obj_uuids from list_method, in requests of at most
+    # _LIST_OBJ_UUIDS_COUNT uuids
+    def _list_obj_uuids(self, list_method, obj_uuids, **kwargs):
+        objs = []
+        for i in range(0, len(obj_uuids), self._LIST_OBJ_UUIDS_COUNT):
+            objs.extend(list_method(
+                obj_uuids=obj_uuids[i:i + self._LIST_OBJ_UUIDS_COUNT],
+                **kwargs))
+        return objs
+    #end _list_obj_uuids
+
+    # ports of port_objs, reading only the networks, instance ips and
+    # virtual machines they refer to
+    def _port_list_referred(self, port_objs, net_objs=None):
+        net_objs = list(net_objs or [])
+        net_ids = set()
+        iip_ids = set()
+        vm_ids = set()
+        for port_obj in port_objs:
+            for net_ref in port_obj.get_virtual_network_refs() or []:
+                net_ids.add(net_ref['uuid'])
+            for iip_back_ref in getattr(port_obj, 'instance_ip_back_refs',
+                                        None) or []:
+                iip_ids.add(iip_back_ref['uuid'])
+            for vm_ref in port_obj.get_virtual_machine_refs() or []:
+                vm_ids.add(vm_ref['uuid'])
+        net_ids -= set([net_obj.uuid for net_obj in net_objs])
+
+        # an empty obj_uuids would list every object, skip those reads
+        port_net_gevent = port_iip_gevent = port_vm_gevent = None
+        if net_ids:
+            port_net_gevent = gevent.spawn(self._list_obj_uuids,
+                                           self._virtual_network_list,
+                                           list(net_ids), detail=True)
+        if iip_ids:
+            port_iip_gevent = gevent.spawn(self._list_obj_uuids,
+                                           self._instance_ip_list,
+                                           list(iip_ids))
+        if vm_ids:
+            port_vm_gevent = gevent.spawn(self._list_obj_uuids,
+                                          self._virtual_machine_list,
+                                          list(vm_ids))
+        gevent.joinall([g for g in (port_net_gevent, port_iip_gevent,
+                                    port_vm_gevent) if g is not None])
+
+        if port_net_gevent is not None:
+            net_objs.extend(port_net_gevent.get())
+        # a greenlet that is done is false, test it against None
+        port_iip_objs = []
+        if port_iip_gevent is not None:
+            port_iip_objs = port_iip_gevent.get()
+        port_vm_objs = []
+        if port_vm_gevent is not None:
+            port_vm_objs = port_vm_gevent.get()
+
+        return self._port_list(net_objs, port_objs, port_iip_objs,
+                               port_vm_objs)
+    #end _port_list_referred
+
     # find port ids on a given project
     def _port_list_project(self, project_id, count=False):
         if self._list_optimization_enabled:
             if count:
-                port_objs = self._virtual_machine_interface_list(parent_id=project_id)
-                return len(port_objs)
+                return self._port_count_project(project_id)
 
             # it is a list operation, not count
-            # read all VMI and IIP in detail one-shot
-            all_port_gevent = gevent.spawn(self._virtual_machine_interface_list,
-                                           parent_id=project_id)
-            port_iip_gevent = gevent.spawn(self._instance_ip_list)
-            port_vm_gevent = gevent.spawn(self._virtual_machine_list)
-            port_net_gevent = gevent.spawn(self._virtual_network_list,
-                                           parent_id=project_id,
-                                           detail=True)
-
-            gevent.joinall([all_port_gevent, port_iip_gevent, port_net_gevent, port_vm_gevent])
-
-            all_port_objs = all_port_gevent.value
-            port_iip_objs = port_iip_gevent.value
-            port_net_objs = port_net_gevent.value
-            port_vm_objs = port_vm_gevent.value
-
-            return self._port_list(port_net_objs, port_objs, iip_objs, vm_objs)
+            # read the VMIs of the project, then only what they refer to
+            port_objs = self._virtual_machine_interface_list(
+                parent_id=project_id)
+            return self._port_list_referred(port_objs)
         else:
             if count:
                 ret_val = 0
@@ -719,11 +758,22 @@ class DBInterface(object):
 
             net_ids = [net_obj.uuid for net_obj in net_objs]
             port_objs = self._virtual_machine_interface_list(back_ref_id=net_ids)
-            iip_objs = self._instance_ip_list(back_ref_id=net_ids)
-            vm_objs = self._virtual_machine_list()
-            return self._port_list(net_objs, port_objs, iip_objs, vm_objs)
+            return self._port_list_referred(port_objs, net_objs)
     #end _port_list_project
 
+    # count of ports from api-server, without reading them
+    def _port_count_project(self, project_id):
+        return self._vnc_lib.virtual_machine_interfaces_list(
+            parent_id=project_id,
+            count=True)['virtual-machine-interfaces']['count']
+    #end _port_count_project
+
+    def _port_count_network(self, network_ids):
+        return self._vnc_lib.virtual_machine_interfaces_list(
+            back_ref_id=network_ids,
+            count=True)['virtual-machine-interfaces']['count']
+    #end _port_count_network
+
     # Returns True if
     #     * no filter is specified
     #     OR
@@ -3666,10 +3716,11 @@ class DBInterface(object):
             else:
                 project_id = str(uuid.UUID(filters['tenant_id']))
 
-            nports = len(self._port_list_project(project_id))
+            nports = self._port_list_project(project_id, count=True)
+        elif filters.keys() == ['network_id']:
+            nports = self._port_count_network(filters['network_id'])
         else:
-            # across all projects - TODO very expensive,
-            # get only a count from api-server!
+            # other filters need the ports to match against
             nports = len(self.port_list(filters=filters))
 
         return nports
@@ -0,0 +1,116 @@
+import sys
+import json
+import uuid
+
+import fixtures
+sys.path.append('../common/tests')
+from testtools.matchers import Equals, Contains
+
+from vnc_api.vnc_api import *
+
+from test_utils import *
+import test_common
+import test_case
+
+
+class NBTestPortList(test_case.NeutronBackendTestCase):
+    def _request(self, res_type, operation, data, tenant_id=None):
+        context = {'operation': operation,
+                   'user_id': '',
+                   'roles': '',
+                   'is_admin': False,
+                   'tenant': tenant_id}
+        body = {'context': context, 'data': data}
+        resp = self._api_svr_app.post_json('/neutron/%s' %(res_type), body)
+        return json.loads(resp.text)
+    # end _request
+
+    def _create_resource(self, res_type, proj_id, extra_res_fields=None):
+        data = {'resource': {'name': '%s-%s' %(res_type, str(uuid.uuid4())),
+                             'tenant_id': proj_id}}
+        if extra_res_fields:
+            data['resource'].update(extra_res_fields)
+        return self._request(res_type, 'CREATE', data)
+    # end _create_resource
+
+    def _create_ports(self, count):
+        # project with two networks, its ports spread over them
+        proj_obj = Project('project-%s' %(str(uuid.uuid4())))
+        self._vnc_lib.project_create(proj_obj)
+        self._vnc_lib.security_group_create(
+            SecurityGroup('default', parent_obj=proj_obj))
+        net_ids = []
+        for i in range(2):
+            net_q = self._create_resource('network', proj_obj.uuid)
+            self._create_resource('subnet', proj_obj.uuid,
+                                  {'network_id': net_q['id'],
+                                   'cidr': '10.0.%d.0/24' %(i)})
+            net_ids.append(net_q['id'])
+        port_ids = []
+        for i in range(count):
+            port_q = self._create_resource('port', proj_obj.uuid,
+                                           {'network_id': net_ids[i % 2]})
+            port_ids.append(port_q['id'])
+        return proj_obj.uuid, net_ids, sorted(port_ids)
+    # end _create_ports
+
+    def _list_ports(self, proj_id, filters=None):
+        return self._request('port', 'READALL',
+                             {'filters': filters or {}, 'fields': None},
+                             tenant_id=proj_id)
+    # end _list_ports
+
+    def _count_ports(self, proj_id, filters):
+        return self._request('port', 'READCOUNT', {'filters': filters},
+                             tenant_id=proj_id)['count']
+    # end _count_ports
+
+    def test_port_list(self):
+        # a few uuids per list request, for the objects the ports refer
+        # to to be read in several requests
+        self.useFixture(fixtures.MonkeyPatch(
+            'vnc_openstack.neutron_plugin_db.DBInterface.'
+            '_LIST_OBJ_UUIDS_COUNT', 2))
+        proj_id, net_ids, port_ids = self._create_ports(5)
+
+        ports_q = self._list_ports(proj_id, {'tenant_id': [proj_id]})
+        self.assertThat(sorted([port_q['id'] for port_q in ports_q]),
+                        Equals(port_ids))
+        for port_q in ports_q:
+            self.assertThat(net_ids, Contains(port_q['network_id']))
+            self.assertThat(len(port_q['fixed_ips']), Equals(1))
+    # end test_port_list
+
+    def test_port_count(self):
+        proj_id, net_ids, port_ids = self._create_ports(5)
+
+        self.assertThat(self._count_ports(proj_id, {'tenant_id': [proj_id]}),
+                        Equals(5))
+        # other filters along with the tenant count the project ports
+        self.assertThat(self._count_ports(proj_id,
+                                          {'tenant_id': [proj_id],
+                                           'admin_state_up': [True]}),
+                        Equals(5))
+        for net_id in net_ids:
+            filters = {'network_id': [net_id]}
+            self.assertThat(self._count_ports(proj_id, filters),
+                            Equals(len(self._list_ports(proj_id, filters))))
+    # end test_port_count
+# end class NBTestPortList
+
+
+class NBTestPortListOptimized(NBTestPortList):
+    def __init__(self, *args, **kwargs):
+        super(NBTestPortListOptimized, self).__init__(*args, **kwargs)
+        self._config_knobs.append(
+            ('DEFAULTS', 'list_optimization_enabled', True))
+    # end __init__
+
+    def test_port_list_no_filters(self):
+        proj_id, net_ids, port_ids = self._create_ports(3)
+
+        ports_q = self._list_ports(proj_id)
+        self.assertThat(sorted([port_q['id'] for port_q in ports_q]),
+                        Equals(port_ids))
+    # end test_port_list_no_filters
+# end class NBTestPortListOptimized
@@ -20,6 +20,8 @@ from pycassa.types import *
 class DiscoveryCassandraClient(object):
     _DISCOVERY_KEYSPACE_NAME = 'DISCOVERY_SERVER'
     _DISCOVERY_CF_NAME = 'discovery'
+    # in-use counts are checked against the database every interval
+    _IN_USE_RESYNC_INTERVAL = 60
 
     @classmethod
     def get_db_info(cls):
@@ -34,7 +36,14 @@ class DiscoveryCassandraClient(object):
         self._cassandra_init(cass_srv_list)
 
         self._debug = {
+            'in_use_resync': 0,
+            'in_use_drift': 0,
         }
+
+        # service_type -> service_id -> client_id -> subscription expiry
+        self._in_use = {}
+        self._in_use_resync()
+        self._in_use_greenlet = gevent.spawn(self._in_use_resync_loop)
     #end __init__
 
     # Helper routines for cassandra
@@ -112,6 +121,7 @@ class DiscoveryCassandraClient(object):
         ('subscriber', service_id, client_id)
         ('subscription', client_id, service_id)
         ('service', service_id, 'service-entry')
+        ('heartbeat', service_id, 'heartbeat-entry')
     """
 
     # decorator to catch connectivity error
@@ -126,6 +136,81 @@ class DiscoveryCassandraClient(object):
                 raise
         return error_handler
 
+    # subscriber counts of publishers, kept in memory and updated as
+    # subscriptions are added, deleted or expire
+    def _in_use_add(self, service_type, service_id, client_id, expires):
+        subs = self._in_use.setdefault(service_type, {}).setdefault(
+            service_id, {})
+        subs[client_id] = expires
+    # end _in_use_add
+
+    def _in_use_delete(self, service_type, service_id=None, client_id=None):
+        if service_id is None:
+            self._in_use.pop(service_type, None)
+            return
+        subs = self._in_use.get(service_type, {}).get(service_id)
+        if subs is not None:
+            subs.pop(client_id, None)
+    # end _in_use_delete
+
+    def _in_use_count(self, service_type, service_id):
+        subs = self._in_use.get(service_type, {}).get(service_id)
+        if not subs:
+            return 0
+        now = time.time()
+        return len([expires for expires in subs.values() if expires > now])
+    # end _in_use_count
+
+    # columns of the tag slice of a service type row. get and get_range
+    # return at most column_count (100 by default) columns of a row, xget
+    # reads them all in pages
+    def _xget_tag(self, service_type, tag):
+        col_name = (tag,)
+        return self._disco_cf.xget(service_type, column_start = col_name,
+            column_finish = col_name)
+    # end _xget_tag
+
+    # rebuild the counts from the subscriber columns, this also picks up
+    # subscriptions made through other discovery servers
+    @cass_error_handler
+    def _in_use_resync(self):
+        in_use = {}
+        col_name = ('subscriber',)
+        # service types with subscribers, their columns are read apart
+        data = self._disco_cf.get_range(column_start = col_name,
+            column_finish = col_name, column_count = 1)
+        for service_type, _ in data:
+            for col_name, col_val in self._xget_tag(service_type,
+                                                    'subscriber'):
+                (foo, service_id, client_id) = col_name
+                entry = json.loads(col_val)
+                expires = (entry['mtime'] + entry['ttl'] +
+                           disc_consts.TTL_EXPIRY_DELTA)
+                in_use.setdefault(service_type, {}).setdefault(
+                    service_id, {})[client_id] = expires
+        drift = 0
+        for service_type in set(in_use.keys() + self._in_use.keys()):
+            old_subs = self._in_use.get(service_type, {})
+            new_subs = in_use.get(service_type, {})
+            for service_id in set(old_subs.keys() + new_subs.keys()):
+                if (set(old_subs.get(service_id, {})) !=
+                        set(new_subs.get(service_id, {}))):
+                    drift += 1
+        self._in_use = in_use
+        self._debug['in_use_resync'] += 1
+        self._debug['in_use_drift'] += drift
+    # end _in_use_resync
+
+    def _in_use_resync_loop(self):
+        while True:
+            gevent.sleep(self._IN_USE_RESYNC_INTERVAL)
+            try:
+                self._in_use_resync()
+            except Exception:
+                # keep counting from memory till the next resync
+                pass
+    # end _in_use_resync_loop
+
     # return all publisher entries
     @cass_error_handler
     def service_entries(self, service_type = None):
@@ -133,12 +218,14 @@ class DiscoveryCassandraClient(object):
         try:
             data = self._disco_cf.get_range(column_start = col_name, column_finish = col_name)
             for service_type, services in data:
+                heartbeats = self._lookup_pub_cols(service_type, 'heartbeat')
+                ts_uses = self._lookup_pub_cols(service_type, 'ts_use')
                 for col_name in services:
                     col_value = services[col_name]
                     entry = json.loads(col_value)
-                    col_name = ('subscriber', entry['service_id'],)
-                    entry['in_use'] = self._disco_cf.get_count(service_type, 
-                        column_start = col_name, column_finish = col_name)
+                    self._merge_pub_cols(entry, heartbeats, ts_uses)
+                    entry['in_use'] = self._in_use_count(service_type,
+                        entry['service_id'])
                     yield(entry)
         except pycassa.pool.AllServersUnavailable:
             raise disc_exceptions.ServiceUnavailable()
@@ -219,11 +306,59 @@ class DiscoveryCassandraClient(object):
         self._disco_cf.insert(service_type, {col_name : json.dumps(entry)})
     # end insert_service
 
+    # heartbeat timestamps are kept apart from the service entry so they
+    # can be written in batches without rewriting the entry
+    @cass_error_handler
+    def update_heartbeats(self, heartbeats):
+        rows = {}
+        for service_type, service_id, heartbeat in heartbeats:
+            col_name = ('heartbeat', service_id, 'heartbeat-entry')
+            rows.setdefault(service_type, {})[col_name] = json.dumps(heartbeat)
+        self._disco_cf.batch_insert(rows)
+    # end update_heartbeats
+
+    # publisher use timestamps are kept apart from the service entry too,
+    # the entry is written only by its publisher
+    @cass_error_handler
+    def update_ts_uses(self, ts_uses):
+        rows = {}
+        for service_type, service_id, ts_use in ts_uses:
+            col_name = ('ts_use', service_id, 'ts_use-entry')
+            rows.setdefault(service_type, {})[col_name] = json.dumps(ts_use)
+        self._disco_cf.batch_insert(rows)
+    # end update_ts_uses
+
+    # (service_type, service_id) of the publishers of the service types
+    # that have a service entry
+    @cass_error_handler
+    def service_ids(self, service_types):
+        return set((service_type, col_name[1])
+                   for service_type in service_types
+                   for col_name, _ in self._xget_tag(service_type, 'service'))
+    # end service_ids
+
+    # values of the publishers of a service type kept in their own
+    # column, by service id
+    def _lookup_pub_cols(self, service_type, tag):
+        return dict((col_name[1], json.loads(col_val))
+                    for col_name, col_val in self._xget_tag(service_type, tag))
+    # end _lookup_pub_cols
+
+    def _merge_pub_cols(self, entry, heartbeats, ts_uses):
+        heartbeat = heartbeats.get(entry['service_id'])
+        if heartbeat is not None and heartbeat > entry['heartbeat']:
+            entry['heartbeat'] = heartbeat
+        ts_use = ts_uses.get(entry['service_id'])
+        if ts_use is not None:
+            entry['ts_use'] = ts_use
+    # end _merge_pub_cols
+
     # forget service and subscribers
     @cass_error_handler
     def delete_service(self, entry):
         col_name = ('service', entry['service_id'], 'service-entry')
         self._disco_cf.remove(entry['service_type'])
+        self._in_use_delete(entry['service_type'])
      #end delete_service
 
     # return service entry
@@ -231,22 +366,32 @@ class DiscoveryCassandraClient(object):
     def lookup_service(self, service_type, service_id=None):
         try:
             if service_id:
-                services = self._disco_cf.get(service_type, columns = [('service', service_id, 'service-entry')])
-                data = [json.loads(val) for col,val in services.items()]
-                entry = data[0]
-                col_name = ('subscriber', service_id,)
-                entry['in_use'] = self._disco_cf.get_count(service_type, 
-                    column_start = col_name, column_finish = col_name)
+                service_col = ('service', service_id, 'service-entry')
+                hb_col = ('heartbeat', service_id, 'heartbeat-entry')
+                ts_col = ('ts_use', service_id, 'ts_use-entry')
+                services = self._disco_cf.get(service_type,
+                    columns = [service_col, hb_col, ts_col])
+                if service_col not in services:
+                    return None
+                entry = json.loads(services[service_col])
+                self._merge_pub_cols(entry,
+                    dict((service_id, json.loads(services[hb_col]))
+                         for col in [hb_col] if col in services),
+                    dict((service_id, json.loads(services[ts_col]))
+                         for col in [ts_col] if col in services))
+                entry['in_use'] = self._in_use_count(service_type, service_id)
                 return entry
             else:
                 col_name = ('service',)
                 services = self._disco_cf.get(service_type, 
                     column_start = col_name, column_finish = col_name)
                 data = [json.loads(val) for col,val in services.items()]
+                heartbeats = self._lookup_pub_cols(service_type, 'heartbeat')
+                ts_uses = self._lookup_pub_cols(service_type, 'ts_use')
                 for entry in data:
-                    col_name = ('subscriber', entry['service_id'],)
-                    entry['in_use'] = self._disco_cf.get_count(service_type, 
-                        column_start = col_name, column_finish = col_name)
+                    self._merge_pub_cols(entry, heartbeats, ts_uses)
+                    entry['in_use'] = self._in_use_count(service_type,
+                        entry['service_id'])
                 return data
         except pycassa.NotFoundException:
             return None
@@ -267,13 +412,16 @@ class DiscoveryCassandraClient(object):
     # insert a subscription (blob/ttl per service_type)
     @cass_error_handler
     def insert_client(self, service_type, service_id, client_id, blob, ttl):
-        col_val = json.dumps({'ttl': ttl, 'blob': blob, 'mtime': int(time.time())})
+        mtime = int(time.time())
+        col_val = json.dumps({'ttl': ttl, 'blob': blob, 'mtime': mtime})
         col_name = ('subscriber', service_id, client_id)
         self._disco_cf.insert(service_type, {col_name : col_val}, 
             ttl = ttl + disc_consts.TTL_EXPIRY_DELTA)
         col_name = ('client', client_id, service_id)
         self._disco_cf.insert(service_type, {col_name : col_val}, 
             ttl = ttl + disc_consts.TTL_EXPIRY_DELTA)
+        self._in_use_add(service_type, service_id, client_id,
+                         mtime + ttl + disc_consts.TTL_EXPIRY_DELTA)
     # end insert_client
 
     # return client (subscriber) entry
@@ -327,6 +475,7 @@ class DiscoveryCassandraClient(object):
             columns = [('client', client_id, service_id)])
         self._disco_cf.remove(service_type,
             columns = [('subscriber', service_id, client_id)])
+        self._in_use_delete(service_type, service_id, client_id)
     # end
 
     # return tuple (service_type, client_id, service_id)
@@ -21,3 +21,6 @@ HC_INTERVAL = 5
 # Expire published info after successive heartbeat miss
 HC_MAX_MISS = 5
 
+# Heartbeats are written to database in a batch every interval
+HB_FLUSH_INTERVAL = 5
+
@@ -198,6 +198,22 @@ class DiscoveryServer():
         self._sub_data = {}
         for (client_id, service_type) in self._db_conn.subscriber_entries():
             self.create_sub_data(client_id, service_type)
+
+        # build in-memory publisher data, authoritative for liveness.
+        # heartbeats only update it and are written to the database in
+        # batches by the flush task
+        self._pub_data = {}
+        self._hb_dirty = set()
+        for entry in self._db_conn.service_entries():
+            self.create_pub_data(entry['service_id'], entry['service_type'],
+                                 entry['heartbeat'])
+
+        # per service type view of active publishers in policy order,
+        # subscribes are assigned from it. publisher use timestamps for
+        # round-robin are written to database by the flush task
+        self._service_views = {}
+        self._ts_use_dirty = {}
+        self._db_flush_greenlet = gevent.spawn(self._db_flush)
     # end __init__
 
     def create_sub_data(self, client_id, service_type):
@@ -226,6 +242,120 @@ class DiscoveryServer():
         return self.create_sub_data(id, service_type)
     # end
 
+    def create_pub_data(self, service_id, service_type, heartbeat):
+        if not service_id in self._pub_data:
+            self._pub_data[service_id] = {}
+        pdata = self._pub_data[service_id].get(service_type)
+        if pdata is None:
+            pdata = {'heartbeat': heartbeat}
+            self._pub_data[service_id][service_type] = pdata
+        elif heartbeat > pdata['heartbeat']:
+            pdata['heartbeat'] = heartbeat
+        return pdata
+    # end
+
+    def delete_pub_data(self, service_id, service_type):
+        if (service_id in self._pub_data and
+                service_type in self._pub_data[service_id]):
+            del self._pub_data[service_id][service_type]
+            if len(self._pub_data[service_id]) == 0:
+                del self._pub_data[service_id]
+        self._hb_dirty.discard((service_type, service_id))
+    # end
+
+    def get_pub_data(self, service_id, service_type):
+        if (service_id in self._pub_data and
+                service_type in self._pub_data[service_id]):
+            return self._pub_data[service_id][service_type]
+        return None
+    # end
+
+    def _db_flush(self):
+        while True:
+            gevent.sleep(self._args.hb_flush_interval)
+            self._hb_flush()
+            self._ts_use_flush()
+    # end _db_flush
+
+    # write heartbeats received since the last flush in one batch
+    def _hb_flush(self):
+        if not self._hb_dirty:
+            return
+        dirty = self._hb_dirty
+        self._hb_dirty = set()
+        try:
+            # publishers purged by a cleanup here or on another server
+            # lose their data, their next heartbeat gets a 404 and they
+            # publish again
+            published = self._db_conn.service_ids(
+                set(service_type for (service_type, _) in dirty))
+            heartbeats = []
+            for (service_type, service_id) in dirty:
+                if (service_type, service_id) not in published:
+                    self.delete_pub_data(service_id, service_type)
+                    self.invalidate_service_view(service_type)
+                    continue
+                pdata = self.get_pub_data(service_id, service_type)
+                if pdata:
+                    heartbeats.append(
+                        (service_type, service_id, pdata['heartbeat']))
+            self._db_conn.update_heartbeats(heartbeats)
+            self._debug['db_upd_hb'] += len(heartbeats)
+        except Exception as e:
+            # retry with the next flush
+            self._hb_dirty |= dirty
+            self.syslog('Unable to write heartbeats: %s' % (str(e)))
+    # end _hb_flush
+
+    # write publisher use timestamps of the assignments since the last
+    # flush in one batch
+    def _ts_use_flush(self):
+        if not self._ts_use_dirty:
+            return
+        dirty = self._ts_use_dirty
+        self._ts_use_dirty = {}
+        try:
+            self._db_conn.update_ts_uses(
+                [(service_type, service_id, ts_use)
+                 for (service_type, service_id), ts_use in dirty.items()])
+        except Exception as e:
+            # retry with the next flush unless used again since
+            for key, ts_use in dirty.items():
+                self._ts_use_dirty.setdefault(key, ts_use)
+            self.syslog('Unable to write publisher use: %s' % (str(e)))
+    # end _ts_use_flush
+
+    # active publishers of a service type in policy order, built from the
+    # database at most once per health check interval
+    def get_service_view(self, service_type):
+        view = self._service_views.get(service_type)
+        if view is None or view['expires'] < time.time():
+            pubs = self._db_conn.lookup_service(service_type) or []
+            pubs_active = [item for item in pubs
+                           if not self.service_expired(item)]
+            view = {
+                'count': len(pubs),
+                'active': self.service_list(service_type, pubs_active),
+                'expires': time.time() + (self._args.hc_interval if
+                    self._args.hc_interval > 0 else disc_consts.HC_INTERVAL),
+            }
+            self._service_views[service_type] = view
+        return view
+    # end
+
+    def invalidate_service_view(self, service_type):
+        self._service_views.pop(service_type, None)
+    # end
+
+    # account a new assignment of a publisher from the view
+    def service_view_assign(self, service_type, entry):
+        entry['in_use'] += 1
+        entry['ts_use'] = self._ts_use
+        self._ts_use += 1
+        self._ts_use_dirty[(service_type, entry['service_id'])] = \
+            entry['ts_use']
+    # end
+
     # Public Methods
     def get_args(self):
         return self._args
@@ -299,8 +429,12 @@ class DiscoveryServer():
 
     # check if service expired (return color along)
     def service_expired(self, entry, include_color=False, include_down=True):
+        heartbeat = entry['heartbeat']
+        pdata = self.get_pub_data(entry['service_id'], entry['service_type'])
+        if pdata and pdata['heartbeat'] > heartbeat:
+            heartbeat = pdata['heartbeat']
         timedelta = datetime.timedelta(
-                seconds=(int(time.time()) - entry['heartbeat']))
+                seconds=(int(time.time()) - heartbeat))
 
         if self._args.hc_interval <= 0:
             # health check has been disabled
@@ -350,18 +484,26 @@ class DiscoveryServer():
 
         service_type = info[1]
         service_id = info[0]
-        entry = self._db_conn.lookup_service(service_type, service_id)
-        if not entry:
-            self.syslog('Received stray heartbeat with cookie %s' % (sig))
-            self._debug['hb_stray'] += 1
-            bottle.abort(404, 'Publisher %s not found' % sig)
-
-        # update heartbeat timestamp in database
-        entry['heartbeat'] = int(time.time())
-
-        # insert entry if timed out by background task
-        self._db_conn.update_service(
-                service_type, entry['service_id'], entry)
+        pdata = self.get_pub_data(service_id, service_type)
+        if not pdata:
+            # published through another discovery server
+            entry = self._db_conn.lookup_service(service_type, service_id)
+            if not entry:
+                self.syslog('Received stray heartbeat with cookie %s' % (sig))
+                self._debug['hb_stray'] += 1
+                bottle.abort(404, 'Publisher %s not found' % sig)
+            pdata = self.create_pub_data(service_id, service_type,
+                                         entry['heartbeat'])
+
+        # publisher back in service
+        if (self._args.hc_interval > 0 and int(time.time()) -
+                pdata['heartbeat'] >
+                self._args.hc_interval * self._args.hc_max_miss):
+            self.invalidate_service_view(service_type)
+
+        # update heartbeat timestamp, written to database by flush task
+        pdata['heartbeat'] = int(time.time())
+        self._hb_dirty.add((service_type, service_id))
 
         m = sandesh.dsHeartBeat(
             publisher_id=sig, service_type=service_type,
@@ -435,6 +577,8 @@ class DiscoveryServer():
 
         # insert entry if new or timed out
         self._db_conn.update_service(service_type, sig, entry)
+        self.create_pub_data(sig, service_type, entry['heartbeat'])
+        self.invalidate_service_view(service_type)
 
         response = {'cookie': sig + ':' + service_type}
         if ctype != 'application/json':
@@ -540,8 +684,8 @@ class DiscoveryServer():
             sdata['ttl_expires'] += 1
 
         # send short ttl if no publishers
-        pubs = self._db_conn.lookup_service(service_type) or []
-        pubs_active = [item for item in pubs if not self.service_expired(item)]
+        view = self.get_service_view(service_type)
+        pubs_active = view['active']
         if len(pubs_active) < count:
             ttl = random.randint(1, 32)
             self._debug['ttl_short'] += 1
@@ -549,7 +693,7 @@ class DiscoveryServer():
         self.syslog(
             'subscribe: service type=%s, client=%s:%s, ttl=%d, asked=%d pubs=%d/%d, subs=%d'
             % (service_type, client_type, client_id, ttl, count,
-            len(pubs), len(pubs_active), len(subs)))
+            view['count'], len(pubs_active), len(subs)))
 
         # handle query for all publishers
         if count == 0:
@@ -580,12 +724,10 @@ class DiscoveryServer():
                     return response
 
 
-        # skip duplicates from existing assignments
+        # skip duplicates from existing assignments, view is already in
+        # policy order (lb, rr, fixed ...)
 	pubs = [entry for entry in pubs_active if not entry['service_id'] in assigned_sid]
 
-        # find instances based on policy (lb, rr, fixed ...)
-        pubs = self.service_list(service_type, pubs)
-
         # take first 'count' publishers
         for entry in pubs[:min(count, len(pubs))]:
             result = entry['info']
@@ -599,11 +741,11 @@ class DiscoveryServer():
                 service_type, entry['service_id'], client_id, result, ttl)
 
             # update publisher TS for round-robin algorithm
-            entry['ts_use'] = self._ts_use
-            self._ts_use += 1
-            self._db_conn.update_service(
-                service_type, entry['service_id'], entry)
+            self.service_view_assign(service_type, entry)
 
+        # order for the next subscribe
+        if pubs and count:
+            view['active'] = self.service_list(service_type, pubs_active)
 
         response = {'ttl': ttl, service_type: r}
         if ctype == 'application/xml':
@@ -733,6 +875,7 @@ class DiscoveryServer():
         if 'admin_state' in json_req:
             entry['admin_state'] = json_req['admin_state']
         self._db_conn.update_service(service_type, id, entry)
+        self.invalidate_service_view(service_type)
 
         self.syslog('update service=%s, sid=%s, info=%s'
                     % (service_type, id, entry))
@@ -751,6 +894,7 @@ class DiscoveryServer():
 
         entry['admin_state'] = 'down'
         self._db_conn.update_service(service_type, service_id, entry)
+        self.invalidate_service_view(service_type)
 
         self.syslog('delete service=%s, sid=%s, info=%s'
                     % (service_type, service_id, entry))
@@ -789,6 +933,9 @@ class DiscoveryServer():
         for entry in self._db_conn.service_entries():
             if self.service_expired(entry):
                 self._db_conn.delete_service(entry)
+                self.delete_pub_data(entry['service_id'],
+                                     entry['service_type'])
+                self.invalidate_service_view(entry['service_type'])
         return self.show_all_services()
     #end 
 
@@ -961,6 +1108,7 @@ def parse_args(args_str):
         'ttl_short': 0,
         'hc_interval': disc_consts.HC_INTERVAL,
         'hc_max_miss': disc_consts.HC_MAX_MISS,
+        'hb_flush_interval': disc_consts.HB_FLUSH_INTERVAL,
         'collectors': None,
         'http_server_port': '5997',
         'log_local': False,
@@ -1024,6 +1172,10 @@ def parse_args(args_str):
         "--hc_max_miss", type=int,
         help="Maximum heartbeats to miss before declaring out-of-service, "
         "default %d" % (disc_consts.HC_MAX_MISS))
+    parser.add_argument(
+        "--hb_flush_interval", type=int,
+        help="Interval to write received heartbeats to database, "
+        "default %d seconds" % (disc_consts.HB_FLUSH_INTERVAL))
     parser.add_argument("--collectors",
         help="List of VNC collectors in ip:port format",
         nargs="+")
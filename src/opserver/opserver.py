@@ -10,12 +10,14 @@
 
 from gevent import monkey
 monkey.patch_all()
+import gevent.event
 try:
     from collections import OrderedDict
 except ImportError:
     # python 2.6 or earlier, use backport
     from ordereddict import OrderedDict
 from uveserver import UVEServer
+from redis_pool import redis_pools
 import sys
 import ConfigParser
 import bottle
@@ -96,9 +98,12 @@ def obj_to_dict(obj):
 # end obj_to_dict
 
 
+# Rows read from a query result list per LRANGE
+_QUERY_RESULT_WINDOW = 1000
+
+
 def redis_query_start(host, port, redis_password, qid, inp):
-    redish = redis.StrictRedis(db=0, host=host, port=port,
-                                   password=redis_password)
+    redish = redis_pools.get(host, port, 0, redis_password)
     for key, value in inp.items():
         redish.hset("QUERY:" + qid, key, json.dumps(value))
     query_metadata = {}
@@ -120,8 +125,7 @@ def redis_query_start(host, port, redis_password, qid, inp):
 
 
 def redis_query_status(host, port, redis_password, qid):
-    redish = redis.StrictRedis(db=0, host=host, port=port,
-                               password=redis_password)
+    redish = redis_pools.get(host, port, 0, redis_password)
     resp = {"progress": 0}
     chunks = []
     # For now, the number of chunks will be always 1
@@ -144,23 +148,36 @@ def redis_query_status(host, port, redis_password, qid):
 # end redis_query_status
 
 
-def redis_query_chunk_iter(host, port, redis_password, qid, chunk_id):
-    redish = redis.StrictRedis(db=0, host=host, port=port,
-                               password=redis_password)
+def redis_query_chunk_iter(host, port, redis_password, qid, chunk_id,
+                           window=_QUERY_RESULT_WINDOW):
+    '''
+    Yield the result rows of a query chunk, reading each RESULT:<qid>:<n>
+    list in windows of at most window rows. An empty list is yielded at
+    the end of each RESULT list, and after the last one
+    '''
+    redish = redis_pools.get(host, port, 0, redis_password)
 
     iters = 0
     fin = False
 
     while not fin:
-        #import pdb; pdb.set_trace()
+        key = "RESULT:" + qid + ":" + str(iters)
         # Keep the result line valid while it is being read
-        redish.persist("RESULT:" + qid + ":" + str(iters))
-        elems = redish.lrange("RESULT:" + qid + ":" + str(iters), 0, -1)
-        yield elems
-        if elems == []:
+        redish.persist(key)
+        start = 0
+        while True:
+            elems = redish.lrange(key, start, start + window - 1)
+            if not elems:
+                break
+            yield elems
+            if len(elems) < window:
+                break
+            start += window
+        yield []
+        if start == 0 and not elems:
             fin = True
         else:
-            redish.delete("RESULT:" + qid + ":" + str(iters), 0, -1)
+            redish.delete(key)
         iters += 1
 
     return
@@ -170,29 +187,23 @@ def redis_query_chunk_iter(host, port, redis_password, qid, chunk_id):
 def redis_query_chunk(host, port, redis_password, qid, chunk_id):
     res_iter = redis_query_chunk_iter(host, port, redis_password, qid, chunk_id)
 
-    dli = u''
-    starter = True
-    fin = False
     yield u'{"value": ['
     outcount = 0
-    while not fin:
-
-        #import pdb; pdb.set_trace()
-        # Keep the result line valid while it is being read
-        elems = res_iter.next()
-
-        fin = True
-        for elem in elems:
-            fin = False
-            outcount += 1
-            if starter:
-                dli += '\n' + elem
-                starter = False
-            else:
-                dli += ', ' + elem
-        if not fin:
-            yield dli + '\n'
-            dli = u''
+    lines = 0
+    for elems in res_iter:
+        if not elems:
+            # End of a result line
+            if lines:
+                yield u'\n'
+            lines = 0
+            continue
+        if outcount == 0:
+            sep = u'\n'
+        else:
+            sep = u', '
+        outcount += len(elems)
+        lines += len(elems)
+        yield sep + u', '.join(elems)
 
     if outcount == 0:
         yield '\n' + u']}'
@@ -253,14 +264,13 @@ def redis_query_result_dict(host, port, redis_password, qid):
 
         done = False
         gen = redis_query_result(host, port, redis_password, qid)
-        result = u''
+        result = []
         while not done:
             try:
-                result += gen.next()
-                #import pdb; pdb.set_trace()
+                result.append(gen.next())
             except StopIteration:
                 done = True
-        res = (json.loads(result))['value']
+        res = (json.loads(u''.join(result)))['value']
 
     return prg, res
 # end redis_query_result_dict
@@ -278,6 +288,90 @@ def redis_query_info(redish, qid):
 # end redis_query_info
 
 
+class QueryProgressWaiter(object):
+    '''
+    Wakes up the synchronous queries waiting on the redis-query when the
+    query engine pushes their progress to REPLY:<qid>. The progress of all
+    the queries is received as keyspace notifications on one connection.
+    While that connection is down, waiters fall back to polling the query
+    status every second
+    '''
+
+    _POLL_INTERVAL = 1
+    _WAIT_TIMEOUT = 10
+
+    def __init__(self, logger, host, port, redis_password=None):
+        self._logger = logger
+        self._host = host
+        self._port = port
+        self._redis_password = redis_password
+        self._waiters = {}
+        self._subscribed = False
+        self._listener = None
+    # end __init__
+
+    def register(self, qid):
+        if self._listener is None:
+            self._listener = gevent.spawn(self._listen)
+        event = gevent.event.Event()
+        self._waiters[qid] = event
+        return event
+    # end register
+
+    def unregister(self, qid):
+        self._waiters.pop(qid, None)
+    # end unregister
+
+    def wait(self, event):
+        if self._subscribed:
+            # The timeout only guards against lost notifications
+            event.wait(self._WAIT_TIMEOUT)
+        else:
+            event.wait(self._POLL_INTERVAL)
+        event.clear()
+    # end wait
+
+    def _wake_all(self):
+        for event in self._waiters.itervalues():
+            event.set()
+    # end _wake_all
+
+    def _listen(self):
+        while True:
+            pubsub = None
+            try:
+                redish = redis_pools.get(self._host, self._port, 0,
+                                         self._redis_password)
+                # Keyspace events for list commands
+                OpServerUtils.redis_keyspace_events_enable(redish, 'l')
+                pubsub = redish.pubsub()
+                pubsub.psubscribe('__keyspace@0__:REPLY:*')
+                for msg in pubsub.listen():
+                    if msg['type'] == 'psubscribe':
+                        self._subscribed = True
+                        # Progress pushed before now was not notified
+                        self._wake_all()
+                    elif msg['type'] == 'pmessage':
+                        qid = msg['channel'].split(':', 2)[2]
+                        event = self._waiters.get(qid)
+                        if event is not None:
+                            event.set()
+            except (redis.exceptions.ConnectionError,
+                    redis.exceptions.ResponseError) as e:
+                self._logger.error("Query progress listener for redis-query "
+                                   "%s:%d failed: %s" % \
+                                   (self._host, self._port, e))
+            finally:
+                self._subscribed = False
+                self._wake_all()
+                if pubsub is not None:
+                    pubsub.reset()
+            gevent.sleep(5)
+    # end _listen
+
+# end class QueryProgressWaiter
+
+
 class OpStateServer(object):
 
     def __init__(self, logger, redis_password=None):
@@ -298,9 +392,8 @@ class OpStateServer(object):
             % (msg_type, destination, msg_encode)
         # Publish message in the Redis bus
         for redis_server in self._redis_list:
-            redis_inst = redis.StrictRedis(redis_server[0], 
-                                           redis_server[1], db=0,
-                                           password=self._redis_password)
+            redis_inst = redis_pools.get(redis_server[0], redis_server[1],
+                                         0, self._redis_password)
             try:
                 redis_inst.publish('analytics', redis_msg)
             except redis.exceptions.ConnectionError:
@@ -494,11 +587,17 @@ class OpServer(object):
         self._post_common = self._http_post_common
 
         self._collector_pool = None
+        redis_pools.configure(self._args.redis_pool_size)
         self._state_server = OpStateServer(self._logger, self._args.redis_password)
         self._uve_server = UVEServer(('127.0.0.1',
                                       self._args.redis_server_port),
                                      self._logger,
-                                     self._args.redis_password)
+                                     self._args.redis_password,
+                                     self._args.redis_uve_timeout,
+                                     self._args.uve_cache_size * 1024 * 1024)
+        self._query_waiter = QueryProgressWaiter(
+            self._logger, '127.0.0.1', int(self._args.redis_query_port),
+            self._args.redis_password)
 
         self._LEVEL_LIST = []
         for k in SandeshLevel._VALUES_TO_NAMES:
@@ -665,6 +764,8 @@ class OpServer(object):
                                --redis_server_port 6379
                                --redis_query_port 6379
                                --redis_password
+                               --redis_uve_timeout 5
+                               --redis_pool_size 64
                                --collectors 127.0.0.1:8086
                                --cassandra_server_list 127.0.0.1:9160
                                --http_server_port 8090
@@ -678,6 +779,7 @@ class OpServer(object):
                                --syslog_facility LOG_USER
                                --worker_id 0
                                --redis_uve_list 127.0.0.1:6379
+                               --uve_cache_size 64
         '''
         # Source any specified config/ini file
         # Turn off help, so we print all options in response to -h
@@ -701,12 +803,15 @@ class OpServer(object):
             'use_syslog'         : False,
             'syslog_facility'    : Sandesh._DEFAULT_SYSLOG_FACILITY,
             'dup'                : False,
-            'redis_uve_list'     : ['127.0.0.1:6379']
+            'redis_uve_list'     : ['127.0.0.1:6379'],
+            'uve_cache_size'     : 64,
         }
         redis_opts = {
             'redis_server_port'  : 6379,
             'redis_query_port'   : 6379,
             'redis_password'       : None,
+            'redis_uve_timeout'  : 5,
+            'redis_pool_size'    : 64,
         }
         disc_opts = {
             'disc_server_ip'     : None,
@@ -746,6 +851,12 @@ class OpServer(object):
             help="Redis query port")
         parser.add_argument("--redis_password",
             help="Redis server password")
+        parser.add_argument("--redis_uve_timeout",
+            type=float,
+            help="Seconds to wait for the redis-uves to answer a UVE read")
+        parser.add_argument("--redis_pool_size",
+            type=int,
+            help="Maximum number of connections to each redis db")
         parser.add_argument("--collectors",
             help="List of Collector IP addresses in ip:port format",
             nargs="+")
@@ -782,6 +893,9 @@ class OpServer(object):
         parser.add_argument("--redis_uve_list",
             help="List of redis-uve in ip:port format. For internal use only",
             nargs="+")
+        parser.add_argument("--uve_cache_size",
+            type=int,
+            help="Size of the aggregated UVE cache in MB, 0 to disable")
         parser.add_argument(
             "--worker_id",
             help="Worker Id")
@@ -1058,31 +1172,32 @@ class OpServer(object):
     # end _query
 
     def _sync_query(self, request, qid):
-        # In Sync mode, Keep polling query status until final result is
-        # available
+        # In Sync mode, wait for the query engine to push the query progress
+        # until the final result is available
         try:
-            self._logger.info("Polling %s for query result" % ("REPLY:" + qid))
+            self._logger.info("Waiting on %s for query result" % ("REPLY:" + qid))
             prg = 0
-            done = False
-            while not done:
-                gevent.sleep(1)
-                resp = redis_query_status(host='127.0.0.1',
-                                          port=int(
-                                              self._args.redis_query_port),
-                                          redis_password=self._args.redis_password,
-                                          qid=qid)
-
-                # We want to print progress only if it has changed
-                if int(resp["progress"]) == prg:
-                    continue
-
-                self._logger.info(
-                    "Query Progress is %s time %d" % (str(resp), time.time()))
-                prg = int(resp["progress"])
-
-                # Either there was an error, or the query is complete
-                if (prg < 0) or (prg == 100):
-                    done = True
+            event = self._query_waiter.register(qid)
+            try:
+                while True:
+                    resp = redis_query_status(host='127.0.0.1',
+                                              port=int(
+                                                  self._args.redis_query_port),
+                                              redis_password=self._args.redis_password,
+                                              qid=qid)
+
+                    # We want to print progress only if it has changed
+                    if int(resp["progress"]) != prg:
+                        self._logger.info("Query Progress is %s time %d" % \
+                                          (str(resp), time.time()))
+                        prg = int(resp["progress"])
+
+                    # Either there was an error, or the query is complete
+                    if (prg < 0) or (prg == 100):
+                        break
+                    self._query_waiter.wait(event)
+            finally:
+                self._query_waiter.unregister(qid)
 
             if prg < 0:
                 cod = -prg
@@ -1174,9 +1289,9 @@ class OpServer(object):
             abort(code, msg)
         queries = {}
         try:
-            redish = redis.StrictRedis(db=0, host='127.0.0.1',
-                                       port=int(self._args.redis_query_port),
-                                       password=self._args.redis_password)
+            redish = redis_pools.get('127.0.0.1',
+                                     int(self._args.redis_query_port), 0,
+                                     self._args.redis_password)
             pending_queries = redish.lrange('QUERYQ', 0, -1)
             pending_queries_info = []
             for query_id in pending_queries:
@@ -1345,6 +1460,15 @@ class OpServer(object):
             yield u']}'
     # end uve_http_post
 
+    @staticmethod
+    def _set_uve_collectors_header(collectors):
+        # Mark which redis-uves answered, so that the client can tell
+        # partial UVEs from complete ones
+        bottle.response.set_header('X-Analytics-Collectors',
+            ', '.join('%s=%s' % (name, status) \
+                      for name, status in sorted(collectors.items())))
+    # end _set_uve_collectors_header
+
     def uve_http_get(self, name):
         # common handling for all resource get
         (ok, result) = self._get_common(bottle.request)
@@ -1385,8 +1509,11 @@ class OpServer(object):
                         yield u', ' + json.dumps(gen)
                 yield u']}'
             else:
+                collectors = {}
                 rsp = self._uve_server.get_uve(uve_name, flat, sfilter,
-                                               mfilter, tfilter)
+                                               mfilter, tfilter,
+                                               collectors=collectors)
+                OpServer._set_uve_collectors_header(collectors)
                 yield json.dumps(rsp)
     # end uve_http_get
 
@@ -1422,8 +1549,11 @@ class OpServer(object):
             _, kfilter, sfilter, mfilter, tfilter = \
                 OpServer._uve_filter_set(req)
 
+            collectors = {}
             uve_list = self._uve_server.get_uve_list(
-                uve_tbl, kfilter, sfilter, mfilter, tfilter, True)
+                uve_tbl, kfilter, sfilter, mfilter, tfilter, True,
+                collectors)
+            OpServer._set_uve_collectors_header(collectors)
             base_url = bottle.request.urlparts.scheme + '://' + \
                 bottle.request.urlparts.netloc + \
                 '/analytics/uves/%s/' % (uve_type)
@@ -1656,11 +1786,8 @@ class OpServer(object):
             sources = []
             moduleids = []
             for redis_uve in self.redis_uve_list:
-                redish = redis.StrictRedis(
-                    db=1,
-                    host=redis_uve[0],
-                    port=redis_uve[1],
-                    password=self._args.redis_password)
+                redish = redis_pools.get(redis_uve[0], redis_uve[1], 1,
+                                         self._args.redis_password)
                 try:
                     for key in redish.smembers("NGENERATORS"):
                         source = key.split(':')[0]
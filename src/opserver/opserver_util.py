@@ -14,6 +14,7 @@ import requests
 import pkg_resources
 import xmltodict
 import json
+import xml.etree.cElementTree as ElementTree
 import gevent
 import socket, struct
 
@@ -49,6 +50,43 @@ class OpServerUtils(object):
                 sname = sattr
         return sname
 
+    @staticmethod
+    def _uve_elem_decode(elem, is_list):
+        node = {}
+        for attr, value in elem.attrib.iteritems():
+            node['@' + attr] = value
+        etype = elem.get('type')
+        for child in elem:
+            value = OpServerUtils._uve_elem_decode(
+                child, etype == 'list' and child.tag == 'list')
+            if is_list:
+                node.setdefault(child.tag, []).append(value)
+            elif child.tag not in node:
+                node[child.tag] = value
+            elif isinstance(node[child.tag], list):
+                node[child.tag].append(value)
+            else:
+                node[child.tag] = [node[child.tag], value]
+        text = elem.text
+        if text is not None:
+            text = text.strip() or None
+        if not node:
+            return text
+        if text is not None:
+            node['#text'] = text
+        return node
+
+    @staticmethod
+    def uve_attr_decode(xml):
+        '''
+        Decode the sandesh XML of a UVE attribute into the dict layout
+        of xmltodict.parse (which is what PREVIOUS records and unflattened
+        UVEs use), except that the elements of a sandesh list are always
+        returned as a python list, whatever the list size.
+        '''
+        root = ElementTree.fromstring(xml)
+        return {root.tag: OpServerUtils._uve_elem_decode(root, False)}
+
     @staticmethod
     def uve_attr_flatten(inp):
         #import pdb; pdb.set_trace()
@@ -99,6 +137,22 @@ class OpServerUtils(object):
             else:
                 return inp['#text']
 
+    @staticmethod
+    def redis_keyspace_events_enable(redish, events):
+        '''
+        Add the keyspace event classes in events (e.g. 'gh' for generic
+        and hash commands) to the notify-keyspace-events of a redis,
+        keeping the classes already enabled
+        '''
+        enabled = redish.config_get('notify-keyspace-events').get(
+            'notify-keyspace-events', '')
+        missing = [e for e in 'K' + events if e not in enabled and \
+                   (e == 'K' or 'A' not in enabled)]
+        if missing:
+            redish.config_set('notify-keyspace-events',
+                              enabled + ''.join(missing))
+    # end redis_keyspace_events_enable
+
     @staticmethod
     def utc_timestamp_usec():
         epoch = datetime.datetime.utcfromtimestamp(0)
@@ -0,0 +1,139 @@
+#
+# Copyright (c) 2015 Juniper Networks, Inc. All rights reserved.
+#
+
+#
+# Redis Connection Pools
+#
+# Connection pools shared by the redis clients of analytics-api
+#
+
+import time
+import redis
+
+
+class RedisConnection(redis.Connection):
+
+    def connect(self):
+        if self._sock is not None:
+            return
+        stats = self.pool_stats
+        stats['connects'] += 1
+        try:
+            super(RedisConnection, self).connect()
+        except redis.exceptions.ConnectionError:
+            stats['connect_failures'] += 1
+            raise
+    # end connect
+
+# end class RedisConnection
+
+
+class RedisPool(redis.BlockingConnectionPool):
+    '''
+    Connection pool to a redis db, that keeps the count of connects and
+    the time spent getting a connection from the pool.
+    When all the connections of the pool are in use, a client waits for
+    one to be released, for timeout seconds at most
+    '''
+
+    def __init__(self, max_connections, timeout, **connection_kwargs):
+        self.stats = {'requests': 0, 'request_failures': 0,
+                      'connects': 0, 'connect_failures': 0,
+                      'wait_time': 0, 'max_wait_time': 0}
+        self._in_use = set()
+        super(RedisPool, self).__init__(max_connections=max_connections,
+                                        timeout=timeout,
+                                        connection_class=RedisConnection,
+                                        **connection_kwargs)
+    # end __init__
+
+    def make_connection(self):
+        connection = super(RedisPool, self).make_connection()
+        connection.pool_stats = self.stats
+        return connection
+    # end make_connection
+
+    def get_connection(self, command_name, *keys, **options):
+        self.stats['requests'] += 1
+        start = time.time()
+        try:
+            connection = super(RedisPool, self).get_connection(
+                command_name, *keys, **options)
+        except redis.exceptions.ConnectionError:
+            self.stats['request_failures'] += 1
+            raise
+        wait_time = time.time() - start
+        self.stats['wait_time'] += wait_time
+        if wait_time > self.stats['max_wait_time']:
+            self.stats['max_wait_time'] = wait_time
+        self._in_use.add(connection)
+        return connection
+    # end get_connection
+
+    def release(self, connection):
+        self._in_use.discard(connection)
+        super(RedisPool, self).release(connection)
+    # end release
+
+    def connections(self):
+        return len(self._connections)
+    # end connections
+
+    def in_use(self):
+        return len(self._in_use)
+    # end in_use
+
+# end class RedisPool
+
+
+class RedisPools(object):
+    '''
+    Connection pools of analytics-api, one per redis db, keyed by
+    (host, port, db). Every redis client of a db shares the connections
+    of its pool, instead of connecting (and authenticating) per request
+    '''
+
+    # Maximum number of connections of a pool
+    _MAX_CONNECTIONS = 64
+    # Seconds to wait for a connection when all are in use
+    _TIMEOUT = 10
+
+    def __init__(self):
+        self._max_connections = self._MAX_CONNECTIONS
+        self._timeout = self._TIMEOUT
+        self._pools = {}
+    # end __init__
+
+    def configure(self, max_connections=None, timeout=None):
+        # Applies to the pools created afterwards
+        if max_connections:
+            self._max_connections = max_connections
+        if timeout:
+            self._timeout = timeout
+    # end configure
+
+    def get(self, host, port, db=0, password=None):
+        key = (host, port, db)
+        pool = self._pools.get(key)
+        if pool is None:
+            pool = RedisPool(self._max_connections, self._timeout,
+                             host=host, port=port, db=db, password=password)
+            self._pools[key] = pool
+        return redis.StrictRedis(connection_pool=pool)
+    # end get
+
+    def remove(self, host, port, db=0):
+        pool = self._pools.pop((host, port, db), None)
+        if pool is not None:
+            pool.disconnect()
+    # end remove
+
+    def pools(self):
+        return self._pools.items()
+    # end pools
+
+# end class RedisPools
+
+
+redis_pools = RedisPools()
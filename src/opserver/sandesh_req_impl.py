@@ -6,7 +6,9 @@
 # Opserver Sandesh Request Implementation
 #
 
-from sandesh.redis.ttypes import RedisUveInfo, RedisUVERequest, RedisUVEResponse
+from sandesh.redis.ttypes import RedisUveInfo, RedisUVERequest, \
+    RedisUVEResponse, RedisPoolInfo
+from redis_pool import redis_pools
 
 class OpserverSandeshReqImpl(object):
     def __init__(self, opserver):
@@ -18,8 +20,27 @@ class OpserverSandeshReqImpl(object):
         redis_uve_info = RedisUveInfo()
         uve_server = self._opserver.get_uve_server()
         uve_server.fill_redis_uve_info(redis_uve_info)
-        redis_uve_resp = RedisUVEResponse(redis_uve_info)
+        redis_uve_resp = RedisUVEResponse(redis_uve_info,
+                                          self._redis_pool_info())
         redis_uve_resp.response(req.context())
     # end handle_redis_uve_info_req
 
+    def _redis_pool_info(self):
+        pool_info = []
+        for (ip, port, db), pool in redis_pools.pools():
+            info = RedisPoolInfo(ip=ip, port=port, db=db)
+            info.max_connections = pool.max_connections
+            info.connections = pool.connections()
+            info.in_use = pool.in_use()
+            info.requests = pool.stats['requests']
+            info.request_failures = pool.stats['request_failures']
+            info.connects = pool.stats['connects']
+            info.connect_failures = pool.stats['connect_failures']
+            info.wait_time_usec = int(pool.stats['wait_time'] * 1000000)
+            info.max_wait_time_usec = \
+                int(pool.stats['max_wait_time'] * 1000000)
+            pool_info.append(info)
+        return pool_info
+    # end _redis_pool_info
+
 # end class OpserverSandeshReqImpl
@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+
+#
+# Copyright (c) 2015 Juniper Networks, Inc. All rights reserved.
+#
+
+#
+# UVE Aggregation Benchmark
+#
+# Times ParallelAggregator on append (with listkey) and union lists of
+# generated UVEs, against the element by element list consolidation
+# it replaced.
+#
+#   uve_agg_bench.py --size 10000 --sources 3
+#
+
+import sys
+import copy
+import json
+import time
+import argparse
+
+from opserver.uveserver import ParallelAggregator
+
+
+def make_append_list(size, source):
+    elems = []
+    for i in range(size):
+        elems.append({
+            'other_vn': {'@type': 'string', '@aggtype': 'listkey',
+                         '#text': 'vn-%d' % i},
+            'tpkts': {'@type': 'u64', '#text': str(i + source)},
+            'bytes': {'@type': 'u64', '#text': str((i + source) * 100)}})
+    return {'@type': 'list', '@aggtype': 'append',
+            'list': {'@type': 'struct', '@size': str(size),
+                     'VnStats': elems}}
+
+
+def make_union_list(size, source):
+    elems = ['vn-%d' % ((i + source * size / 2) % (size * 2))
+             for i in range(size)]
+    return {'@type': 'list', '@aggtype': 'union',
+            'list': {'@type': 'string', '@size': str(size),
+                     'element': elems}}
+
+
+def make_state(size, sources):
+    state = {'uve': {'UVEVirtualNetwork': {'in_stats': {},
+                                           'connected_networks': {}}}}
+    uve = state['uve']['UVEVirtualNetwork']
+    for source in range(sources):
+        uve['in_stats']['src%d' % source] = make_append_list(size, source)
+        uve['connected_networks']['src%d' % source] = \
+            make_union_list(size, source)
+    return state
+
+
+def legacy_consolidate_list(result, typ, objattr):
+    # ParallelAggregator.consolidate_list before the listkey index
+    applist = ParallelAggregator.get_list_name(result[typ][objattr])
+    appkey = ParallelAggregator._get_list_key(
+        result[typ][objattr]['list'][applist][0])
+    mod_result = copy.deepcopy(result[typ][objattr])
+    mod_result['list'][applist] = []
+    res_size = 0
+    for items in result[typ][objattr]['list'][applist]:
+        matched = False
+        for res_items in mod_result['list'][applist]:
+            if items[appkey]['#text'] in [res_items[appkey]['#text']]:
+                for ctrs in ParallelAggregator._list_agg_attrs(items):
+                    res_items[ctrs]['#text'] += int(items[ctrs]['#text'])
+                matched = True
+        if not matched:
+            newitem = copy.deepcopy(items)
+            for ctrs in ParallelAggregator._list_agg_attrs(items):
+                newitem[ctrs]['#text'] = int(items[ctrs]['#text'])
+            mod_result['list'][applist].append(newitem)
+            res_size += 1
+    for res_items in mod_result['list'][applist]:
+        for ctrs in ParallelAggregator._list_agg_attrs(res_items):
+            res_items[ctrs]['#text'] = str(res_items[ctrs]['#text'])
+    mod_result['list']['@size'] = str(res_size)
+    return mod_result
+
+
+def bench(name, size, sources, iterations):
+    elapsed = 0
+    for i in range(iterations):
+        state = make_state(size, sources)
+        start = time.time()
+        res = ParallelAggregator(state).aggregate('uve', False)
+        elapsed += time.time() - start
+    print '%-8s %6d elements x %d sources: %10.2f ms' % \
+        (name, size, sources, elapsed * 1000 / iterations)
+    return res
+
+
+def main(args_str=' '.join(sys.argv[1:])):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--size', type=int, default=10000,
+        help='Number of list elements per source')
+    parser.add_argument('--sources', type=int, default=3,
+        help='Number of sources of each UVE attribute')
+    parser.add_argument('--iterations', type=int, default=3)
+    args = parser.parse_args(args_str.split())
+
+    new = bench('indexed', args.size, args.sources, args.iterations)
+    consolidate_list = ParallelAggregator.consolidate_list
+    ParallelAggregator.consolidate_list = \
+        staticmethod(legacy_consolidate_list)
+    try:
+        old = bench('legacy', args.size, args.sources, args.iterations)
+    finally:
+        ParallelAggregator.consolidate_list = staticmethod(consolidate_list)
+    if json.dumps(old, sort_keys=True) != json.dumps(new, sort_keys=True):
+        print 'Aggregated UVEs differ'
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
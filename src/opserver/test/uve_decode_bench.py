@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+
+#
+# Copyright (c) 2015 Juniper Networks, Inc. All rights reserved.
+#
+
+#
+# UVE Decode Benchmark
+#
+# Compares the xmltodict based decoding of UVE attributes with
+# OpServerUtils.uve_attr_decode, on UVE payloads recorded from a redis-uve
+# or on generated ones.
+#
+# Record the UVEs of a redis-uve:
+#   uve_decode_bench.py --redis 127.0.0.1:6379 --record uves.json
+# Run the benchmark on them:
+#   uve_decode_bench.py --payloads uves.json
+#
+
+import sys
+import json
+import time
+import argparse
+import xmltodict
+import redis
+
+from opserver.opserver_util import OpServerUtils
+from opserver.uveserver import ParallelAggregator
+
+
+def record_payloads(redis_uve, fname):
+    host, port = redis_uve.split(':')
+    redish = redis.StrictRedis(host=host, port=int(port), db=1)
+    payloads = []
+    for vkey in redish.keys('VALUES:*'):
+        for attr, value in redish.hgetall(vkey).iteritems():
+            if value[0] == '<':
+                payloads.append(value)
+    with open(fname, 'w') as f:
+        json.dump(payloads, f)
+    return payloads
+
+
+def generate_payloads(count, size):
+    elem = '<VnStats><other_vn type="string" identifier="1" ' \
+        'aggtype="listkey">vn-%d</other_vn><tpkts type="u64" ' \
+        'identifier="2">%d</tpkts><bytes type="u64" identifier="3">%d' \
+        '</bytes></VnStats>'
+    payloads = []
+    for i in range(count):
+        payloads.append(
+            '<in_stats type="list" identifier="1" aggtype="append">'
+            '<list type="struct" size="%d">%s</list></in_stats>' % \
+            (size, ''.join([elem % (j, j, j * 100) for j in range(size)])))
+        payloads.append('<in_tpkts type="u64" identifier="2" '
+                        'aggtype="counter">%d</in_tpkts>' % i)
+        payloads.append('<virtualmachine_list type="list" identifier="3">'
+                        '<list type="string" size="1"><element>vm-%d'
+                        '</element></list></virtualmachine_list>' % i)
+    return payloads
+
+
+def xmltodict_decode(value):
+    # UVE attribute decoding, as done before uve_attr_decode
+    snhdict = xmltodict.parse(value)
+    attr = snhdict.keys()[0]
+    if snhdict[attr]['@type'] == 'list' and \
+            snhdict[attr]['list']['@size'] == '1':
+        sname = ParallelAggregator.get_list_name(snhdict[attr])
+        if not isinstance(snhdict[attr]['list'][sname], list):
+            snhdict[attr]['list'][sname] = [snhdict[attr]['list'][sname]]
+    return snhdict
+
+
+def aggregate(decoded):
+    state = {'uve': {'UVEType': {}}}
+    for snhdict in decoded:
+        attr = snhdict.keys()[0]
+        if snhdict[attr]['@type'] == 'list' and \
+                snhdict[attr]['list']['@size'] == '0':
+            continue
+        state['uve']['UVEType'].setdefault(attr, {})[
+            'src%d' % len(state['uve']['UVEType'].get(attr, {}))] = \
+            snhdict[attr]
+    return ParallelAggregator(state).aggregate('uve', True)
+
+
+def bench(name, decode, payloads, iterations):
+    start = time.time()
+    for i in range(iterations):
+        decoded = [decode(value) for value in payloads]
+    decode_time = (time.time() - start) / iterations
+    start = time.time()
+    for i in range(iterations):
+        aggregate([decode(value) for value in payloads])
+    total_time = (time.time() - start) / iterations
+    print '%-16s decode %8.2f ms  decode+aggregate %8.2f ms' % \
+        (name, decode_time * 1000, total_time * 1000)
+    return decoded
+
+
+def main(args_str=' '.join(sys.argv[1:])):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--payloads',
+        help='JSON file of recorded UVE attribute payloads')
+    parser.add_argument('--redis',
+        help='redis-uve to record the payloads from, in ip:port format')
+    parser.add_argument('--record',
+        help='JSON file to record the payloads to')
+    parser.add_argument('--count', type=int, default=100,
+        help='Number of UVEs to generate, without --payloads')
+    parser.add_argument('--size', type=int, default=100,
+        help='Size of the generated UVE lists, without --payloads')
+    parser.add_argument('--iterations', type=int, default=10)
+    args = parser.parse_args(args_str.split())
+
+    if args.redis:
+        payloads = record_payloads(args.redis, args.record or 'uves.json')
+    elif args.payloads:
+        with open(args.payloads) as f:
+            payloads = [str(value) for value in json.load(f)]
+    else:
+        payloads = generate_payloads(args.count, args.size)
+    print '%d payloads, %d bytes' % \
+        (len(payloads), sum(len(value) for value in payloads))
+
+    old = bench('xmltodict', xmltodict_decode, payloads, args.iterations)
+    new = bench('uve_attr_decode', OpServerUtils.uve_attr_decode, payloads,
+                args.iterations)
+    if aggregate(old) != aggregate(new):
+        print 'Aggregated UVEs differ'
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -16,10 +16,13 @@ import copy
 import unittest
 import pdb
 import json
+import logging
 
 curfile = sys.path[0]
 from opserver.uveserver import UVEServer
 from opserver.uveserver import ParallelAggregator
+from opserver.uveserver import UVECache
+from opserver.uveserver import UVEIndex
 
 
 class RedisMock(object):
@@ -365,6 +368,156 @@ class UVEServerTest(unittest.TestCase):
             "UVEVirtualNetwork"]["in_stats"]["sample"]
         self.assertEqual(in_stats, res['UVEVirtualNetwork']['in_stats'])
 
+    def test_append_agg_nokey(self):
+        print "*** Running test_append_agg_nokey ***"
+
+        uvevn = MakeUVEVirtualNetwork(
+            None, "abc-corp:vn-00", "10.10.10.10",
+            attached_policies=[("100", "allow-some")],
+        )
+        uvevn2 = MakeUVEVirtualNetwork(
+            uvevn, "abc-corp:vn-00", "10.10.10.11",
+            attached_policies=[("100", "allow-some"), ("200", "deny-others")],
+        )
+        for source in ["10.10.10.10", "10.10.10.11"]:
+            uvevn2["abc-corp:vn-00"]['UVEVirtualNetwork'][
+                'attached_policies'][source]['@aggtype'] = "append"
+
+        pa = ParallelAggregator(uvevn2)
+        res = pa.aggregate("abc-corp:vn-00", False)
+        print json.dumps(res, indent=4, sort_keys=True)
+
+        # Without a listkey, the appended elements are not consolidated
+        attached_policies = res['UVEVirtualNetwork']['attached_policies']
+        self.assertEqual("3", attached_policies['list']['@size'])
+        self.assertEqual(
+            sorted(["100", "100", "200"]),
+            sorted([elem['vnp_num']['#text'] for elem in
+                    attached_policies['list']['VnPolicy']]))
+
+
+class UVECacheTest(unittest.TestCase):
+
+    def test_lru_eviction(self):
+        print "*** Running test_lru_eviction ***"
+
+        uve = {'UVEVirtualNetwork': {'total_acl_rules': 4}}
+        status = {'127.0.0.1:6379': 'ok'}
+        size = len(json.dumps(uve))
+        cache = UVECache(2 * size)
+        cache.put("abc-corp:vn-00", (True,), uve, status)
+        cache.put("abc-corp:vn-01", (True,), uve, status)
+        self.assertEqual((uve, status), cache.get("abc-corp:vn-00", (True,)))
+        cache.put("abc-corp:vn-02", (True,), uve, status)
+
+        # vn-01 is the least recently used
+        self.assertIsNone(cache.get("abc-corp:vn-01", (True,)))
+        self.assertEqual((uve, status), cache.get("abc-corp:vn-00", (True,)))
+        self.assertEqual((uve, status), cache.get("abc-corp:vn-02", (True,)))
+        self.assertEqual(2 * size, cache.size())
+        self.assertEqual(1, cache.stats['evictions'])
+
+    def test_invalidate(self):
+        print "*** Running test_invalidate ***"
+
+        uve = {'UVEVirtualNetwork': {'total_acl_rules': 4}}
+        status = {'127.0.0.1:6379': 'ok'}
+        cache = UVECache(1024)
+        cache.put("abc-corp:vn-00", (True,), uve, status)
+        cache.put("abc-corp:vn-00", (False,), uve, status)
+        cache.put("abc-corp:vn-01", (True,), uve, status)
+        cache.invalidate("abc-corp:vn-00")
+        self.assertIsNone(cache.get("abc-corp:vn-00", (True,)))
+        self.assertIsNone(cache.get("abc-corp:vn-00", (False,)))
+        self.assertEqual((uve, status), cache.get("abc-corp:vn-01", (True,)))
+
+        # A UVE invalidated while being read must not be cached
+        cache.begin_read(["abc-corp:vn-00", "abc-corp:vn-01"])
+        cache.invalidate("abc-corp:vn-00")
+        self.assertEqual(set(["abc-corp:vn-00"]),
+                         cache.end_read(["abc-corp:vn-00", "abc-corp:vn-01"]))
+        cache.begin_read(["abc-corp:vn-00"])
+        self.assertEqual(set(), cache.end_read(["abc-corp:vn-00"]))
+
+    def test_cached_get_uve(self):
+        print "*** Running test_cached_get_uve ***"
+
+        key = "abc-corp:vn-00"
+        uvevn = MakeUVEVirtualNetwork(
+            None, key, "10.10.10.10", connected_networks=["vn-01"])
+        uveserver = UVEServer(None, logging.getLogger(__name__),
+                              uve_cache_size=4096)
+        uveserver._redis_uve_list = [("127.0.0.1", 6379)]
+        uveserver._uve_synced.add(("127.0.0.1", 6379))
+        reads = []
+
+        def fanout(op, fn, keys, *args):
+            reads.append(keys)
+            return [({key: uvevn}, {key: {}})], {'127.0.0.1:6379': 'ok'}
+        uveserver._fanout = fanout
+
+        uve = uveserver.get_uve(key, False)
+        uve['UVEVirtualNetwork']['connected_networks'] = None
+        for i in range(2):
+            collectors = {}
+            cached = uveserver.get_uve(key, False, collectors=collectors)
+            # read from the cache, unchanged by the earlier caller
+            self.assertEqual([[key]], reads)
+            self.assertEqual({'127.0.0.1:6379': 'ok'}, collectors)
+            self.assertIsNotNone(
+                cached['UVEVirtualNetwork']['connected_networks'])
+            cached.clear()
+
+
+class UVEIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self._index = UVEIndex()
+        for vn in ["vn-00", "vn-01", "vn-10"]:
+            self._index.add("ObjectVNTable:abc-corp:%s:10.10.10.10:Config:"
+                            "ApiServer:0:UVEVirtualNetworkConfig" % vn)
+        self._index.add("ObjectVNTable:abc-corp:vn-00:10.10.10.11:Compute:"
+                        "VRouterAgent:0:UVEVirtualNetworkAgent")
+
+    def _names(self, kfilter):
+        return sorted(set(entry[0] for entry in
+                          self._index.entries("ObjectVNTable", kfilter)))
+
+    def test_lookup(self):
+        print "*** Running test_lookup ***"
+
+        self.assertEqual(["abc-corp:vn-00", "abc-corp:vn-01",
+                          "abc-corp:vn-10"], self._names(None))
+        self.assertEqual(["abc-corp:vn-01"], self._names(["abc-corp:vn-01"]))
+        self.assertEqual(["abc-corp:vn-00", "abc-corp:vn-01"],
+                         self._names(["abc-corp:vn-0*"]))
+        self.assertEqual(["abc-corp:vn-00", "abc-corp:vn-10"],
+                         self._names(["*-*0", "abc-corp:vn-1*"]))
+        self.assertEqual([], self._names(["vn-0*"]))
+        self.assertEqual(
+            sorted([("abc-corp:vn-00", "10.10.10.10", "Config", "ApiServer",
+                     "0", "UVEVirtualNetworkConfig"),
+                    ("abc-corp:vn-00", "10.10.10.11", "Compute",
+                     "VRouterAgent", "0", "UVEVirtualNetworkAgent")]),
+            sorted(self._index.entries("ObjectVNTable", ["abc-corp:vn-00"])))
+
+    def test_update(self):
+        print "*** Running test_update ***"
+
+        self._index.update("ObjectVNTable:abc-corp:vn-02", set(
+            ["10.10.10.10:Config:ApiServer:0:UVEVirtualNetworkConfig"]))
+        self.assertEqual(["abc-corp:vn-00", "abc-corp:vn-01",
+                          "abc-corp:vn-02"], self._names(["abc-corp:vn-0*"]))
+        self._index.update("ObjectVNTable:abc-corp:vn-01", set())
+        self.assertEqual(["abc-corp:vn-00", "abc-corp:vn-02"],
+                         self._names(["abc-corp:vn-0*"]))
+        self._index.update("ObjectVNTable:abc-corp:vn-00", set(
+            ["10.10.10.11:Compute:VRouterAgent:0:UVEVirtualNetworkAgent"]))
+        self.assertEqual(
+            [("abc-corp:vn-00", "10.10.10.11", "Compute", "VRouterAgent",
+              "0", "UVEVirtualNetworkAgent")],
+            self._index.entries("ObjectVNTable", ["abc-corp:vn-00"]))
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -11,36 +11,164 @@
 import gevent
 import json
 import copy
-import xmltodict
 import redis
 import datetime
+import bisect
 import sys
 from opserver_util import OpServerUtils
+from redis_pool import redis_pools
 import re
 from gevent.coros import BoundedSemaphore
+from gevent.pool import Pool
+from collections import OrderedDict
 from pysandesh.util import UTCTimestampUsec
 from pysandesh.connection_info import ConnectionState
 
 class UVEServer(object):
 
-    def __init__(self, redis_uve_server, logger, redis_password=None):
+    # Number of UVEs read together by multi_uve_get
+    _UVE_PAGE_SIZE = 100
+    # Seconds to wait for the redis-uves to answer a UVE read
+    _REDIS_UVE_TIMEOUT = 5
+    # Redis keys whose changes are tracked for the UVE index, and the ones
+    # only tracked when the UVE cache is enabled
+    _UVE_INDEX_KEYSPACE = ['ORIGINS:*']
+    _UVE_CACHE_KEYSPACE = ['PTYPES:*', 'VALUES:*', 'PREVIOUS:*']
+
+    def __init__(self, redis_uve_server, logger, redis_password=None,
+                 redis_uve_timeout=None, uve_cache_size=0):
         self._local_redis_uve = redis_uve_server
+        self._redis_uve_timeout = redis_uve_timeout or self._REDIS_UVE_TIMEOUT
         self._redis_uve_list = []
+        self._redis_uve_map = {}
+        self._uve_cache = None
+        if uve_cache_size:
+            self._uve_cache = UVECache(uve_cache_size)
+        # redis-uve -> UVEIndex of the redis-uve
+        self._uve_indexes = {}
+        # redis-uve -> greenlet tracking the changes of the redis-uve
+        self._uve_listeners = {}
+        # redis-uves whose changes are being tracked by the listeners
+        self._uve_synced = set()
+        self._uve_read_stats = {'requests': 0, 'roundtrips': 0}
         self._logger = logger
         self._sem = BoundedSemaphore(1)
         self._redis = None
         self._redis_password = redis_password
         if self._local_redis_uve:
-            self._redis = redis.StrictRedis(self._local_redis_uve[0],
-                                            self._local_redis_uve[1],
-                                            password=self._redis_password,
-                                            db=1)
+            self._redis = redis_pools.get(self._local_redis_uve[0],
+                                          self._local_redis_uve[1], 1,
+                                          self._redis_password)
     #end __init__
 
     def update_redis_uve_list(self, redis_uve_list):
+        if self._uve_cache is not None and \
+                set(redis_uve_list) != set(self._redis_uve_list):
+            # The cached UVEs were aggregated from a different set
+            # of redis-uves
+            self._uve_cache.clear()
         self._redis_uve_list = redis_uve_list
+        # Drop the connection pools of redis-uves that went away
+        for redis_uve in self._redis_uve_map.keys():
+            if redis_uve not in redis_uve_list:
+                listener = self._uve_listeners.pop(redis_uve, None)
+                if listener is not None:
+                    listener.kill()
+                self._uve_indexes.pop(redis_uve, None)
+                del self._redis_uve_map[redis_uve]
+                if redis_uve != self._local_redis_uve:
+                    redis_pools.remove(redis_uve[0], redis_uve[1], 1)
+        for redis_uve in redis_uve_list:
+            if redis_uve not in self._uve_listeners:
+                self._uve_listeners[redis_uve] = gevent.spawn(
+                    self._uve_change_listener, redis_uve)
     # end update_redis_uve_list
 
+    @staticmethod
+    def _uve_key_from_redis_key(rkey):
+        # ORIGINS:<key>, PTYPES:<key>, PREVIOUS:<key>:<type> or
+        # VALUES:<key>:<source>:<node-type>:<module>:<instance-id>:<type>
+        prefix, key = rkey.split(':', 1)
+        if prefix == 'VALUES':
+            return key.rsplit(':', 5)[0]
+        if prefix == 'PREVIOUS':
+            return key.rsplit(':', 1)[0]
+        return key
+    # end _uve_key_from_redis_key
+
+    def _load_uve_index(self, redish):
+        index = UVEIndex()
+        tables = redish.keys('TABLE:*')
+        pipe = redish.pipeline(transaction=False)
+        for table in tables:
+            pipe.smembers(table)
+        for table, entries in zip(tables, pipe.execute()):
+            for entry in entries:
+                index.add(entry)
+        return index
+    # end _load_uve_index
+
+    def _uve_change_listener(self, redis_uve):
+        '''
+        Track the changes of a redis-uve through its keyspace notifications:
+        invalidate the cached UVEs that changed and update the UVE index
+        of the redis-uve when the origins of a UVE change.
+        The UVE cache is only used while every redis-uve is tracked, and
+        the UVE index of a redis-uve while it is tracked
+        '''
+        keyspace = self._UVE_INDEX_KEYSPACE
+        # Keyspace events for generic and set commands, and for hash
+        # commands when the UVE values are tracked for the cache
+        events = 'gs'
+        if self._uve_cache is not None:
+            keyspace = keyspace + self._UVE_CACHE_KEYSPACE
+            events = 'ghs'
+        patterns = ['__keyspace@1__:' + rkey for rkey in keyspace]
+        while True:
+            pubsub = None
+            try:
+                redish = self._get_redis_uve(redis_uve)
+                OpServerUtils.redis_keyspace_events_enable(redish, events)
+                pubsub = redish.pubsub()
+                pubsub.psubscribe(*patterns)
+                for msg in pubsub.listen():
+                    if msg['type'] == 'psubscribe':
+                        if msg['data'] == len(patterns):
+                            # Changes made before now were not tracked
+                            self._uve_indexes[redis_uve] = \
+                                self._load_uve_index(redish)
+                            if self._uve_cache is not None:
+                                self._uve_cache.clear()
+                            self._uve_synced.add(redis_uve)
+                    elif msg['type'] == 'pmessage':
+                        rkey = msg['channel'].split(':', 1)[1]
+                        key = UVEServer._uve_key_from_redis_key(rkey)
+                        if self._uve_cache is not None:
+                            self._uve_cache.invalidate(key)
+                        if rkey.startswith('ORIGINS:'):
+                            self._uve_indexes[redis_uve].update(
+                                key, redish.smembers(rkey))
+            except (redis.exceptions.ConnectionError,
+                    redis.exceptions.ResponseError) as e:
+                self._logger.error("UVE change listener for redis-uve "
+                                   "%s:%d failed: %s" % \
+                                   (redis_uve[0], redis_uve[1], e))
+            finally:
+                self._uve_synced.discard(redis_uve)
+                if pubsub is not None:
+                    pubsub.reset()
+            gevent.sleep(5)
+    # end _uve_change_listener
+
+    def _uve_cache_usable(self):
+        if self._uve_cache is None:
+            return False
+        for redis_uve in self._redis_uve_list:
+            if redis_uve not in self._uve_synced:
+                return False
+        return True
+    # end _uve_cache_usable
+
     def fill_redis_uve_info(self, redis_uve_info):
         redis_uve_info.ip = self._local_redis_uve[0]
         redis_uve_info.port = self._local_redis_uve[1]
@@ -50,6 +178,15 @@ class UVEServer(object):
             redis_uve_info.status = 'DisConnected'
         else:
             redis_uve_info.status = 'Connected'
+        redis_uve_info.uve_read_requests = self._uve_read_stats['requests']
+        redis_uve_info.uve_read_roundtrips = \
+            self._uve_read_stats['roundtrips']
+        if self._uve_cache is not None:
+            redis_uve_info.uve_cache_hits = self._uve_cache.stats['hits']
+            redis_uve_info.uve_cache_misses = self._uve_cache.stats['misses']
+            redis_uve_info.uve_cache_evictions = \
+                self._uve_cache.stats['evictions']
+            redis_uve_info.uve_cache_size = self._uve_cache.size()
     #end fill_redis_uve_info
 
     @staticmethod
@@ -103,18 +240,11 @@ class UVEServer(object):
                 state = UVEServer.convert_previous(existing, tstate, key, typ)
 
                 for attr, hval in self._redis.hgetall(value).iteritems():
-                    snhdict = xmltodict.parse(hval)
+                    snhdict = OpServerUtils.uve_attr_decode(hval)
 
                     if UVEServer._is_agg_list(snhdict[attr]):
                         if snhdict[attr]['list']['@size'] == "0":
                             continue
-                        if snhdict[attr]['list']['@size'] == "1":
-                            sname = ParallelAggregator.get_list_name(
-                                snhdict[attr])
-                            if not isinstance(
-                                    snhdict[attr]['list'][sname], list):
-                                snhdict[attr]['list'][sname] = \
-                                    [snhdict[attr]['list'][sname]]
 
                     if (attr not in state[key][typ]):
                         # There is no existing entry for the UVE
@@ -204,164 +334,356 @@ class UVEServer(object):
 
         return state
 
-    def get_uve(self, key, flat, sfilter=None, mfilter=None, tfilter=None, multi=False):
-        state = {}
-        state[key] = {}
-        statdict = {}
-        for redis_uve in self._redis_uve_list:
-            redish = redis.StrictRedis(host=redis_uve[0],
-                                       port=redis_uve[1],
-                                       password=self._redis_password, db=1)
-            try:
-                qmap = {}
-                for origs in redish.smembers("ORIGINS:" + key):
-                    info = origs.rsplit(":", 1)
-                    sm = info[0].split(":", 1)
-                    source = sm[0]
-                    if sfilter is not None:
-                        if sfilter != source:
-                            continue
-                    mdule = sm[1]
-                    if mfilter is not None:
-                        if mfilter != mdule:
-                            continue
-                    dsource = source + ":" + mdule
+    def _get_redis_uve(self, redis_uve):
+        redish = self._redis_uve_map.get(redis_uve)
+        if redish is None:
+            # UVE reads share the connection pool of the redis-uve, so
+            # that they don't pay a connect (and AUTH) per request
+            redish = redis_pools.get(redis_uve[0], redis_uve[1], 1,
+                                     self._redis_password)
+            self._redis_uve_map[redis_uve] = redish
+        return redish
+    # end _get_redis_uve
+
+    def _execute_pipeline(self, pipe, stats):
+        stats['roundtrips'] += 1
+        return pipe.execute()
+    # end _execute_pipeline
+
+    def _update_read_stats(self, op, stats):
+        self._uve_read_stats['requests'] += 1
+        self._uve_read_stats['roundtrips'] += stats['roundtrips']
+        self._logger.debug("%s: %d redis round trips" % \
+                           (op, stats['roundtrips']))
+    # end _update_read_stats
+
+    def _read_uves(self, redish, keys, states, statdicts, flat,
+                   sfilter, mfilter, tfilter, multi, stats):
+        '''
+        Read the raw state of the given UVE keys from one redis-uve
+        using batched pipelines:
+          1. ORIGINS (and PTYPES) sets of all the keys
+          2. VALUES (and PREVIOUS) hashes of all the selected origins
+          3. stats hrefs referenced from the VALUES hashes
+        '''
+        read_previous = sfilter is None and mfilter is None
+        pipe = redish.pipeline(transaction=False)
+        for key in keys:
+            pipe.smembers("ORIGINS:" + key)
+            if read_previous:
+                pipe.smembers("PTYPES:" + key)
+        members = iter(self._execute_pipeline(pipe, stats))
+
+        pipe = redish.pipeline(transaction=False)
+        hreqs = []
+        for key in keys:
+            origins = next(members)
+            ptypes = next(members) if read_previous else []
+            for origs in origins:
+                info = origs.rsplit(":", 1)
+                sm = info[0].split(":", 1)
+                source = sm[0]
+                if sfilter is not None:
+                    if sfilter != source:
+                        continue
+                mdule = sm[1]
+                if mfilter is not None:
+                    if mfilter != mdule:
+                        continue
+                dsource = source + ":" + mdule
+
+                typ = info[1]
+                if tfilter is not None:
+                    if typ not in tfilter:
+                        continue
+                pipe.hgetall("VALUES:" + key + ":" + origs)
+                hreqs.append((key, "VALUES", typ, (source, mdule, dsource)))
+            for ptyp in ptypes:
+                afilter = None
+                if tfilter is not None:
+                    if ptyp not in tfilter:
+                        continue
+                    afilter = tfilter[ptyp]
+                pipe.hgetall("PREVIOUS:" + key + ":" + ptyp)
+                hreqs.append((key, "PREVIOUS", ptyp, afilter))
+        if not hreqs:
+            return {}
+        hvals = self._execute_pipeline(pipe, stats)
+
+        qmaps = {}
+        stats_pipe = redish.pipeline(transaction=False)
+        stats_reqs = []
+        stats_queued = 0
+        for (key, htype, typ, hinfo), odict in zip(hreqs, hvals):
+            state = states[key]
+            if htype == "PREVIOUS":
+                UVEServer.convert_previous(odict, state, key, typ, hinfo)
+                continue
+            source, mdule, dsource = hinfo
+            statdict = statdicts[key]
+
+            afilter_list = set()
+            if tfilter is not None:
+                afilter_list = tfilter[typ]
+            for attr, value in odict.iteritems():
+                if len(afilter_list):
+                    if attr not in afilter_list:
+                        continue
+
+                if typ not in state[key]:
+                    state[key][typ] = {}
 
-                    typ = info[1]
-                    if tfilter is not None:
-                        if typ not in tfilter:
+                if value[0] == '<':
+                    snhdict = OpServerUtils.uve_attr_decode(value)
+                    if snhdict[attr]['@type'] == 'list':
+                        if snhdict[attr]['list']['@size'] == '0':
                             continue
-
-                    odict = redish.hgetall("VALUES:" + key + ":" + origs)
-
-                    afilter_list = set()
-                    if tfilter is not None:
-                        afilter_list = tfilter[typ]
-                    for attr, value in odict.iteritems():
-                        if len(afilter_list):
-                            if attr not in afilter_list:
-                                continue
-
-                        if typ not in state[key]:
-                            state[key][typ] = {}
-
-                        if value[0] == '<':
-                            snhdict = xmltodict.parse(value)
-                            if snhdict[attr]['@type'] == 'list':
-                                if snhdict[attr]['list']['@size'] == '0':
-                                    continue
-                                elif snhdict[attr]['list']['@size'] == '1':
-                                    sname = ParallelAggregator.get_list_name(
-                                        snhdict[attr])
-                                    if not isinstance(
-                                        snhdict[attr]['list'][sname], list):
-                                        snhdict[attr]['list'][sname] = [
-                                            snhdict[attr]['list'][sname]]
-                        else:
-                            if not flat:
-                                continue
-                            if typ not in statdict:
-                                statdict[typ] = {}
-                            statdict[typ][attr] = []
-                            statsattr = json.loads(value)
-                            for elem in statsattr:
-                                #import pdb; pdb.set_trace()
-                                edict = {}
-                                if elem["rtype"] == "list":
-                                    elist = redish.lrange(elem["href"], 0, -1)
-                                    for eelem in elist:
-                                        jj = json.loads(eelem).items()
-                                        edict[jj[0][0]] = jj[0][1]
-                                elif elem["rtype"] == "zset":
-                                    elist = redish.zrange(
-                                        elem["href"], 0, -1, withscores=True)
-                                    for eelem in elist:
-                                        tdict = json.loads(eelem[0])
-                                        tval = long(tdict["ts"])
-                                        dt = datetime.datetime.utcfromtimestamp(
-                                            float(tval) / 1000000)
-                                        tms = (tval % 1000000) / 1000
-                                        tstr = dt.strftime('%Y %b %d %H:%M:%S')
-                                        edict[tstr + "." + str(tms)] = eelem[1]
-                                elif elem["rtype"] == "hash":
-                                    elist = redish.hgetall(elem["href"])
-                                    edict = elist
-                                elif elem["rtype"] == "query":
-                                    if sfilter is None and mfilter is None and not multi:
-                                        qdict = {}
-                                        qdict["table"] = elem["aggtype"]
-                                        qdict["select_fields"] = elem["select"]
-                                        qdict["where"] =[[{"name":"name",
-                                            "value":key.split(":",1)[1],
-                                            "op":1}]]
-                                        qmap[elem["aggtype"]] = {"query":qdict,
-                                            "type":typ, "attr":attr}
-                                    # For the stats query case, defer processing
-                                    continue
-
-                                statdict[typ][attr].append(
-                                    {elem["aggtype"]: edict})
+                else:
+                    if not flat:
+                        continue
+                    if typ not in statdict:
+                        statdict[typ] = {}
+                    statdict[typ][attr] = []
+                    statsattr = json.loads(value)
+                    for elem in statsattr:
+                        queued = True
+                        if elem["rtype"] == "list":
+                            stats_pipe.lrange(elem["href"], 0, -1)
+                        elif elem["rtype"] == "zset":
+                            stats_pipe.zrange(
+                                elem["href"], 0, -1, withscores=True)
+                        elif elem["rtype"] == "hash":
+                            stats_pipe.hgetall(elem["href"])
+                        elif elem["rtype"] == "query":
+                            if sfilter is None and mfilter is None and \
+                                    not multi:
+                                qdict = {}
+                                qdict["table"] = elem["aggtype"]
+                                qdict["select_fields"] = elem["select"]
+                                qdict["where"] =[[{"name":"name",
+                                    "value":key.split(":",1)[1],
+                                    "op":1}]]
+                                qmaps.setdefault(key, {})[elem["aggtype"]] = \
+                                    {"query":qdict, "type":typ, "attr":attr}
+                            # For the stats query case, defer processing
                             continue
+                        else:
+                            queued = False
+                        if queued:
+                            stats_queued += 1
+                        stats_reqs.append((statdict[typ][attr], elem, queued))
+                    continue
 
-                        # print "Attr %s Value %s" % (attr, snhdict)
-                        if attr not in state[key][typ]:
-                            state[key][typ][attr] = {}
-                        if dsource in state[key][typ][attr]:
-                            print "Found Dup %s:%s:%s:%s:%s = %s" % \
-                                (key, typ, attr, source, mdule, state[
-                                key][typ][attr][dsource])
-                        state[key][typ][attr][dsource] = snhdict[attr]
-                
-                if len(qmap):
-                    url = OpServerUtils.opserver_query_url(
-                        self._local_redis_uve[0],
-                        str(8081))
-                    for t,q in qmap.iteritems():
-                        try:
-                            q["query"]["end_time"] = OpServerUtils.utc_timestamp_usec()
-                            q["query"]["start_time"] = qdict["end_time"] - (3600 * 1000000)
-                            json_str = json.dumps(q["query"])
-                            resp = OpServerUtils.post_url_http(url, json_str, True)
-                            if resp is not None:
-                                edict = json.loads(resp)
-                                edict = edict['value']
-                                statdict[q["type"]][q["attr"]].append(
-                                    {t: edict})
-                        except Exception as e:
-                            print "Stats Query Exception:" + str(e)
-                        
-                if sfilter is None and mfilter is None:
-                    for ptyp in redish.smembers("PTYPES:" + key):
-                        afilter = None
-                        if tfilter is not None:
-                            if ptyp not in tfilter:
-                                continue
-                            afilter = tfilter[ptyp]
-                        existing = redish.hgetall("PREVIOUS:" + key + ":" + ptyp)
-                        nstate = UVEServer.convert_previous(
-                            existing, state, key, ptyp, afilter)
-                        state = copy.deepcopy(nstate)
-
-                pa = ParallelAggregator(state)
-                rsp = pa.aggregate(key, flat)
+                # print "Attr %s Value %s" % (attr, snhdict)
+                if attr not in state[key][typ]:
+                    state[key][typ][attr] = {}
+                if dsource in state[key][typ][attr]:
+                    print "Found Dup %s:%s:%s:%s:%s = %s" % \
+                        (key, typ, attr, source, mdule, state[
+                        key][typ][attr][dsource])
+                state[key][typ][attr][dsource] = snhdict[attr]
+
+        if stats_reqs:
+            elists = iter([])
+            if stats_queued:
+                elists = iter(self._execute_pipeline(stats_pipe, stats))
+            for slist, elem, queued in stats_reqs:
+                edict = {}
+                if not queued:
+                    slist.append({elem["aggtype"]: edict})
+                    continue
+                elist = next(elists)
+                if elem["rtype"] == "list":
+                    for eelem in elist:
+                        jj = json.loads(eelem).items()
+                        edict[jj[0][0]] = jj[0][1]
+                elif elem["rtype"] == "zset":
+                    for eelem in elist:
+                        tdict = json.loads(eelem[0])
+                        tval = long(tdict["ts"])
+                        dt = datetime.datetime.utcfromtimestamp(
+                            float(tval) / 1000000)
+                        tms = (tval % 1000000) / 1000
+                        tstr = dt.strftime('%Y %b %d %H:%M:%S')
+                        edict[tstr + "." + str(tms)] = eelem[1]
+                elif elem["rtype"] == "hash":
+                    edict = elist
+                slist.append({elem["aggtype"]: edict})
+        return qmaps
+    # end _read_uves
+
+    def _query_uve_stats(self, qmap, statdict):
+        url = OpServerUtils.opserver_query_url(
+            self._local_redis_uve[0],
+            str(8081))
+        for t,q in qmap.iteritems():
+            try:
+                q["query"]["end_time"] = OpServerUtils.utc_timestamp_usec()
+                q["query"]["start_time"] = \
+                    q["query"]["end_time"] - (3600 * 1000000)
+                json_str = json.dumps(q["query"])
+                resp = OpServerUtils.post_url_http(url, json_str, True)
+                if resp is not None:
+                    edict = json.loads(resp)
+                    edict = edict['value']
+                    statdict[q["type"]][q["attr"]].append(
+                        {t: edict})
+            except Exception as e:
+                print "Stats Query Exception:" + str(e)
+    # end _query_uve_stats
+
+    def _fanout(self, op, fn, *args):
+        '''
+        Run fn(redis_uve, redish, *args) concurrently against every
+        redis-uve, waiting at most _redis_uve_timeout seconds for all of them.
+        Returns the results of the redis-uves that answered, in the order
+        of the redis-uve list, and a dict with the status of each
+        redis-uve ("ip:port" -> "ok", "timeout", "down" or "error")
+        '''
+        def _read(redis_uve):
+            try:
+                return 'ok', fn(redis_uve, self._get_redis_uve(redis_uve),
+                                *args)
             except redis.exceptions.ConnectionError:
                 self._logger.error("Failed to connect to redis-uve: %s:%d" \
                                    % (redis_uve[0], redis_uve[1]))
+                return 'down', None
             except Exception as e:
-                self._logger.error("Exception: %s" % e)
-                return {}
-            else:
-                self._logger.debug("Computed %s" % key)
-
-        for k, v in statdict.iteritems():
-            if k in rsp:
-                mp = dict(v.items() + rsp[k].items())
-                statdict[k] = mp
+                self._logger.error("%s: Exception from redis-uve %s:%d: %s" \
+                                   % (op, redis_uve[0], redis_uve[1], e))
+                return 'error', None
+
+        redis_uve_list = list(self._redis_uve_list)
+        if not redis_uve_list:
+            return [], {}
+        pool = Pool(len(redis_uve_list))
+        greenlets = [pool.spawn(_read, redis_uve)
+                     for redis_uve in redis_uve_list]
+        pool.join(timeout=self._redis_uve_timeout)
+        results = []
+        status = {}
+        for redis_uve, greenlet in zip(redis_uve_list, greenlets):
+            name = '%s:%d' % (redis_uve[0], redis_uve[1])
+            if not greenlet.ready():
+                greenlet.kill(block=False)
+                status[name] = 'timeout'
+                self._logger.error("%s: Timed out waiting for redis-uve: %s" \
+                                   % (op, name))
+                continue
+            status[name], result = greenlet.value
+            if status[name] == 'ok':
+                results.append(result)
+        return results, status
+    # end _fanout
 
-        return dict(rsp.items() + statdict.items())
+    @staticmethod
+    def _freeze_tfilter(tfilter):
+        if tfilter is None:
+            return None
+        return tuple(sorted((typ, tuple(sorted(attrs))) \
+                            for typ, attrs in tfilter.iteritems()))
+    # end _freeze_tfilter
+
+    def _read_redis_uve(self, redis_uve, redish, keys, flat, sfilter,
+                        mfilter, tfilter, multi, stats):
+        states = {}
+        statdicts = {}
+        for key in keys:
+            states[key] = {key: {}}
+            statdicts[key] = {}
+        qmaps = self._read_uves(redish, keys, states, statdicts, flat,
+                                sfilter, mfilter, tfilter, multi, stats)
+        for key, qmap in qmaps.iteritems():
+            self._query_uve_stats(qmap, statdicts[key])
+        return states, statdicts
+    # end _read_redis_uve
+
+    def get_uves(self, keys, flat, sfilter=None, mfilter=None, tfilter=None,
+                 multi=False, collectors=None):
+        '''
+        Batched version of get_uve: returns a dict of the aggregated
+        state of each of the given UVE keys, read from every redis-uve
+        with a fixed number of pipelined round trips.
+        The redis-uves are read concurrently, and the UVEs are aggregated
+        from the ones that answered in time. If collectors is a dict, it
+        is filled with the status of each redis-uve.
+        UVEs found in the UVE cache are returned without reading redis,
+        with the status of the redis-uves they were read from
+        '''
+        uves = {}
+        use_cache = self._uve_cache_usable()
+        if use_cache:
+            filters = (flat, sfilter, mfilter, multi,
+                       UVEServer._freeze_tfilter(tfilter))
+            missing = []
+            for key in keys:
+                entry = self._uve_cache.get(key, filters)
+                if entry is None:
+                    missing.append(key)
+                    continue
+                uve, status = entry
+                # the cached UVE is shared with later reads
+                uves[key] = copy.deepcopy(uve)
+                if collectors is not None:
+                    collectors.update(status)
+            if not missing:
+                return uves
+            keys = missing
+            self._uve_cache.begin_read(keys)
+
+        states = {}
+        statdicts = {}
+        for key in keys:
+            states[key] = {key: {}}
+            statdicts[key] = {}
+        stats = {'roundtrips': 0}
+        try:
+            results, status = self._fanout('get_uves', self._read_redis_uve,
+                                           keys, flat, sfilter, mfilter,
+                                           tfilter, multi, stats)
+        finally:
+            if use_cache:
+                dirty = self._uve_cache.end_read(keys)
+        if collectors is not None:
+            collectors.update(status)
+        for rstates, rstatdicts in results:
+            for key in keys:
+                for typ, attrs in rstates[key][key].iteritems():
+                    for attr, sources in attrs.iteritems():
+                        states[key][key].setdefault(typ, {}).setdefault(
+                            attr, {}).update(sources)
+                for typ, attrs in rstatdicts[key].iteritems():
+                    statdicts[key].setdefault(typ, {}).update(attrs)
+        self._update_read_stats('get_uves %d keys' % len(keys), stats)
+
+        # Partial UVEs are not cached
+        if use_cache and set(status.values()) != set(['ok']):
+            use_cache = False
+        for key in keys:
+            pa = ParallelAggregator(states[key])
+            rsp = pa.aggregate(key, flat)
+            statdict = statdicts[key]
+            # UVEs with stats attributes are not cached, as the stats
+            # can change without the UVE being updated
+            if use_cache and not statdict and key not in dirty:
+                self._uve_cache.put(key, filters, copy.deepcopy(rsp), status)
+            for k, v in statdict.iteritems():
+                if k in rsp:
+                    mp = dict(v.items() + rsp[k].items())
+                    statdict[k] = mp
+            uves[key] = dict(rsp.items() + statdict.items())
+            self._logger.debug("Computed %s" % key)
+        return uves
+    # end get_uves
+
+    def get_uve(self, key, flat, sfilter=None, mfilter=None, tfilter=None,
+                multi=False, collectors=None):
+        return self.get_uves([key], flat, sfilter, mfilter, tfilter,
+                             multi, collectors).get(key, {})
     # end get_uve
 
-    def get_uve_regex(self, key):
+    @staticmethod
+    def get_uve_regex(key):
         regex = ''
         if key[0] != '*':
             regex += '^'
@@ -384,6 +706,7 @@ class UVEServer(object):
             patterns = set()
             for filt in kfilter:
                 patterns.add(self.get_uve_regex(filt))
+        uve_names = []
         for uve_name in uve_list:
             if kfilter is not None:
                 kfilter_match = False
@@ -393,95 +716,309 @@ class UVEServer(object):
                         break
                 if not kfilter_match:
                     continue
-            uve_val = self.get_uve(
-                table + ':' + uve_name, flat,
-                sfilter, mfilter, tfilter, True)
-            if uve_val == {}:
-                continue
-            else:
-                uve = {'name': uve_name, 'value': uve_val}
-                yield uve
+            uve_names.append(uve_name)
+        # Read the UVEs a page at a time, so that each page costs a
+        # fixed number of redis round trips
+        for idx in range(0, len(uve_names), self._UVE_PAGE_SIZE):
+            page = uve_names[idx:idx + self._UVE_PAGE_SIZE]
+            uves = self.get_uves([table + ':' + uve_name for uve_name in page],
+                                 flat, sfilter, mfilter, tfilter, True)
+            for uve_name in page:
+                uve_val = uves.get(table + ':' + uve_name, {})
+                if uve_val == {}:
+                    continue
+                else:
+                    uve = {'name': uve_name, 'value': uve_val}
+                    yield uve
     # end multi_uve_get
 
-    def get_uve_list(self, key, kfilter, sfilter,
-                     mfilter, tfilter, parse_afilter):
+    def _read_redis_uve_list(self, redis_uve, redish, key, kfilter, patterns,
+                             sfilter, mfilter, tfilter, parse_afilter, stats):
         uve_list = set()
+        if redis_uve in self._uve_synced:
+            # The index has the TABLE entries matching kfilter
+            entries = self._uve_indexes[redis_uve].entries(key, kfilter)
+            patterns = None
+        else:
+            pipe = redish.pipeline(transaction=False)
+            pipe.smembers("TABLE:" + key)
+            entries = [(entry.split(':', 1)[1]).rsplit(':', 5) for entry in \
+                       self._execute_pipeline(pipe, stats)[0]]
+        pipe = redish.pipeline(transaction=False)
+        afilter_keys = []
+        for info in entries:
+            uve_key = info[0]
+            if patterns is not None:
+                kfilter_match = False
+                for pattern in patterns:
+                    if pattern.match(uve_key):
+                        kfilter_match = True
+                        break
+                if not kfilter_match:
+                    continue
+            src = info[1]
+            if sfilter is not None:
+                if sfilter != src:
+                    continue
+            node_type = info[2]
+            mdule = info[3]
+            if mfilter is not None:
+                if mfilter != mdule:
+                    continue
+            inst = info[4] 
+            typ = info[5]
+            if tfilter is not None:
+                if typ not in tfilter:
+                    continue
+            if parse_afilter:
+                if tfilter is not None and len(tfilter[typ]):
+                    valkey = "VALUES:" + key + ":" + uve_key + ":" + \
+                         src + ":" + node_type + ":" + mdule + \
+                         ":" + inst + ":" + typ
+                    pipe.hmget(valkey, list(tfilter[typ]))
+                    afilter_keys.append(uve_key)
+                    continue
+            uve_list.add(uve_key)
+        if afilter_keys:
+            attrvals = self._execute_pipeline(pipe, stats)
+            for uve_key, attrval in zip(afilter_keys, attrvals):
+                if any(val is not None for val in attrval):
+                    uve_list.add(uve_key)
+        return uve_list
+    # end _read_redis_uve_list
+
+    def get_uve_list(self, key, kfilter, sfilter,
+                     mfilter, tfilter, parse_afilter, collectors=None):
+        patterns = None
         if kfilter is not None:
             patterns = set()
             for filt in kfilter:
                 patterns.add(self.get_uve_regex(filt))
-        for redis_uve in self._redis_uve_list:
-            redish = redis.StrictRedis(host=redis_uve[0],
-                                       port=redis_uve[1],
-                                       password=self._redis_password, db=1)
-            try:
-                for entry in redish.smembers("TABLE:" + key):
-                    info = (entry.split(':', 1)[1]).rsplit(':', 5)
-                    uve_key = info[0]
-                    if kfilter is not None:
-                        kfilter_match = False
-                        for pattern in patterns:
-                            if pattern.match(uve_key):
-                                kfilter_match = True
-                                break
-                        if not kfilter_match:
-                            continue
-                    src = info[1]
-                    if sfilter is not None:
-                        if sfilter != src:
-                            continue
-                    node_type = info[2]
-                    mdule = info[3]
-                    if mfilter is not None:
-                        if mfilter != mdule:
-                            continue
-                    inst = info[4] 
-                    typ = info[5]
-                    if tfilter is not None:
-                        if typ not in tfilter:
-                            continue
-                    if parse_afilter:
-                        if tfilter is not None and len(tfilter[typ]):
-                            valkey = "VALUES:" + key + ":" + uve_key + ":" + \
-                                 src + ":" + node_type + ":" + mdule + \
-                                 ":" + inst + ":" + typ
-                            for afilter in tfilter[typ]:
-                                attrval = redish.hget(valkey, afilter)
-                                if attrval is not None:
-                                    break
-                            if attrval is None:
-                                continue
-                    uve_list.add(uve_key)
-            except redis.exceptions.ConnectionError:
-                self._logger.error('Failed to connect to redis-uve: %s:%d' \
-                                   % (redis_uve[0], redis_uve[1]))
-            except Exception as e:
-                self._logger.error('Exception: %s' % e)
-                return set()
+        stats = {'roundtrips': 0}
+        results, status = self._fanout('get_uve_list',
+                                       self._read_redis_uve_list, key,
+                                       kfilter, patterns, sfilter, mfilter,
+                                       tfilter, parse_afilter, stats)
+        if collectors is not None:
+            collectors.update(status)
+        uve_list = set()
+        for result in results:
+            uve_list.update(result)
+        self._update_read_stats('get_uve_list ' + key, stats)
         return uve_list
     # end get_uve_list
 
 # end UVEServer
 
 
+class UVEIndex(object):
+    '''
+    Index of the UVEs of a redis-uve, as found in its TABLE sets:
+    table -> UVE name -> set of (source, node-type, module, instance-id,
+    type) of the UVE.
+    '''
+
+    def __init__(self):
+        self._tables = {}
+        # table -> sorted UVE names, for the prefix lookups
+        self._names = {}
+    # end __init__
+
+    @staticmethod
+    def _origin(fields):
+        # The origins are made of few distinct strings
+        return tuple(intern(field) for field in fields)
+    # end _origin
+
+    def add(self, entry):
+        # TABLE entry: <table>:<name>:<source>:<node-type>:<module>:
+        #   <instance-id>:<type>
+        table, uve = entry.split(':', 1)
+        info = uve.rsplit(':', 5)
+        name = info[0]
+        uves = self._tables.setdefault(table, {})
+        if name not in uves:
+            uves[name] = set()
+            self._names.pop(table, None)
+        uves[name].add(UVEIndex._origin(info[1:]))
+    # end add
+
+    def update(self, key, origins):
+        '''
+        Set the origins of a UVE key (<table>:<name>), from its ORIGINS set
+        '''
+        table, name = key.split(':', 1)
+        uves = self._tables.setdefault(table, {})
+        if origins:
+            if name not in uves:
+                self._names.pop(table, None)
+            uves[name] = set(UVEIndex._origin(origin.rsplit(':', 4))
+                             for origin in origins)
+        elif name in uves:
+            del uves[name]
+            self._names.pop(table, None)
+    # end update
+
+    def _lookup(self, table, kfilter):
+        uves = self._tables.get(table, {})
+        if kfilter is None:
+            return uves.keys()
+        names = set()
+        for filt in kfilter:
+            wildcard = filt.find('*')
+            if wildcard == -1:
+                if filt in uves:
+                    names.add(filt)
+            elif wildcard == len(filt) - 1:
+                prefix = filt[:-1]
+                if table not in self._names:
+                    self._names[table] = sorted(uves.keys())
+                sorted_names = self._names[table]
+                idx = bisect.bisect_left(sorted_names, prefix)
+                while idx < len(sorted_names) and \
+                        sorted_names[idx].startswith(prefix):
+                    names.add(sorted_names[idx])
+                    idx += 1
+            else:
+                pattern = UVEServer.get_uve_regex(filt)
+                names.update(name for name in uves if pattern.match(name))
+        return names
+    # end _lookup
+
+    def entries(self, table, kfilter):
+        '''
+        Returns the (name, source, node-type, module, instance-id, type)
+        of the UVEs of the table matching the kfilter glob patterns
+        '''
+        uves = self._tables.get(table, {})
+        return [(name,) + origin for name in self._lookup(table, kfilter) \
+                for origin in uves[name]]
+    # end entries
+
+# end UVEIndex
+
+
+class UVECache(object):
+    '''
+    LRU cache of aggregated UVEs, bounded by the approximate (JSON) size
+    of the cached UVEs. Entries are keyed by UVE key and read filters,
+    and all the entries of a UVE key are dropped when it is invalidated.
+    '''
+
+    def __init__(self, max_size):
+        self._max_size = max_size
+        self._size = 0
+        # (uve key, filters) -> (uve, size, redis-uve status), in LRU order
+        self._entries = OrderedDict()
+        # uve key -> set of (uve key, filters) in _entries
+        self._uve_entries = {}
+        # uve key -> number of reads in progress
+        self._reads = {}
+        # uve keys invalidated while being read
+        self._dirty = set()
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+    # end __init__
+
+    def size(self):
+        return self._size
+    # end size
+
+    def get(self, key, filters):
+        entry = self._entries.pop((key, filters), None)
+        if entry is None:
+            self.stats['misses'] += 1
+            return None
+        self._entries[(key, filters)] = entry
+        self.stats['hits'] += 1
+        return entry[0], entry[2]
+    # end get
+
+    def begin_read(self, keys):
+        for key in keys:
+            self._reads[key] = self._reads.get(key, 0) + 1
+    # end begin_read
+
+    def end_read(self, keys):
+        '''
+        Returns the keys that were invalidated since begin_read, whose
+        UVEs must not be cached
+        '''
+        dirty = set()
+        for key in keys:
+            if key in self._dirty:
+                dirty.add(key)
+            self._reads[key] -= 1
+            if not self._reads[key]:
+                del self._reads[key]
+                self._dirty.discard(key)
+        return dirty
+    # end end_read
+
+    def put(self, key, filters, uve, status):
+        self._remove((key, filters))
+        size = len(json.dumps(uve))
+        if size > self._max_size:
+            return
+        while self._size + size > self._max_size:
+            self._remove(next(iter(self._entries)))
+            self.stats['evictions'] += 1
+        self._entries[(key, filters)] = (uve, size, status)
+        self._uve_entries.setdefault(key, set()).add((key, filters))
+        self._size += size
+    # end put
+
+    def _remove(self, ekey):
+        entry = self._entries.pop(ekey, None)
+        if entry is None:
+            return
+        self._size -= entry[1]
+        ekeys = self._uve_entries[ekey[0]]
+        ekeys.discard(ekey)
+        if not ekeys:
+            del self._uve_entries[ekey[0]]
+    # end _remove
+
+    def invalidate(self, key):
+        if key in self._reads:
+            self._dirty.add(key)
+        for ekey in list(self._uve_entries.get(key, [])):
+            self._remove(ekey)
+    # end invalidate
+
+    def clear(self):
+        self._dirty.update(self._reads.keys())
+        self._entries.clear()
+        self._uve_entries.clear()
+        self._size = 0
+    # end clear
+
+# end UVECache
+
+
 class ParallelAggregator:
 
     def __init__(self, state):
         self._state = state
 
+    @staticmethod
+    def _elem_hash(elem):
+        # Hashable value identifying an attribute value or a list element
+        if isinstance(elem, basestring):
+            return elem
+        return ('json', json.dumps(elem, sort_keys=True))
+
     def _default_agg(self, oattr):
-        itemset = set()
         result = []
+        # element hash -> [element, sources...] in result
+        elems = {}
         for source in oattr.keys():
             elem = oattr[source]
-            hdelem = json.dumps(elem)
-            if hdelem not in itemset:
-                itemset.add(hdelem)
-                result.append([elem, source])
+            hdelem = ParallelAggregator._elem_hash(elem)
+            if hdelem not in elems:
+                elems[hdelem] = [elem, source]
+                result.append(elems[hdelem])
             else:
-                for items in result:
-                    if elem in items:
-                        items.append(source)
+                elems[hdelem].append(source)
         return result
 
     def _is_sum(self, oattr):
@@ -535,9 +1072,17 @@ class ParallelAggregator:
                     skey = sattr
         return skey
 
+    @staticmethod
+    def _copy_list_attr(attr, sname):
+        # Copy of a list attribute, without the list elements
+        result = dict(attr)
+        result['list'] = dict(attr['list'])
+        result['list'][sname] = []
+        return result
+
     def _sum_agg(self, oattr):
         akey = oattr.keys()[0]
-        result = copy.deepcopy(oattr[akey])
+        result = dict(oattr[akey])
         count = 0
         for source in oattr.keys():
             count += int(oattr[source]['#text'])
@@ -546,17 +1091,16 @@ class ParallelAggregator:
 
     def _union_agg(self, oattr):
         akey = oattr.keys()[0]
-        result = copy.deepcopy(oattr[akey])
         itemset = set()
         sname = ParallelAggregator.get_list_name(oattr[akey])
-        result['list'][sname] = []
+        result = ParallelAggregator._copy_list_attr(oattr[akey], sname)
 
         siz = 0
         for source in oattr.keys():
             if isinstance(oattr[source]['list'][sname], basestring):
                 oattr[source]['list'][sname] = [oattr[source]['list'][sname]]
             for elem in oattr[source]['list'][sname]:
-                hdelem = json.dumps(elem)
+                hdelem = ParallelAggregator._elem_hash(elem)
                 if hdelem not in itemset:
                     itemset.add(hdelem)
                     result['list'][sname].append(elem)
@@ -567,9 +1111,8 @@ class ParallelAggregator:
 
     def _append_agg(self, oattr):
         akey = oattr.keys()[0]
-        result = copy.deepcopy(oattr[akey])
         sname = ParallelAggregator.get_list_name(oattr[akey])
-        result['list'][sname] = []
+        result = ParallelAggregator._copy_list_attr(oattr[akey], sname)
         siz = 0
         for source in oattr.keys():
             if not isinstance(oattr[source]['list'][sname], list):
@@ -599,36 +1142,36 @@ class ParallelAggregator:
 
         # There is no listkey ; no consolidation is possible
         if len(appkey) == 0:
-            return result
+            return result[typ][objattr]
 
         # If the list's underlying struct has a listkey present,
         # we need to further aggregate entries that have the
         # same listkey
-        mod_result = copy.deepcopy(result[typ][objattr])
-        mod_result['list'][applist] = []
-        res_size = 0
-        mod_result['list']['@size'] = int(res_size)
+        mod_result = ParallelAggregator._copy_list_attr(
+            result[typ][objattr], applist)
+        # listkey -> (consolidated element, its counters)
+        consolidated = {}
 
         # Add up stats
         for items in result[typ][objattr]['list'][applist]:
-            matched = False
-            for res_items in mod_result['list'][applist]:
-                if items[appkey]['#text'] in [res_items[appkey]['#text']]:
-                    for ctrs in ParallelAggregator._list_agg_attrs(items):
-                        res_items[ctrs]['#text'] += int(items[ctrs]['#text'])
-                    matched = True
-            if not matched:
-                newitem = copy.deepcopy(items)
-                for ctrs in ParallelAggregator._list_agg_attrs(items):
-                    newitem[ctrs]['#text'] = int(items[ctrs]['#text'])
+            lkey = items[appkey]['#text']
+            if lkey not in consolidated:
+                newitem = dict(items)
                 mod_result['list'][applist].append(newitem)
-                res_size += 1
+                consolidated[lkey] = (newitem, {})
+            res_items, counters = consolidated[lkey]
+            for ctrs in ParallelAggregator._list_agg_attrs(items):
+                if ctrs in counters:
+                    counters[ctrs] += int(items[ctrs]['#text'])
+                else:
+                    res_items[ctrs] = dict(items[ctrs])
+                    counters[ctrs] = int(items[ctrs]['#text'])
 
         # Convert results back into strings
-        for res_items in mod_result['list'][applist]:
-            for ctrs in ParallelAggregator._list_agg_attrs(res_items):
-                res_items[ctrs]['#text'] = str(res_items[ctrs]['#text'])
-        mod_result['list']['@size'] = str(res_size)
+        for res_items, counters in consolidated.itervalues():
+            for ctrs, count in counters.iteritems():
+                res_items[ctrs]['#text'] = str(count)
+        mod_result['list']['@size'] = str(len(consolidated))
         return mod_result
 
     def aggregate(self, key, flat):